@@ -19,6 +19,10 @@ import yaml
 import re
 
 
+# Unquoted Snowflake identifier - used to reject catalog picks that would need quoting/escaping
+_IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*$')
+
+
 class ValidationResult:
     """Structured validation result with errors, warnings, and suggestions"""
     
@@ -138,6 +142,10 @@ class FlowValidator:
         
         return result
     
+    def validate_dict(self, nodes: List[Dict], edges: List[Dict], prompt: Optional[str] = None) -> Dict:
+        """Run all validations and return the API-ready dict form of the result"""
+        return self.validate(nodes, edges, prompt).to_dict()
+    
     def _validate_snowflake_connection(self, result: ValidationResult):
         """Check Snowflake is reachable"""
         try:
@@ -263,10 +271,20 @@ class FlowValidator:
             
             full_name = f"{db}.{schema}.{obj_name}"
             
+            if not all(_IDENTIFIER_RE.match(str(part)) for part in (db, schema, obj_name)):
+                result.add_error(
+                    code="INVALID_DATA_SOURCE_NAME",
+                    message=f"Data source name '{full_name}' contains unsupported characters",
+                    suggestion="Select the data source from the Snowflake catalog instead of typing the name.",
+                    node_id=node_id,
+                    details={"database": db, "schema": schema, "object": obj_name}
+                )
+                continue
+            
             # Try to access the table
             try:
-                # Simple existence check
-                check_result = self.sf.execute_sql(f"SELECT 1 FROM {full_name} LIMIT 1")
+                # Simple existence check - bound identifier keeps the SQL text constant across tables
+                check_result = self.sf.execute_sql("SELECT 1 FROM IDENTIFIER(%s) LIMIT 1", params=(full_name,))
                 
                 if not check_result or check_result.get('error'):
                     error_msg = check_result.get('error', 'Unknown error') if check_result else 'No response'
@@ -296,7 +314,7 @@ class FlowValidator:
                         )
                 else:
                     # Table accessible - check if empty
-                    count_result = self.sf.execute_sql(f"SELECT COUNT(*) as cnt FROM {full_name}")
+                    count_result = self.sf.execute_sql("SELECT COUNT(*) as cnt FROM IDENTIFIER(%s)", params=(full_name,))
                     if count_result and count_result.get('data'):
                         row_count = count_result['data'][0].get('CNT', 0)
                         if row_count == 0:
@@ -493,6 +511,10 @@ class FlowValidator:
                 )
 
 
+# FlowValidator holds no per-request state, so one instance per client is reused across calls
+_VALIDATORS: Dict[int, FlowValidator] = {}
+
+
 def validate_flow(snowflake_client, nodes: List[Dict], edges: List[Dict], prompt: Optional[str] = None) -> Dict:
     """
     Convenience function for flow validation.
@@ -503,6 +525,7 @@ def validate_flow(snowflake_client, nodes: List[Dict], edges: List[Dict], prompt
     - warnings: list of warnings
     - info: list of informational messages
     """
-    validator = FlowValidator(snowflake_client)
-    result = validator.validate(nodes, edges, prompt)
-    return result.to_dict()
+    validator = _VALIDATORS.get(id(snowflake_client))
+    if validator is None or validator.sf is not snowflake_client:
+        validator = _VALIDATORS[id(snowflake_client)] = FlowValidator(snowflake_client)
+    return validator.validate_dict(nodes, edges, prompt)
@@ -1,23 +1,38 @@
 from langgraph.graph import StateGraph, END
-from typing import TypedDict, List, Dict, Any, Annotated, Literal, Optional, Callable
-from snowflake_client import snowflake_client
+from typing import TypedDict, List, Dict, Any, Annotated, Literal, Optional, Callable, Union
+from snowflake_client import snowflake_client, cortex_batcher
 from mcp_client import create_mcp_client
+from semantic_cache import semantic_cache, schema_signature
 from datetime import datetime
-from functools import wraps
+from functools import lru_cache, wraps
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
+import httpx
+import importlib.util
 import json
+import logging
 import operator
+import os
+import string
+import sys
 import time
+import traceback
+import uuid
+
+logger = logging.getLogger("snowflow.graph")
+
+try:
+    import orjson  # Optional fast path for prompt serialization
+except ImportError:
+    orjson = None
 
 
 def merge_dicts(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
     """Merge two dictionaries, with b taking precedence for conflicts.
-    Used for concurrent writes to 'results' in LangGraph.
+    Used for concurrent writes to 'results' in LangGraph. Nodes return only
+    the keys they add (a delta), so each step copies the results dict once.
     """
-    if a is None:
-        a = {}
-    if b is None:
-        b = {}
-    return {**a, **b}
+    return {**(a or {}), **(b or {})}
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -25,38 +40,102 @@ def merge_dicts(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
 # Using global queue because LangGraph runs parallel nodes in separate threads
 # Thread-local storage doesn't work when LangGraph spawns internal threads
 # ═══════════════════════════════════════════════════════════════════════════════
+import asyncio
 import threading
-import queue
+from bisect import bisect_right
+from collections import defaultdict, deque, OrderedDict
+from types import MappingProxyType
+
+class ExecutionEventQueue:
+    """Bounded event buffer between graph worker threads and the SSE consumer.
+    
+    Producers append without taking a lock (deque.append is atomic in CPython)
+    and ring the consumer's asyncio doorbell via call_soon_threadsafe; the
+    consumer awaits the doorbell without blocking the event loop and drains
+    everything that has been queued as a single batch.
+    
+    Past maxlen only progress events are shed (newest first, logged); node
+    lifecycle and terminal events are always kept, since the UI and the
+    streaming loop depend on them. Those are bounded by the graph size.
+    """
+    
+    _SHEDDABLE = frozenset({'node_progress'})
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxlen: int = 10000):
+        self._events: deque = deque()
+        self._maxlen = maxlen
+        self._dropped = 0
+        self._loop = loop
+        self._doorbell = asyncio.Event()
+    
+    def put_nowait(self, event: Dict[str, Any]):
+        if len(self._events) >= self._maxlen and event.get('type') in self._SHEDDABLE:
+            self._dropped += 1
+            if self._dropped == 1 or self._dropped % 1000 == 0:
+                logger.warning("Execution event buffer full (%d queued) - dropped %d %s events so far",
+                               len(self._events), self._dropped, event.get('type'))
+            return
+        self._events.append(event)
+        # The consumer clears the doorbell before draining, so a set doorbell
+        # already guarantees this event will be picked up - skip the wakeup.
+        if not self._doorbell.is_set():
+            try:
+                self._loop.call_soon_threadsafe(self._doorbell.set)
+            except RuntimeError:
+                pass  # Consumer's loop already closed - nobody left to wake
+    
+    put = put_nowait
+    
+    def wake(self):
+        """Ring the doorbell from the loop thread so a pending drain returns early"""
+        self._doorbell.set()
+    
+    async def drain(self, timeout: float) -> List[Dict[str, Any]]:
+        """Wait up to `timeout` seconds for events, then return all queued events"""
+        if not self._events:
+            # A timer rings the same doorbell at the deadline, so an idle wait ends
+            # without raising/catching TimeoutError or spawning a wait_for task
+            timer = self._loop.call_later(timeout, self._doorbell.set)
+            await self._doorbell.wait()
+            timer.cancel()
+        self._doorbell.clear()
+        # Pop exactly what is queued now; anything appended meanwhile rings the
+        # (cleared) doorbell again and is picked up by the next drain
+        popleft = self._events.popleft
+        return [popleft() for _ in range(len(self._events))]
+
 
 # Global queue - protected by lock for thread safety
-_global_execution_queue = None
+_global_execution_queue: Optional[ExecutionEventQueue] = None
 _queue_lock = threading.Lock()
 
 # Shared results store - holds the latest supervisor response
-_shared_results = {}
+# Copy-on-write: readers load the current read-only snapshot without locking,
+# writers build a new dict under _results_lock and rebind the reference.
+# Preallocated empty snapshot so a reset is a pointer swap, not a new dict
+_EMPTY_RESULTS: MappingProxyType = MappingProxyType({})
+_shared_results_ref: MappingProxyType = _EMPTY_RESULTS
 _results_lock = threading.Lock()
 
 def set_shared_results(results: dict):
     """Store results that can be accessed by the event loop - MERGES with existing"""
-    global _shared_results
+    global _shared_results_ref
     with _results_lock:
         # MERGE with existing results (don't overwrite generated_yaml etc)
         if results:
-            _shared_results.update(results)
-        print(f"[RESULTS] Merged results, now {len(str(_shared_results))} chars")
+            _shared_results_ref = MappingProxyType({**_shared_results_ref, **results})
+        logger.debug("[RESULTS] Merged results, now %d keys", len(_shared_results_ref))
 
 def update_shared_results(key: str, value):
     """Update a specific key in shared results without overwriting"""
-    global _shared_results
+    global _shared_results_ref
     with _results_lock:
-        _shared_results[key] = value
-        print(f"[RESULTS] Updated '{key}' ({len(str(value))} chars)")
+        _shared_results_ref = MappingProxyType({**_shared_results_ref, key: value})
+        logger.debug("[RESULTS] Updated '%s'", key)
 
-def get_shared_results() -> dict:
-    """Get the stored results"""
-    global _shared_results
-    with _results_lock:
-        return _shared_results.copy()
+def get_shared_results() -> MappingProxyType:
+    """Get the stored results (read-only snapshot - no copy, no lock)"""
+    return _shared_results_ref
 
 def set_execution_callback(callback_queue):
     """Set the global callback queue for workflow execution"""
@@ -76,25 +155,64 @@ def get_execution_queue():
 # 
 # This is a completely isolated tracing system that:
 # 1. Wraps ALL node functions automatically
-# 2. Guarantees visual pacing regardless of execution speed
+# 2. Sends a visual pacing hint so the frontend can stagger highlights
 # 3. Prevents duplicate events
 # 4. Works 100% reliably for ANY template
 # ═══════════════════════════════════════════════════════════════════════════════
 
 # Thread-safe tracking of notified nodes per execution
+# Each node id gets a bit the first time it is traced in an execution;
+# _notified_mask is an int bitset of the nodes notified so far. Membership
+# reads are lock-free, inserts rebind a new int under _trace_lock. Both are
+# cleared by reset_trace_state, so ids from earlier flows don't accumulate.
 _trace_lock = threading.Lock()
-_notified_nodes: set = set()
+_node_bits: Dict[str, int] = {}
+_notified_mask: int = 0
+
+def _node_bit(node_id: str) -> int:
+    """Bit assigned to a node id (stable until the next reset_trace_state)"""
+    bit = _node_bits.get(node_id)
+    if bit is None:
+        with _trace_lock:
+            bit = _node_bits.setdefault(node_id, 1 << len(_node_bits))
+    return bit
 
-# Visual pacing: Minimum time between node highlights (ms)
+def get_notified_nodes() -> List[str]:
+    """Node ids notified in the current execution (consistent snapshot taken under _trace_lock)"""
+    with _trace_lock:
+        mask = _notified_mask
+        bits = list(_node_bits.items())
+    return [node_id for node_id, bit in bits if mask & bit]
+
+# Visual pacing: Minimum time the frontend should keep a node highlighted (ms)
+# Sent as a hint on node_executing events - the backend itself never waits.
 TRACE_VISUAL_DELAY_MS = 500  # Half second for clear visual feedback
 
+# Execution-plan pacing inside nodes is a demo/UX delay. SNOWFLOW_UI_SIMULATED_DELAYS=0
+# switches it off (production); explicit mock delays are part of a scenario and always apply.
+UI_SIMULATED_DELAYS = os.getenv("SNOWFLOW_UI_SIMULATED_DELAYS", "1") != "0"
+
+
+def _pace(delay: float):
+    """Sleep for an execution-plan pacing delay unless simulated delays are disabled"""
+    if UI_SIMULATED_DELAYS and delay > 0:
+        time.sleep(delay)
+
+# Serialized data samples shared by fan-out agents, keyed by id() of the source list.
+# The list itself is kept in the entry so its id can't be reused while cached.
+_data_sample_cache: Dict[int, tuple] = {}
+_DATA_SAMPLE_CACHE_MAX = 64
+
 def reset_trace_state():
     """Reset trace state for new execution - MUST be called at start"""
-    global _notified_nodes, _shared_results
+    global _notified_mask, _shared_results_ref
+    # Swap back to empty sentinels - nothing is allocated per reset
     with _trace_lock:
-        _notified_nodes = set()
+        _notified_mask = 0
+        _node_bits.clear()
     with _results_lock:
-        _shared_results = {}
+        _shared_results_ref = _EMPTY_RESULTS
+    _data_sample_cache.clear()
     print("[TRACE] 🔄 Trace state reset for new execution")
 
 
@@ -104,6 +222,22 @@ def reset_trace_state():
 
 import re
 
+# Prompt guard patterns - each group is compiled once into a single alternation
+_SHELL_PATTERNS = [
+    r'^(cd|ls|pwd|mkdir|rm|cp|mv|cat|echo|grep|find|chmod|chown|sudo|apt|brew|npm|pip|python|node|uvicorn|pkill|kill)\s',
+    r'^\.?/[a-zA-Z]',  # Paths like /Users or ./venv
+    r'&&|\|\||;.*\$',  # Shell operators
+    r'^\s*#!',  # Shebang
+    r'--[a-z]+=',  # CLI flags like --host=
+]
+_CODE_PATTERNS = [
+    r'^(import|from|def|class|function|const|let|var|SELECT|INSERT|UPDATE|DELETE)\s',
+    r'^\{.*\}$',  # JSON objects
+    r'^\[.*\]$',  # JSON arrays
+]
+_SHELL_RE = re.compile('|'.join(f'(?:{p})' for p in _SHELL_PATTERNS), re.IGNORECASE)
+_CODE_RE = re.compile('|'.join(f'(?:{p})' for p in _CODE_PATTERNS), re.IGNORECASE)
+
 def validate_and_clean_prompt(prompt: str) -> tuple[str, bool, str]:
     """
     Validate user prompt and detect garbage inputs.
@@ -116,18 +250,9 @@ def validate_and_clean_prompt(prompt: str) -> tuple[str, bool, str]:
     prompt = prompt.strip()
     
     # Detect shell commands
-    shell_patterns = [
-        r'^(cd|ls|pwd|mkdir|rm|cp|mv|cat|echo|grep|find|chmod|chown|sudo|apt|brew|npm|pip|python|node|uvicorn|pkill|kill)\s',
-        r'^\.?/[a-zA-Z]',  # Paths like /Users or ./venv
-        r'&&|\|\||;.*\$',  # Shell operators
-        r'^\s*#!',  # Shebang
-        r'--[a-z]+=',  # CLI flags like --host=
-    ]
-    
-    for pattern in shell_patterns:
-        if re.search(pattern, prompt, re.IGNORECASE):
-            print(f"[PROMPT GUARD] ⚠️ Detected shell command in prompt: {prompt[:50]}...")
-            return '', False, 'Detected shell command instead of a question. Please enter a natural language question about your data.'
+    if _SHELL_RE.search(prompt):
+        print(f"[PROMPT GUARD] ⚠️ Detected shell command in prompt: {prompt[:50]}...")
+        return '', False, 'Detected shell command instead of a question. Please enter a natural language question about your data.'
     
     # Detect file paths
     if prompt.startswith('/') or prompt.startswith('./') or prompt.startswith('../'):
@@ -135,16 +260,9 @@ def validate_and_clean_prompt(prompt: str) -> tuple[str, bool, str]:
         return '', False, 'Detected file path instead of a question. Please enter a natural language question.'
     
     # Detect code snippets
-    code_patterns = [
-        r'^(import|from|def|class|function|const|let|var|SELECT|INSERT|UPDATE|DELETE)\s',
-        r'^\{.*\}$',  # JSON objects
-        r'^\[.*\]$',  # JSON arrays
-    ]
-    
-    for pattern in code_patterns:
-        if re.search(pattern, prompt, re.IGNORECASE):
-            print(f"[PROMPT GUARD] ⚠️ Detected code snippet in prompt: {prompt[:50]}...")
-            return '', False, 'Detected code instead of a question. Please enter a natural language question about your data.'
+    if _CODE_RE.search(prompt):
+        print(f"[PROMPT GUARD] ⚠️ Detected code snippet in prompt: {prompt[:50]}...")
+        return '', False, 'Detected code instead of a question. Please enter a natural language question about your data.'
     
     # Too short to be meaningful
     if len(prompt) < 5:
@@ -160,37 +278,42 @@ def traced_node(node_id: str, node_fn: Callable) -> Callable:
     
     Guarantees:
     ✅ Exactly ONE notification per node per execution
-    ✅ Consistent visual pacing (500ms between nodes)
+    ✅ Visual pacing hint for the frontend (no backend delay)
     ✅ Thread-safe operation
     ✅ Error recovery without breaking the flow
     ✅ Works for ANY node type in ANY template
     """
     @wraps(node_fn)
     def wrapper(state: WorkflowState) -> Dict:
-        global _notified_nodes
+        global _notified_mask
+        node_bit = _node_bit(node_id)
         
+        # Lock-free fast path: _notified_mask only gains bits within an execution,
+        # so a set bit on the current value means we've already notified.
         should_notify = False
-        with _trace_lock:
-            if node_id not in _notified_nodes:
-                _notified_nodes.add(node_id)
-                should_notify = True
+        if not _notified_mask & node_bit:
+            with _trace_lock:
+                if not _notified_mask & node_bit:
+                    _notified_mask |= node_bit
+                    should_notify = True
         
         # STEP 1: Notify frontend (exactly once)
         if should_notify:
             # Direct call to queue-based notification
             eq = get_execution_queue()
             if eq:
-                try:
-                    eq.put_nowait({'type': 'node_executing', 'node_id': node_id})
-                    print(f"[TRACE] 🔵 Node '{node_id}' - EXECUTING (queued ✓)")
-                except Exception as e:
-                    print(f"[TRACE] Queue error: {e}")
+                eq.put_nowait({
+                    'type': 'node_executing',
+                    'node_id': node_id,
+                    'visual_min_ms': TRACE_VISUAL_DELAY_MS,
+                    'ts': time.monotonic_ns()
+                })
+                print(f"[TRACE] 🔵 Node '{node_id}' - EXECUTING (queued ✓)")
             else:
                 print(f"[TRACE] ⚠️ Node '{node_id}' - NO QUEUE AVAILABLE!")
             
-            # STEP 2: Guaranteed visual delay for human perception
-            # This is the KEY to reliable tracing - we WAIT for the visual to register
-            time.sleep(TRACE_VISUAL_DELAY_MS / 1000.0)
+            # STEP 2: Visual pacing is done client-side from visual_min_ms,
+            # so node execution is never delayed for the UI
         
         # STEP 3: Execute the actual node function
         try:
@@ -201,21 +324,17 @@ def traced_node(node_id: str, node_fn: Callable) -> Callable:
             # STEP 3b: Send completion event to queue (include error if present)
             eq = get_execution_queue()
             if eq and should_notify:
-                try:
-                    completed_event = {'type': 'node_completed', 'node_id': node_id}
-                    # Include error info if node returned an error
-                    if result.get('error'):
-                        completed_event['error'] = result['error']
-                    if result.get('auth_error'):
-                        completed_event['auth_error'] = True
-                    eq.put_nowait(completed_event)
-                except Exception:
-                    pass
+                completed_event = {'type': 'node_completed', 'node_id': node_id}
+                # Include error info if node returned an error
+                if result.get('error'):
+                    completed_event['error'] = result['error']
+                if result.get('auth_error'):
+                    completed_event['auth_error'] = True
+                eq.put_nowait(completed_event)
             print(f"[TRACE] ✅ Node '{node_id}' - COMPLETED")
             
         except Exception as e:
             print(f"[TRACE] ❌ Node '{node_id}' - FAILED: {str(e)}")
-            import traceback
             traceback.print_exc()
             result = {
                 'error': str(e),
@@ -237,18 +356,158 @@ def notify_node_executing_safe(node_id: str):
     Safe notification that respects the trace lock.
     Used by nodes that need to notify mid-execution (rare).
     """
-    global _notified_nodes
+    global _notified_mask
+    node_bit = _node_bit(node_id)
+    if _notified_mask & node_bit:
+        return  # Already notified, skip (lock-free fast path)
     with _trace_lock:
-        if node_id in _notified_nodes:
+        if _notified_mask & node_bit:
             return  # Already notified, skip
-        _notified_nodes.add(node_id)
+        _notified_mask |= node_bit
     # Direct call to queue
     eq = get_execution_queue()
     if eq:
-        try:
-            eq.put_nowait({'type': 'node_executing', 'node_id': node_id})
-        except Exception:
-            pass
+        eq.put_nowait({'type': 'node_executing', 'node_id': node_id})
+
+
+_TOKEN_SPLIT_RE = re.compile(r'\W+')
+
+def _name_tokens(text: str) -> frozenset:
+    """Lowercased words of a name that are long enough to be meaningful for matching"""
+    return frozenset(w for w in _TOKEN_SPLIT_RE.split(text.lower()) if len(w) > 2)
+
+
+def _build_substring_matcher(patterns: Dict[str, set]) -> Callable[[str], set]:
+    """Compile pattern -> ids into one scanner returning the ids of every pattern found in a text
+
+    A single regex pass stands in for an Aho-Corasick automaton: the lookahead reports the
+    longest pattern at each position, and each pattern also carries the ids of the shorter
+    patterns that are its prefixes (the only other ones that can match at that position).
+    """
+    patterns = {p: ids for p, ids in patterns.items() if p}
+    if not patterns:
+        return lambda text: set()
+    ordered = sorted(patterns, key=len, reverse=True)
+    outputs = {
+        p: frozenset().union(*(ids for q, ids in patterns.items() if p.startswith(q)))
+        for p in ordered
+    }
+    scanner = re.compile('(?=(' + '|'.join(map(re.escape, ordered)) + '))')
+    
+    def match(text: str) -> set:
+        found = set()
+        for m in scanner.finditer(text):
+            found |= outputs[m.group(1)]
+        return found
+    return match
+
+
+class _RouteMatcher:
+    """First router target whose label/route overlaps a routing decision, matched with C-level scans
+
+    A target matches when the decision contains its label, route name or a 3+ char label word,
+    or when its label/route contains the decision or its label contains one of the decision's
+    words. Forward containment is one substring-matcher pass; reverse containment is one
+    str.find per term over all labels joined with a separator, mapped back to a target by bisect.
+    """
+
+    _SEP = '\x00'
+
+    def __init__(self, targets: List[tuple]):
+        # targets: [(target_id, label_lower, route_lower), ...] in priority order
+        self.ids = [target_id for target_id, _, _ in targets]
+        contained: Dict[str, set] = {}
+        # An empty label or route name is contained in every decision
+        self.always = min((i for i, (_, label, route) in enumerate(targets) if not label or not route), default=None)
+        for i, (_, label, route) in enumerate(targets):
+            for pattern in [label, route, *(lw for lw in label.split() if len(lw) > 2)]:
+                contained.setdefault(pattern, set()).add(i)
+        self._find_contained = _build_substring_matcher(contained)
+        self._labels, self._label_starts = self._join([label for _, label, _ in targets])
+        self._labels_routes, self._label_route_starts = self._join(
+            [part for _, label, route in targets for part in (label, route)]
+        )
+
+    @classmethod
+    def _join(cls, parts: List[str]) -> tuple:
+        starts, pos = [], 0
+        for part in parts:
+            starts.append(pos)
+            pos += len(part) + 1
+        return cls._SEP.join(parts), starts
+
+    def best(self, decision: str) -> Optional[str]:
+        if not decision or self._SEP in decision:
+            return None if not decision else self._best_slow(decision)
+        candidates = self._find_contained(decision)
+        if self.always is not None:
+            candidates.add(self.always)
+        pos = self._labels_routes.find(decision)
+        if pos != -1:
+            candidates.add((bisect_right(self._label_route_starts, pos) - 1) // 2)
+        for word in decision.split():
+            pos = self._labels.find(word)
+            if pos != -1:
+                candidates.add(bisect_right(self._label_starts, pos) - 1)
+        return self.ids[min(candidates)] if candidates else None
+
+    def _best_slow(self, decision: str) -> Optional[str]:
+        # Decisions containing the separator could match across joined labels - check per target
+        labels = self._labels.split(self._SEP)
+        routes = self._labels_routes.split(self._SEP)[1::2]
+        matched = self._find_contained(decision)
+        words = decision.split()
+        for i, (label, route) in enumerate(zip(labels, routes)):
+            if (i in matched or i == self.always or decision in label or decision in route
+                    or any(word in label for word in words)):
+                return self.ids[i]
+        return None
+
+
+def _json_dumps_pretty(obj: Any) -> str:
+    """Indented JSON for LLM prompts - orjson when available, stdlib otherwise"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, indent=2, default=str)
+
+
+def _json_dumps(obj: Any) -> str:
+    """Compact JSON for request payloads - orjson when available, stdlib otherwise"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, default=str)
+
+
+def _json_dumps_bounded(obj: Any, limit: int, indent: Optional[int] = None) -> str:
+    """First `limit` chars of obj's JSON - encoding stops once enough text exists, so a
+    huge object is never serialized in full just to be truncated"""
+    parts = []
+    size = 0
+    for chunk in json.JSONEncoder(indent=indent, default=str).iterencode(obj):
+        parts.append(chunk)
+        size += len(chunk)
+        if size >= limit:
+            break
+    return ''.join(parts)[:limit]
+
+
+def _json_loads(text: Union[str, bytes]) -> Any:
+    """Parse JSON - orjson when available (its JSONDecodeError subclasses json's)"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _data_sample_json(data: List[Dict[str, Any]]) -> str:
+    """JSON for the first 10 data rows, computed once per source list"""
+    cached = _data_sample_cache.get(id(data))
+    if cached is not None and cached[0] is data:
+        return cached[1]
+    data_str = _json_dumps_pretty(data[:10])
+    if len(_data_sample_cache) >= _DATA_SAMPLE_CACHE_MAX:
+        _data_sample_cache.clear()
+    _data_sample_cache[id(data)] = (data, data_str)
+    return data_str
 
 
 def last_value(a: Any, b: Any) -> Any:
@@ -273,24 +532,66 @@ class WorkflowState(TypedDict):
     routing_decision: Annotated[str, last_value]  # For Router nodes - which agent to route to
     user_prompt: str  # Natural language query that triggered the workflow (set once at start)
     selected_agents: Annotated[List[str], operator.add]  # For Supervisor - agents selected for execution
+    selected_tokens: Annotated[frozenset, last_value]  # Name tokens of selected_agents, computed once by the Supervisor
     executed_nodes: Annotated[List[str], operator.add]  # Track which nodes actually executed (for frontend tracing)
     simulated_nodes: Annotated[List[str], operator.add]  # Track nodes that ran in simulated mode (external APIs unavailable)
     execution_timing: Dict[str, Dict[str, Any]]  # Execution plan with timing for each node
     semantic_models: Annotated[Dict[str, Dict[str, Any]], merge_dicts]  # Semantic models for Cortex Analyst (supports concurrent writes)
 
 
+def _create_mock_source_node(node_config: Dict, records: List[Dict], delay: Optional[float]):
+    """Create a data source node that returns canned records without touching Snowflake"""
+    node_id = node_config['id']
+    label = node_config.get('data', {}).get('label', 'Data Source')
+    
+    def mock_source_node(state: WorkflowState) -> Dict:
+        if delay is not None:
+            time.sleep(delay)
+        else:
+            _pace(state.get('execution_timing', {}).get(node_id, {}).get('delay', 0.1))
+        return {
+            'data': records,
+            'messages': [f"📊 Data Source: Loaded {len(records)} mock records for {label}"],
+            'current_node': node_id,
+            'executed_nodes': [node_id],
+            'simulated_nodes': [node_id]
+        }
+    return mock_source_node
+
+
 def create_source_node(node_config: Dict):
     """Create a node function that fetches data from Snowflake"""
+    node_id = node_config.get('id', '')
+    data = node_config.get('data', {})
+    
+    # Check for mock configuration
+    mock_config = data.get('mock', {})
+    mock_delay = mock_config.get('delay', None)
+    
+    # Inline mock records - specialize to a closure that never builds or runs a query
+    if mock_config.get('records'):
+        return _create_mock_source_node(node_config, mock_config['records'], mock_delay)
+    
+    label = data.get('label', 'Data Source')
+    database = data.get('database', 'SNOWFLOW_DEV')
+    schema = data.get('schema', '')
+    table = label
+    
+    columns = data.get('columns', '*') or '*'
+    filter_clause = data.get('filter', '')
+    order_by = data.get('orderBy', '')
+    limit = data.get('limit', 100) or 100
+    
+    # Every part of the query is known at graph build time - assemble it once
+    query_parts = [f"SELECT {columns} FROM {database}.{schema}.{table}"]
+    if filter_clause:
+        query_parts.append(f"WHERE {filter_clause}")
+    if order_by:
+        query_parts.append(f"ORDER BY {order_by}")
+    query_parts.append(f"LIMIT {limit}")
+    query = " ".join(query_parts)
+    
     def source_node(state: WorkflowState) -> Dict:
-        import time
-        
-        node_id = node_config.get('id', '')
-        data = node_config.get('data', {})
-        
-        # Check for mock configuration
-        mock_config = data.get('mock', {})
-        mock_delay = mock_config.get('delay', None)
-        
         # Use mock delay if specified, otherwise intelligent default
         if mock_delay is not None:
             time.sleep(mock_delay)
@@ -299,28 +600,11 @@ def create_source_node(node_config: Dict):
             execution_timing = state.get('execution_timing', {})
             node_timing = execution_timing.get(node_id, {})
             delay = node_timing.get('delay', 0.1)  # Minimal delay - traced_node handles visual pacing
-            time.sleep(delay)
+            _pace(delay)
         
         # NOTE: traced_node wrapper handles notification - no duplicate call needed
         
-        label = data.get('label', 'Data Source')
-        database = data.get('database', 'SNOWFLOW_DEV')
-        schema = data.get('schema', '')
-        table = label
-        
-        columns = data.get('columns', '*') or '*'
-        filter_clause = data.get('filter', '')
-        order_by = data.get('orderBy', '')
-        limit = data.get('limit', 100) or 100
-        
         try:
-            query = f"SELECT {columns} FROM {database}.{schema}.{table}"
-            if filter_clause:
-                query += f" WHERE {filter_clause}"
-            if order_by:
-                query += f" ORDER BY {order_by}"
-            query += f" LIMIT {limit}"
-            
             df = snowflake_client.execute_query(query)
             records = df.to_dict('records')
             return {
@@ -339,28 +623,48 @@ def create_source_node(node_config: Dict):
 
 def create_agent_node(node_config: Dict):
     """Create a node function that runs a Cortex agent with tools"""
+    # node_config is fixed at graph build time - resolve everything static once here
+    data = node_config.get('data', {})
+    tools = data.get('tools', {})
+    # Guard: tools might be a list in some templates - convert to empty dict
+    if isinstance(tools, list):
+        tools = {}
+    
+    model = data.get('model', 'mistral-large2')
+    system_prompt = data.get('systemPrompt') or data.get('instructions', 'Analyze the data and provide insights.')
+    agent_name = data.get('label', 'Agent')
+    node_id = node_config.get('id', '')
+    mock_config = data.get('mock', {})
+    
+    temperature = data.get('temperature', 0.7)
+    max_tokens = data.get('maxTokens', 4096)
+    top_p = data.get('topP', 1.0)
+    
+    # Normalize tools format: handle both array ["Analyst"] and dict {"analyst": {...}}
+    tools_enabled = set()
+    if isinstance(tools, list):
+        # Array format: ["Analyst", "Search", "SQL"]
+        tools_enabled = {t.lower() for t in tools}
+    elif isinstance(tools, dict):
+        # Dict format: {"analyst": {"enabled": true}}
+        for tool_name, tool_config in tools.items():
+            if isinstance(tool_config, dict) and tool_config.get('enabled'):
+                tools_enabled.add(tool_name.lower())
+    tools_enabled = frozenset(tools_enabled)
+    
+    # Domain used to pick a semantic model for the Analyst tool (e.g. "sales agent" -> "sales")
+    agent_name_lower = agent_name.lower()
+    agent_tokens = _name_tokens(agent_name)
+    agent_domain = agent_name.lower().replace('agent', '').replace('💰', '').replace('👥', '').replace('📦', '').replace('🏷️', '').replace('🏪', '').replace('💵', '').strip()
+    search_config = tools.get('search', {}) if isinstance(tools, dict) else {}
+    
     def agent_node(state: WorkflowState) -> Dict:
-        data = node_config.get('data', {})
-        tools = data.get('tools', {})
-        # Guard: tools might be a list in some templates - convert to empty dict
-        if isinstance(tools, list):
-            tools = {}
-        
-        model = data.get('model', 'mistral-large2')
-        system_prompt = data.get('systemPrompt') or data.get('instructions', 'Analyze the data and provide insights.')
-        agent_name = data.get('label', 'Agent')
-        
         # Check if this agent is in the selected list (for Supervisor-controlled execution)
         selected_agents = state.get('selected_agents', [])
         if selected_agents:
-            # Check if this agent's name matches any selected agent
-            is_selected = False
-            for sel in selected_agents:
-                sel_lower = sel.lower()
-                name_lower = agent_name.lower()
-                if sel_lower in name_lower or any(word in name_lower for word in sel_lower.split() if len(word) > 2):
-                    is_selected = True
-                    break
+            # Check if this agent's name matches any selected agent (shared word, or selection contained in name)
+            sel_tokens = state.get('selected_tokens') or frozenset().union(*map(_name_tokens, selected_agents))
+            is_selected = bool(agent_tokens & sel_tokens) or any(sel.lower() in agent_name_lower for sel in selected_agents)
             
             if not is_selected:
                 print(f"⏭️  AGENT SKIPPED: {agent_name} (not in selected_agents: {selected_agents})")
@@ -370,41 +674,22 @@ def create_agent_node(node_config: Dict):
         
         print(f"\n🤖 AGENT EXECUTING: {agent_name}")
         
-        # Track that this node executed
-        node_id = node_config.get('id', '')
-        
-        import time
         # Use execution plan timing or mock config
-        mock_config = data.get('mock', {})
         if 'delay' in mock_config:
             time.sleep(mock_config['delay'])
         else:
             execution_timing = state.get('execution_timing', {})
             delay = execution_timing.get(node_id, {}).get('delay', 0.3)
-            time.sleep(delay)
+            _pace(delay)
         
         # Notify streaming (if active)
         # traced_node handles notification
         print(f"   Model: {model}")
         print(f"   Data rows: {len(state.get('data', []))}")
         
-        temperature = data.get('temperature', 0.7)
-        max_tokens = data.get('maxTokens', 4096)
-        top_p = data.get('topP', 1.0)
-        
-        tool_results = {}
-        tool_messages = []
-        
-        # Normalize tools format: handle both array ["Analyst"] and dict {"analyst": {...}}
-        tools_enabled = set()
-        if isinstance(tools, list):
-            # Array format: ["Analyst", "Search", "SQL"]
-            tools_enabled = {t.lower() for t in tools}
-        elif isinstance(tools, dict):
-            # Dict format: {"analyst": {"enabled": true}}
-            for tool_name, tool_config in tools.items():
-                if isinstance(tool_config, dict) and tool_config.get('enabled'):
-                    tools_enabled.add(tool_name.lower())
+        # Agents without tools (the common fan-out case) skip the tool bookkeeping entirely
+        tool_results = {} if tools_enabled else None
+        tool_messages = [] if tools_enabled else ()
         
         # Execute Cortex Analyst if enabled
         if 'analyst' in tools_enabled:
@@ -412,8 +697,6 @@ def create_agent_node(node_config: Dict):
             semantic_models = state.get('semantic_models', {})
             
             # Find a semantic model to use (prefer one matching agent's domain)
-            agent_domain = agent_name.lower().replace('agent', '').replace('💰', '').replace('👥', '').replace('📦', '').replace('🏷️', '').replace('🏪', '').replace('💵', '').strip()
-            
             selected_model = None
             for model_id, model_info in semantic_models.items():
                 model_label = model_info.get('label', '').lower()
@@ -445,7 +728,6 @@ def create_agent_node(node_config: Dict):
                 print(f"   ⚠️ No semantic model available for Analyst tool")
         
         # Execute Cortex Search if enabled (dict format for backward compat)
-        search_config = tools.get('search', {}) if isinstance(tools, dict) else {}
         if 'search' in tools_enabled and search_config.get('searchServiceName'):
             service_name = search_config.get('searchServiceName', '')
             if service_name:
@@ -460,13 +742,12 @@ def create_agent_node(node_config: Dict):
                 tool_messages.append(f"Cortex Search found {len(search_results)} results")
         
         # Build prompt - include user prompt if available
-        data_sample = state.get('data', [])[:10]
-        data_str = json.dumps(data_sample, indent=2, default=str)
+        data_str = _data_sample_json(state.get('data', []))
         user_prompt = state.get('user_prompt', '')
         
         tool_context = ""
         if tool_results:
-            tool_context = f"\n\nTool Results:\n{json.dumps(tool_results, indent=2, default=str)}\n"
+            tool_context = f"\n\nTool Results:\n{_json_dumps_pretty(tool_results)}\n"
         
         # If user prompt is available, make it the primary focus
         user_query_section = ""
@@ -494,8 +775,8 @@ Provide your analysis:"""
             
             all_messages = [
                 f"🤖 Agent '{agent_name}' invoked (Model: {model})",
-                f"📊 Processing {len(state.get('data', []))} data records"
-            ] + tool_messages + [
+                f"📊 Processing {len(state.get('data', []))} data records",
+                *tool_messages,
                 f"✅ {agent_name} completed analysis"
             ]
             
@@ -509,7 +790,7 @@ Provide your analysis:"""
                     'agent': agent_name,
                     'response': response,
                     'model': model,
-                    'tools_used': list(tool_results.keys())
+                    'tools_used': tuple(tool_results) if tool_results else ()
                 }],
                 'messages': all_messages,
                 'executed_nodes': [node_id] if node_id else []
@@ -517,11 +798,42 @@ Provide your analysis:"""
         except Exception as e:
             return {
                 'error': str(e),
-                'messages': tool_messages + [f"Agent error: {str(e)}"]
+                'messages': [*tool_messages, f"Agent error: {str(e)}"]
             }
     return agent_node
 
 
+def _route_keywords(routes: List[Dict]) -> Dict[str, str]:
+    """Lowercase route-name token -> route name, for tokens that name a single route
+
+    Words shared by several route names ("agent" in "Sales Agent"/"Inventory Agent") identify none of them.
+    """
+    owners: Dict[str, set] = defaultdict(set)
+    for route in routes:
+        route_name = (route.get('name') or '').strip()
+        for token in _name_tokens(route_name):
+            owners[token].add(route_name)
+    return {token: next(iter(names)) for token, names in owners.items() if len(names) == 1}
+
+
+def _single_route_for(user_prompt: str, route_keywords: Dict[str, str]) -> Optional[str]:
+    """The one route a prompt names by whole word, or None when the LLM should classify
+
+    Diagnostic/comparative questions ("why did sales drop?") usually span more routes
+    than they name, so they always go to the LLM, which can answer ALL.
+    """
+    if not user_prompt or _PLAN_AMBIGUOUS_RE.search(user_prompt):
+        return None
+    matches = {route_keywords[token] for token in _name_tokens(user_prompt) & route_keywords.keys()}
+    return next(iter(matches)) if len(matches) == 1 else None
+
+
+# Router LLM classifications keyed by (user_prompt, route names + conditions, strategy) - LRU bounded
+_router_decision_cache: OrderedDict = OrderedDict()
+_router_cache_lock = threading.Lock()
+_ROUTER_CACHE_MAX = 512
+
+
 def create_router_node(node_config: Dict, connected_agents: List[Dict]):
     """Create a Router node that classifies intent and routes to ONE agent
     
@@ -532,12 +844,16 @@ def create_router_node(node_config: Dict, connected_agents: List[Dict]):
     """
     node_id = node_config.get('id', 'router')
     
+    # Route-name keywords for the no-LLM shortcut: lowercase name token -> route name
+    route_keywords = _route_keywords(node_config.get('data', {}).get('routes', []))
+    
+    data = node_config.get('data', {})
+    label = data.get('label', 'Router')
+    strategy = data.get('routingStrategy', 'intent')
+    routes = data.get('routes', [])
+    
     def router_node(state: WorkflowState) -> Dict:
         # traced_node handles notification
-        data = node_config.get('data', {})
-        label = data.get('label', 'Router')
-        strategy = data.get('routingStrategy', 'intent')
-        routes = data.get('routes', [])
         
         # Get user prompt if provided - this is the KEY for smart routing
         user_prompt = state.get('user_prompt', '')
@@ -553,7 +869,6 @@ def create_router_node(node_config: Dict, connected_agents: List[Dict]):
         
         # Get context from state - show more data for better classification
         data_records = state.get('data', [])[:5]
-        context = json.dumps(data_records, indent=2, default=str)
         
         # Extract route names for the example
         route_name_list = [r.get('name', '') for r in routes]
@@ -586,6 +901,8 @@ If the question can be answered by ONE domain, respond with that domain name (e.
 
 Respond with ONLY one word: either "ALL" or a single domain name."""
         else:
+            # Only the data-driven prompt embeds the records, so serialize them just here
+            context = _json_dumps_pretty(data_records)
             classification_prompt = f"""You are an intent classifier for a support ticket routing system. 
 
 Analyze the data below and determine which category BEST matches the PRIMARY issue.
@@ -600,22 +917,48 @@ Look at fields like 'issue_category', 'description', or 'product_name' to determ
 Respond with ONLY the route name (e.g., {example_routes}). Nothing else - just the single word."""
 
         try:
-            print(f"\n{'='*60}")
-            print(f"🔀 ROUTER: {label}")
-            print(f"   Strategy: {strategy}")
-            print(f"   Routes: {[r.get('name') for r in routes]}")
+            # One print per block - each print() takes stdout's lock, which fan-out threads contend on
+            header = [
+                f"\n{'='*60}",
+                f"🔀 ROUTER: {label}",
+                f"   Strategy: {strategy}",
+                f"   Routes: {[r.get('name') for r in routes]}",
+            ]
             if user_prompt:
-                print(f"   📝 User Prompt: {user_prompt[:100]}...")
-            print(f"   Data records: {len(data_records)}")
+                header.append(f"   📝 User Prompt: {user_prompt[:100]}...")
+            header.append(f"   Data records: {len(data_records)}")
+            print("\n".join(header))
             
             if strategy == 'intent' or strategy == 'llm':
-                # Use LLM for classification
-                print(f"   Calling Cortex for classification...")
-                decision = snowflake_client.cortex_complete(
-                    model='mistral-large2',
-                    prompt=classification_prompt,
-                    options={'temperature': 0.1, 'max_tokens': 50}
-                ).strip()
+                # Use LLM for classification (same prompt + routes => same decision)
+                # Data-driven prompts (no user prompt) depend on state data, so only cache prompt-driven ones.
+                # The key carries the route conditions too: flows sharing route names can mean different things.
+                cache_key = (user_prompt, routes_text, strategy) if user_prompt else None
+                # Prompt names exactly one route (e.g. "show me sales") - unambiguous, skip the LLM.
+                # Whole words only, so "sales" doesn't fire on "wholesalers".
+                shortcut = _single_route_for(user_prompt, route_keywords)
+                if shortcut is not None:
+                    decision = shortcut
+                    print(f"   Prompt names a single route, skipping LLM")
+                else:
+                    with _router_cache_lock:
+                        decision = _router_decision_cache.get(cache_key) if cache_key else None
+                        if decision is not None:
+                            _router_decision_cache.move_to_end(cache_key)
+                    if decision is not None:
+                        print(f"   Using cached classification")
+                    else:
+                        print(f"   Calling Cortex for classification...")
+                        decision = snowflake_client.cortex_complete(
+                            model='mistral-large2',
+                            prompt=classification_prompt,
+                            options={'temperature': 0.1, 'max_tokens': 50}
+                        ).strip()
+                        if cache_key and not decision.startswith('Analysis timed out'):
+                            with _router_cache_lock:
+                                _router_decision_cache[cache_key] = decision
+                                if len(_router_decision_cache) > _ROUTER_CACHE_MAX:
+                                    _router_decision_cache.popitem(last=False)
             elif strategy == 'keyword':
                 # Lightweight keyword matching (no LLM). Uses route condition as a comma-separated keyword list.
                 p = (user_prompt or '').lower()
@@ -626,7 +969,6 @@ Respond with ONLY the route name (e.g., {example_routes}). Nothing else - just t
                     # If the condition looks like `intent == "sales"` extract the quoted token; otherwise treat as keyword list.
                     keywords: List[str] = []
                     if 'intent' in cond and '==' in cond:
-                        import re
                         m = re.search(r'==\s*[\'"]([^\'"]+)[\'"]', cond)
                         if m:
                             keywords = [m.group(1)]
@@ -654,8 +996,7 @@ Respond with ONLY the route name (e.g., {example_routes}). Nothing else - just t
             is_multi = decision == 'ALL' or decision == 'MULTI' or decision == 'MULTIPLE'
             
             if is_multi:
-                print(f"   🔄 MULTI-DOMAIN query detected!")
-                print(f"   📢 Broadcasting to ALL {len(routes)} agents...")
+                print(f"   🔄 MULTI-DOMAIN query detected!\n   📢 Broadcasting to ALL {len(routes)} agents...")
                 # Return all route names for parallel execution
                 all_routes = ','.join([r.get('name', '') for r in routes])
                 return {
@@ -670,8 +1011,7 @@ Respond with ONLY the route name (e.g., {example_routes}). Nothing else - just t
                     'current_node': node_config['id']
                 }
             
-            print(f"   ✅ Decision: '{decision}'")
-            print(f"{'='*60}\n")
+            print(f"   ✅ Decision: '{decision}'\n{'='*60}\n")
             
             return {
                 'routing_decision': decision,
@@ -695,6 +1035,190 @@ Respond with ONLY the route name (e.g., {example_routes}). Nothing else - just t
     return router_node
 
 
+# Supervisor plans keyed by (model, sha256 of the normalized prompt) - LRU bounded with a TTL
+_plan_cache: OrderedDict = OrderedDict()
+_plan_cache_lock = threading.Lock()
+_PLAN_CACHE_MAX = 1024
+_PLAN_CACHE_TTL = 3600.0  # seconds
+_PLAN_PUNCT_RE = re.compile(r'[^\w\s]')
+
+
+def _plan_cache_key(model: str, user_prompt: str) -> tuple:
+    """Lowercase, strip punctuation and collapse whitespace so trivially different phrasings share a plan"""
+    normalized = ' '.join(_PLAN_PUNCT_RE.sub(' ', user_prompt.lower()).split())
+    return (model, hashlib.sha256(normalized.encode('utf-8')).hexdigest())
+
+
+def _lookup_plan(key: tuple) -> Optional[tuple]:
+    """Cached agent selection for a plan key, or None if missing/expired"""
+    with _plan_cache_lock:
+        entry = _plan_cache.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] > _PLAN_CACHE_TTL:
+            del _plan_cache[key]
+            return None
+        _plan_cache.move_to_end(key)
+        return entry[1]
+
+
+def _store_plan(key: tuple, selected_agents: List[str]):
+    """Remember an LLM-produced agent selection, evicting the least recently used plan"""
+    with _plan_cache_lock:
+        _plan_cache[key] = (time.time(), tuple(selected_agents))
+        _plan_cache.move_to_end(key)
+        if len(_plan_cache) > _PLAN_CACHE_MAX:
+            _plan_cache.popitem(last=False)
+
+
+# Deterministic pre-router for the supervisor plan: prompts that plainly name one or
+# two domains skip the planning LLM call. Word-prefix patterns so plurals/inflections match.
+_DOMAIN_KEYWORDS = {
+    'Sales': re.compile(r'\b(revenue|margin|sell|selling|sold|sales|product|sku)', re.I),
+    'Inventory': re.compile(r'\b(stock|inventor|waste|shrink|supply|fresh)', re.I),
+    'Customer': re.compile(r'\b(customer|loyal|basket|demograph|retention|shopper)', re.I),
+    'Promo': re.compile(r'\b(promo|discount|campaign|coupon)', re.I),
+    'Ops': re.compile(r'\b(ops|operation|labou?r|staff|schedul|efficien)', re.I),
+}
+# Diagnostic/comparative questions usually span more domains than they name - leave those to the LLM
+_PLAN_AMBIGUOUS_RE = re.compile(r'\b(why|caus|driv|compar|versus|vs|impact|affect|overall|profitab)', re.I)
+
+
+def _keyword_plan(user_prompt: str) -> Optional[List[str]]:
+    """Domains a prompt unambiguously names, or None when the LLM planner should decide"""
+    if _PLAN_AMBIGUOUS_RE.search(user_prompt):
+        return None
+    hits = [domain for domain, rx in _DOMAIN_KEYWORDS.items() if rx.search(user_prompt)]
+    return hits if 1 <= len(hits) <= 2 else None
+
+
+def _parse_fused_plan(reply: str, pinned: Optional[List[str]] = None) -> Optional[tuple]:
+    """(selected_agents, analyses, response) from a fused supervisor reply, or None if it isn't usable
+
+    With pinned agents (plan already known) the reply's own selection is ignored.
+    """
+    start, end = reply.find('{'), reply.rfind('}')
+    if start < 0 or end <= start:
+        return None
+    try:
+        payload = _json_loads(reply[start:end + 1])  # Tolerates code fences around the object
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    if pinned:
+        selected = list(pinned)
+    else:
+        domains = {domain.lower(): domain for domain in _DOMAIN_KEYWORDS}
+        selected = []
+        for name in payload.get('selected_agents') or ():
+            domain = domains.get(str(name).strip().lower())
+            if domain and domain not in selected:
+                selected.append(domain)
+    response = payload.get('response')
+    if not selected or not isinstance(response, str) or not response.strip():
+        return None
+    analyses = payload.get('analyses')
+    if not isinstance(analyses, dict):
+        analyses = {}
+    return selected, {agent: str(analyses.get(agent, '')) for agent in selected}, response
+
+
+# Static supervisor prompt preambles. They lead each prompt and the per-query
+# content follows, so the bytes sent up to the first dynamic field are identical
+# on every call (what prefix-caching model backends key on).
+SYSTEM_PREFIX_FUSED = """You are the Head of Analytics for a UK grocery retailer. You supervise these specialist agents:
+- Sales: Revenue, margins, product performance, regional sales
+- Inventory: Stock levels, waste, shrinkage, supply chain, freshness
+- Customer: Loyalty programs, demographics, basket analysis, retention
+- Promo: Promotional effectiveness, discounting, campaign ROI
+- Ops: Store operations, labour costs, efficiency, scheduling
+
+For the user's question below:
+1. Decide which agents are NEEDED to answer it. List ONLY the relevant ones.
+2. Write each selected agent's focused analysis (3-5 bullet points, realistic example metrics).
+3. Synthesize a COMPREHENSIVE answer structured as:
+   1. **Executive Summary** (2-3 sentences answering the question directly)
+   2. **Analysis by Domain** (bullet points for each agent you consulted)
+   3. **Root Cause / Key Insight** (what's the main finding)
+   4. **Recommended Action** (what should be done)
+
+Respond with ONLY this JSON object and no text around it:
+{"selected_agents": ["Sales", "Inventory"], "analyses": {"Sales": "...", "Inventory": "..."}, "response": "..."}"""
+
+SYSTEM_PREFIX_PLANNED = """You are the Head of Analytics for a UK grocery retailer. You supervise these specialist agents:
+- Sales: Revenue, margins, product performance, regional sales
+- Inventory: Stock levels, waste, shrinkage, supply chain, freshness
+- Customer: Loyalty programs, demographics, basket analysis, retention
+- Promo: Promotional effectiveness, discounting, campaign ROI
+- Ops: Store operations, labour costs, efficiency, scheduling
+
+The agents to consult for the user's question below have already been chosen (listed after it).
+1. Write each listed agent's focused analysis (3-5 bullet points, realistic example metrics).
+2. Synthesize a COMPREHENSIVE answer structured as:
+   1. **Executive Summary** (2-3 sentences answering the question directly)
+   2. **Analysis by Domain** (bullet points for each agent you consulted)
+   3. **Root Cause / Key Insight** (what's the main finding)
+   4. **Recommended Action** (what should be done)
+
+Respond with ONLY this JSON object and no text around it:
+{"analyses": {"Sales": "...", "Inventory": "..."}, "response": "..."}"""
+
+SYSTEM_PREFIX_AGGREGATION = """You are the Head of Analytics for a UK grocery retailer.
+
+You consulted specialist agents about the user's question below. Provide a COMPREHENSIVE answer that synthesizes their analyses.
+
+Structure your response as:
+1. **Executive Summary** (2-3 sentences answering the question directly)
+2. **Analysis by Domain** (bullet points for each agent you consulted)
+3. **Root Cause / Key Insight** (what's the main finding)
+4. **Recommended Action** (what should be done)"""
+
+# Per-call supervisor prompts, parsed once; the static prefix still leads each one
+_FUSED_PROMPT = string.Template(SYSTEM_PREFIX_FUSED + """
+
+System: ${system_prompt}
+
+Previous agent data received:
+${prior_data}
+
+User's Question: "${user_prompt}\"""")
+
+_PLANNED_PROMPT = string.Template(SYSTEM_PREFIX_PLANNED + """
+
+System: ${system_prompt}
+
+Previous agent data received:
+${prior_data}
+
+User's Question: "${user_prompt}"
+
+Agents to consult: ${agents_csv}""")
+
+_DOMAIN_PROMPT = string.Template("""System: ${system_prompt}
+
+You are the ${agent} specialist on the analytics team of a UK grocery retailer.
+
+User's Question: "${user_prompt}"
+
+Previous agent data received:
+${prior_data}
+
+Provide a focused ${agent} analysis (3-5 bullet points) that helps answer the question.
+Use realistic example metrics (e.g., "Margin dropped 2.1% in Scotland due to...")""")
+
+_AGGREGATION_PROMPT = string.Template(SYSTEM_PREFIX_AGGREGATION + """
+
+System: ${system_prompt}
+
+User's Question: "${user_prompt}"
+
+Your Plan: You decided to consult these specialist agents: ${agents_csv}
+
+Their analyses:
+${analyses_text}""")
+
+
 def create_supervisor_node(node_config: Dict):
     """Create a Supervisor node that PLANS and orchestrates child agents
     
@@ -704,74 +1228,93 @@ def create_supervisor_node(node_config: Dict):
     3. Simulates dispatching to selected agents
     4. Aggregates their responses
     """
+    data = node_config.get('data', {})
+    label = data.get('label', 'Supervisor')
+    model = data.get('model', 'mistral-large2')
+    strategy = data.get('delegationStrategy', 'adaptive')
+    system_prompt = data.get('systemPrompt', 'You are a supervisor agent.')
+    node_id = node_config.get('id', '')
+    
     def supervisor_node(state: WorkflowState) -> Dict:
-        data = node_config.get('data', {})
-        label = data.get('label', 'Supervisor')
-        model = data.get('model', 'mistral-large2')
-        strategy = data.get('delegationStrategy', 'adaptive')
-        system_prompt = data.get('systemPrompt', 'You are a supervisor agent.')
-        aggregation_method = data.get('aggregationMethod', 'merge')
-        
         user_prompt = state.get('user_prompt', '')
         agent_results = state.get('agent_results', [])
         
-        # Available domains the supervisor can delegate to
-        available_domains = ['Sales', 'Inventory', 'Customer', 'Promo', 'Ops']
+        prior_data = _json_dumps_pretty(agent_results) if agent_results else "No prior data"
+        final_response = None  # Filled by the fused planning call when it runs
+        eq = get_execution_queue()
+        
+        def publish_analysis(agent: str, analysis: str):
+            """Stream one domain's analysis to the UI ahead of the final answer"""
+            if eq:
+                eq.put_nowait({
+                    'type': 'node_progress',
+                    'node_id': node_config['id'],
+                    'agent': agent,
+                    'partial': analysis,
+                })
         
-        import time
         # Use execution plan timing
         execution_timing = state.get('execution_timing', {})
-        node_id = node_config.get('id', '')
         delay = execution_timing.get(node_id, {}).get('delay', 0.25)
-        time.sleep(delay)
+        _pace(delay)
         
         # Notify streaming
         # traced_node handles notification
         
         # STEP 1: PLANNING - Supervisor decides which agents to consult
         if user_prompt:
-            print(f"\n{'='*60}")
-            print(f"👔 SUPERVISOR: {label}")
-            print(f"   📝 Query: {user_prompt[:80]}...")
-            print(f"   🧠 Planning which agents to consult...")
+            print("\n".join([
+                f"\n{'='*60}",
+                f"👔 SUPERVISOR: {label}",
+                f"   📝 Query: {user_prompt[:80]}...",
+                f"   🧠 Planning which agents to consult...",
+            ]))
             
-            # Ask LLM to plan which agents are needed
-            planning_prompt = f"""You are a retail analytics supervisor. Given the user's question, decide which specialist agents to consult.
-
-User's Question: "{user_prompt}"
-
-Available Agents:
-- Sales: Revenue, margins, product performance, regional sales
-- Inventory: Stock levels, waste, shrinkage, supply chain, freshness
-- Customer: Loyalty programs, demographics, basket analysis, retention
-- Promo: Promotional effectiveness, discounting, campaign ROI
-- Ops: Store operations, labour costs, efficiency, scheduling
-
-Which agents are NEEDED to answer this question? List ONLY the relevant ones.
-Respond in format: Agent1, Agent2, Agent3
-
-For example:
-- "Why did margin drop?" → Sales, Inventory, Ops
-- "Top selling products" → Sales
-- "Loyalty program performance" → Customer, Sales"""
-
+            plan_key = _plan_cache_key(model, user_prompt)
+            known_plan = _keyword_plan(user_prompt)
+            plan_source = 'keywords'
+            if known_plan is None:
+                cached_plan = _lookup_plan(plan_key)
+                known_plan = list(cached_plan) if cached_plan is not None else None
+                plan_source = 'cached'
+            
+            # Analyse and synthesize in ONE Cortex round trip; the cache and keyword
+            # pre-router only spare the model the planning part of that call
+            if known_plan is not None:
+                fused_prompt = _PLANNED_PROMPT.substitute(
+                    system_prompt=system_prompt, prior_data=prior_data, user_prompt=user_prompt,
+                    agents_csv=', '.join(known_plan)
+                )
+            else:
+                fused_prompt = _FUSED_PROMPT.substitute(
+                    system_prompt=system_prompt, prior_data=prior_data, user_prompt=user_prompt
+                )
             try:
-                planning_response = snowflake_client.cortex_complete(
+                reply = snowflake_client.cortex_complete(
                     model=model,
-                    prompt=planning_prompt,
-                    options={'temperature': 0.1, 'max_tokens': 100}
-                ).strip()
-                
-                # Parse which agents were selected
-                selected_agents = [a.strip() for a in planning_response.split(',')]
-                selected_agents = [a for a in selected_agents if any(d.lower() in a.lower() for d in available_domains)]
-                
-                if not selected_agents:
-                    selected_agents = ['Sales']  # Default
-                
-                print(f"   📋 Plan: Consult {selected_agents}")
-                print(f"{'='*60}\n")
-                
+                    prompt=fused_prompt,
+                    options={'temperature': 0.5, 'max_tokens': 4096},
+                    apply_options=True
+                )
+                fused = _parse_fused_plan(reply, pinned=known_plan)
+
+                if fused is not None:
+                    selected_agents, analyses_by_agent, final_response = fused
+                    if known_plan is None:
+                        _store_plan(plan_key, selected_agents)
+                    for agent in selected_agents:
+                        publish_analysis(agent, analyses_by_agent[agent])
+                else:
+                    # Unparseable reply or the timeout placeholder is a failed call, not an
+                    # answer - consult the domains separately and synthesize below
+                    selected_agents = known_plan or ['Sales']
+                    print(f"   ⚠️ Unusable supervisor reply, consulting {selected_agents} separately")
+
+                if known_plan is not None:
+                    print(f"   📋 Plan ({plan_source}): Consult {selected_agents}\n{'='*60}\n")
+                else:
+                    print(f"   📋 Plan: Consult {selected_agents}\n{'='*60}\n")
+
             except Exception as e:
                 error_msg = str(e)
                 # Detect auth errors specifically
@@ -790,45 +1333,55 @@ For example:
                         'executed_nodes': [node_config['id']]
                     }
                 else:
-                    print(f"   ⚠️ Planning error: {e}, defaulting to Sales")
-                    selected_agents = ['Sales']
+                    selected_agents = known_plan or ['Sales']
+                    print(f"   ⚠️ Planning error: {e}, consulting {selected_agents} separately")
         else:
             selected_agents = ['Sales']
         
-        # STEP 2: Generate comprehensive response considering selected domains
-        print(f"   🔄 Generating response from {', '.join(selected_agents)}... (this may take 20-30s)")
-        # (In a full implementation, we'd actually call each agent. Here we simulate.)
+        # STEP 2: Consult each selected domain concurrently, then synthesize
+        # (skipped when the fused planning call already produced the answer)
+        agents_csv = ', '.join(selected_agents)
+        if final_response is None:
+            print(f"   🔄 Consulting {agents_csv} in parallel... (this may take 10-20s)")
         
-        aggregation_prompt = f"""System: {system_prompt}
-
-You are the Head of Analytics for a UK grocery retailer. 
-
-User's Question: "{user_prompt}"
-
-Your Plan: You decided to consult these specialist agents: {', '.join(selected_agents)}
-
-Previous agent data received:
-{json.dumps(agent_results, indent=2, default=str) if agent_results else "No prior data"}
-
-Now provide a COMPREHENSIVE answer that synthesizes insights from the domains you selected ({', '.join(selected_agents)}).
-
-For each domain you're consulting, provide specific insights:
-{chr(10).join([f"- {agent}: [Provide relevant analysis for this domain]" for agent in selected_agents])}
-
-Structure your response as:
-1. **Executive Summary** (2-3 sentences answering the question directly)
-2. **Analysis by Domain** (bullet points for each agent you consulted)
-3. **Root Cause / Key Insight** (what's the main finding)
-4. **Recommended Action** (what should be done)
-
-Use realistic example metrics (e.g., "Margin dropped 2.1% in Scotland due to...")"""
+            def consult_domain(agent: str) -> str:
+                return snowflake_client.cortex_complete(
+                    model=model,
+                    prompt=_DOMAIN_PROMPT.substitute(
+                        system_prompt=system_prompt, agent=agent, user_prompt=user_prompt, prior_data=prior_data
+                    ),
+                    options={'temperature': 0.5, 'max_tokens': 1024}
+                )
+        
+            # Each Cortex call is I/O bound on Snowflake, so one thread per domain overlaps them.
+            # Analyses are streamed to the UI as each one lands rather than after the slowest.
+            analyses_by_agent = {}
+            with ThreadPoolExecutor(max_workers=len(selected_agents)) as pool:
+                futures = {pool.submit(consult_domain, agent): agent for agent in selected_agents}
+                for future in as_completed(futures):
+                    agent = futures[future]
+                    try:
+                        analysis = future.result()
+                    except Exception as e:
+                        print(f"   ⚠️ {agent} analysis failed: {e}")
+                        analysis = f"(analysis unavailable: {e})"
+                    analyses_by_agent[agent] = analysis
+                    publish_analysis(agent, analysis)
+            domain_analyses = [f"### {agent}\n{analyses_by_agent[agent]}" for agent in selected_agents]
+        
+            analyses_text = "\n".join(domain_analyses)
+            aggregation_prompt = _AGGREGATION_PROMPT.substitute(
+                system_prompt=system_prompt, user_prompt=user_prompt,
+                agents_csv=agents_csv, analyses_text=analyses_text
+            )
 
         try:
-            final_response = snowflake_client.cortex_complete(
-                model=model,
-                prompt=aggregation_prompt,
-                options={'temperature': 0.5, 'max_tokens': 4096}
-            )
+            if final_response is None:
+                final_response = snowflake_client.cortex_complete(
+                    model=model,
+                    prompt=aggregation_prompt,
+                    options={'temperature': 0.5, 'max_tokens': 1024}
+                )
             print(f"   ✅ Supervisor response generated ({len(final_response)} chars)")
             
             # Store results in shared location for fan-in completion
@@ -849,12 +1402,13 @@ Use realistic example metrics (e.g., "Margin dropped 2.1% in Scotland due to..."
                     'planning_strategy': strategy,
                 },
                 'selected_agents': selected_agents,  # Store in state for conditional routing
+                'selected_tokens': frozenset().union(*map(_name_tokens, selected_agents)),
                 'messages': [
                     f"👔 Supervisor '{label}' received query",
                     f"🧠 Planning: Analyzing which agents are needed...",
-                    f"📋 Plan: Consulting {len(selected_agents)} agents: {', '.join(selected_agents)}",
+                    f"📋 Plan: Consulting {len(selected_agents)} agents: {agents_csv}",
                     f"🔄 Dispatching requests to selected agents...",
-                    f"📥 Aggregating responses from {', '.join(selected_agents)}",
+                    f"📥 Aggregating responses from {agents_csv}",
                     f"✅ Supervisor synthesized final response"
                 ],
                 'current_node': node_config['id'],
@@ -871,21 +1425,18 @@ Use realistic example metrics (e.g., "Margin dropped 2.1% in Scotland due to..."
 
 def create_output_node(node_config: Dict):
     """Create a node function that formats output"""
+    node_id = node_config.get('id', '')
+    data = node_config.get('data', {})
+    label = data.get('label', 'Output')
+    
     def output_node(state: WorkflowState) -> Dict:
-        import time
-        node_id = node_config.get('id', '')
-        
         # Use execution plan timing
         execution_timing = state.get('execution_timing', {})
         delay = execution_timing.get(node_id, {}).get('delay', 0.1)
-        time.sleep(delay)
+        _pace(delay)
         
         # traced_node handles notification
         
-        data = node_config.get('data', {})
-        output_type = data.get('outputType', 'display')
-        label = data.get('label', 'Output')
-        
         # If we have multiple agent results, combine them
         agent_results = state.get('agent_results', [])
         existing_response = state.get('results', {}).get('agent_response')
@@ -898,12 +1449,20 @@ def create_output_node(node_config: Dict):
         combined_response = ""
         
         if agent_results and not existing_response:
-            # Combine agent results if not already aggregated
+            # Combine agent results if not already aggregated - identical responses
+            # (e.g. several simulated agents answering from one template) are kept once
+            seen_responses = set()
+            unique_results = []
+            for r in agent_results:
+                response = r.get('response', '')
+                if response not in seen_responses:
+                    seen_responses.add(response)
+                    unique_results.append(r)
             combined_response = "\n\n---\n\n".join([
                 f"**{r.get('agent', 'Agent')}**:\n{r.get('response', '')}"
-                for r in agent_results
+                for r in unique_results
             ])
-            print(f"📤 Output '{label}': Aggregated {len(agent_results)} agent responses ({len(combined_response)} chars)")
+            print(f"📤 Output '{label}': Aggregated {len(unique_results)}/{len(agent_results)} unique agent responses ({len(combined_response)} chars)")
         elif existing_response:
             combined_response = existing_response
             print(f"📤 Output '{label}': Using existing response ({len(existing_response)} chars)")
@@ -917,7 +1476,6 @@ def create_output_node(node_config: Dict):
         
         # Always return results, even if empty
         final_results = {
-            **state.get('results', {}),
             'agent_response': combined_response or '',
             'response': combined_response or ''
         }
@@ -933,17 +1491,26 @@ def create_output_node(node_config: Dict):
     return output_node
 
 
+# Cortex SQL functions run by the cortex node: (expression over input column c, response when no row comes back)
+_CORTEX_FUNCTION_SQL = {
+    'summarize': ("SNOWFLAKE.CORTEX.SUMMARIZE(c)", "No summary"),
+    'sentiment': ("SNOWFLAKE.CORTEX.SENTIMENT(c)", "No sentiment"),
+    'translate': ("SNOWFLAKE.CORTEX.TRANSLATE(c, 'en', %s)", "No translation"),
+}
+_CORTEX_BATCH_MAX = 100  # Rows sent per cortex node statement
+
+
 def create_cortex_node(node_config: Dict):
     """Create a node function for Cortex AI functions"""
     node_id = node_config.get('id', 'cortex')
     
+    data = node_config.get('data', {})
+    cortex_function = data.get('cortexFunction', 'complete')
+    source_column = data.get('sourceColumn', '')
+    label = data.get('label', 'Cortex')
+    
     def cortex_node(state: WorkflowState) -> Dict:
         # traced_node handles notification
-        data = node_config.get('data', {})
-        cortex_function = data.get('cortexFunction', 'complete')
-        source_column = data.get('sourceColumn', '')
-        label = data.get('label', 'Cortex')
-        
         records = state.get('data', [])
         if not records:
             return {
@@ -952,24 +1519,31 @@ def create_cortex_node(node_config: Dict):
             }
         
         try:
-            if cortex_function == 'summarize':
-                text = str(records[0].get(source_column, '')) if source_column else json.dumps(records[:5], default=str)
-                safe_text = text.replace("'", "''")[:4000]
-                result = snowflake_client.execute_query(f"SELECT SNOWFLAKE.CORTEX.SUMMARIZE('{safe_text}') as result")
-                response = result['RESULT'].iloc[0] if not result.empty else "No summary"
-                
-            elif cortex_function == 'sentiment':
-                text = str(records[0].get(source_column, '')) if source_column else str(records[0])
-                safe_text = text.replace("'", "''")[:4000]
-                result = snowflake_client.execute_query(f"SELECT SNOWFLAKE.CORTEX.SENTIMENT('{safe_text}') as result")
-                response = f"Sentiment score: {result['RESULT'].iloc[0]}" if not result.empty else "No sentiment"
+            if cortex_function in _CORTEX_FUNCTION_SQL:
+                expr, empty_response = _CORTEX_FUNCTION_SQL[cortex_function]
+                if source_column:
+                    texts = [str(r.get(source_column, ''))[:4000] for r in records[:_CORTEX_BATCH_MAX]]
+                elif cortex_function == 'summarize':
+                    texts = [_json_dumps(records[:5])[:4000]]
+                else:
+                    texts = [str(records[0])[:4000]]
+                params = tuple(texts)
+                if cortex_function == 'translate':
+                    params = (data.get('targetLanguage', 'es'),) + params
                 
-            elif cortex_function == 'translate':
-                target_lang = data.get('targetLanguage', 'es')
-                text = str(records[0].get(source_column, '')) if source_column else str(records[0])
-                safe_text = text.replace("'", "''")[:4000]
-                result = snowflake_client.execute_query(f"SELECT SNOWFLAKE.CORTEX.TRANSLATE('{safe_text}', 'en', '{target_lang}') as result")
-                response = result['RESULT'].iloc[0] if not result.empty else "No translation"
+                # Every row goes through one statement (one round trip) as bound VALUES rows -
+                # no escaping, and the text only varies with the row count
+                values = ", ".join(f"({i}, %s)" for i in range(len(texts)))
+                result = snowflake_client.execute_query(
+                    f"SELECT {expr} as result FROM (VALUES {values}) AS v(i, c) ORDER BY i", params=params
+                )
+                outputs = [str(v) for v in result['RESULT']] if not result.empty else []
+                if not outputs:
+                    response = empty_response
+                elif cortex_function == 'sentiment':
+                    response = f"Sentiment score: {outputs[0]}" if len(outputs) == 1 else f"Sentiment scores: {', '.join(outputs)}"
+                else:
+                    response = "\n\n".join(outputs)
                 
             else:
                 prompt = data.get('prompt', 'Analyze this data')
@@ -977,7 +1551,7 @@ def create_cortex_node(node_config: Dict):
                 response = snowflake_client.cortex_complete(model, prompt)
             
             return {
-                'results': {**state.get('results', {}), 'cortex_response': response},
+                'results': {'cortex_response': response},
                 'messages': [f"{label} ({cortex_function}) completed"],
                 'current_node': node_config['id']
             }
@@ -991,21 +1565,19 @@ def create_cortex_node(node_config: Dict):
 
 def create_condition_node(node_config: Dict):
     """Create a condition/branching node"""
+    node_id = node_config.get('id', '')
+    data = node_config.get('data', {})
+    condition = data.get('condition', 'True')
+    label = data.get('label', 'Condition')
+    
     def condition_node(state: WorkflowState) -> Dict:
-        import time
-        node_id = node_config.get('id', '')
-        
         # Use execution plan timing
         execution_timing = state.get('execution_timing', {})
         delay = execution_timing.get(node_id, {}).get('delay', 0.08)
-        time.sleep(delay)
+        _pace(delay)
         
         # traced_node handles notification
         
-        data = node_config.get('data', {})
-        condition = data.get('condition', 'True')
-        label = data.get('label', 'Condition')
-        
         return {
             'messages': [f"Condition '{label}' evaluated: {condition}"],
             'current_node': node_config['id']
@@ -1013,6 +1585,41 @@ def create_condition_node(node_config: Dict):
     return condition_node
 
 
+# Shared HTTP client for external agents - one connection pool for the process lifetime,
+# so repeated calls to the same host skip the TCP/TLS handshake
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None  # Present when httpx[http2] is installed
+
+_http_client: Optional[httpx.Client] = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    """Get the shared pooled HTTP client (created on first use)"""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = httpx.Client(
+                    http2=_HTTP2_AVAILABLE,
+                    timeout=30.0,
+                    limits=httpx.Limits(max_keepalive_connections=32, max_connections=128)
+                )
+    return _http_client
+
+
+def close_http_client():
+    """Close the shared HTTP client - call on app shutdown"""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+
+
+# Label keywords marking an external agent as an output/callback agent (single-pass scan)
+_OUTPUT_AGENT_RE = re.compile(r'render|callback|output|display|visualization', re.IGNORECASE)
+
+
 def create_external_agent_node(node_config: Dict):
     """Create an external API/agent node that makes real HTTP calls
     
@@ -1023,33 +1630,34 @@ def create_external_agent_node(node_config: Dict):
     - Salesforce Einstein
     - ServiceNow
     """
-    import httpx
+    data = node_config.get('data', {})
+    endpoint = data.get('endpoint', '')
+    method = data.get('method', 'POST')
+    label = data.get('label', 'External Agent')
+    agent_type = data.get('agentType', 'rest')
+    auth_type = data.get('authType', 'none')
+    auth_token = data.get('authToken', '')
+    api_key = data.get('apiKey', '')
+    headers_json = data.get('headersJson', '')
+    node_id = node_config.get('id', '')
+    mock_config = data.get('mock', {})
+    provider = data.get('provider', '')
+    
+    label_lower = label.lower()
+    label_tokens = _name_tokens(label_lower)
+    # Output/callback agents always execute - the label is fixed, so classify it once
+    is_output_agent = bool(_OUTPUT_AGENT_RE.search(label_lower))
     
     def external_agent_node(state: WorkflowState) -> Dict:
-        data = node_config.get('data', {})
-        endpoint = data.get('endpoint', '')
-        method = data.get('method', 'POST')
-        label = data.get('label', 'External Agent')
-        agent_type = data.get('agentType', 'rest')
-        auth_type = data.get('authType', 'none')
-        auth_token = data.get('authToken', '')
-        api_key = data.get('apiKey', '')
         api_key_header = data.get('apiKeyHeader', 'X-API-Key')
-        headers_json = data.get('headersJson', '')
         
         # Check if this agent is in the selected list (for Supervisor-controlled execution)
         # BUT: Only filter if this is a domain/analysis agent. Output/callback agents always execute.
-        is_output_agent = any(keyword in label.lower() for keyword in ['render', 'callback', 'output', 'display', 'visualization'])
-        
         selected_agents = state.get('selected_agents', [])
         if selected_agents and not is_output_agent:
-            is_selected = False
-            for sel in selected_agents:
-                sel_lower = sel.lower()
-                name_lower = label.lower()
-                if sel_lower in name_lower or any(word in name_lower for word in sel_lower.split() if len(word) > 2):
-                    is_selected = True
-                    break
+            # Token overlap first (one set intersection); substring check only catches run-together labels
+            sel_tokens = state.get('selected_tokens') or frozenset().union(*map(_name_tokens, selected_agents))
+            is_selected = bool(label_tokens & sel_tokens) or any(sel.lower() in label_lower for sel in selected_agents)
             
             if not is_selected:
                 print(f"⏭️  EXTERNAL AGENT SKIPPED: {label} (not in selected_agents: {selected_agents})")
@@ -1057,22 +1665,17 @@ def create_external_agent_node(node_config: Dict):
                     'messages': [f"⏭️ Skipped {label} (not selected for this query)"]
                 }
         
-        import time
         # Use execution plan timing or mock config
-        node_id = node_config.get('id', '')
-        mock_config = data.get('mock', {})
         if 'delay' in mock_config:
             time.sleep(mock_config['delay'])
         else:
             execution_timing = state.get('execution_timing', {})
             delay = execution_timing.get(node_id, {}).get('delay', 0.15)
-            time.sleep(delay)
+            _pace(delay)
         
         # Notify streaming
         # traced_node handles notification
         
-        provider = data.get('provider', '')
-        
         print(f"\n🌐 EXTERNAL AGENT: {label}")
         print(f"   Type: {agent_type}")
         print(f"   Endpoint: {endpoint}")
@@ -1089,7 +1692,7 @@ def create_external_agent_node(node_config: Dict):
         # Merge user-specified headers (best-effort JSON)
         if isinstance(headers_json, str) and headers_json.strip():
             try:
-                extra = json.loads(headers_json)
+                extra = _json_loads(headers_json)
                 if isinstance(extra, dict):
                     for k, v in extra.items():
                         if k and v is not None:
@@ -1108,13 +1711,14 @@ def create_external_agent_node(node_config: Dict):
         # Build request payload based on agent type
         context_data = state.get('data', [])[:5]
         previous_results = state.get('results', {})
+        context_json = _json_dumps(context_data)
         
         if agent_type == 'copilot':
             # Microsoft Copilot / Graph API format
             payload = {
                 'messages': [{
                     'role': 'user',
-                    'content': f"Based on this data context, provide insights: {json.dumps(context_data, default=str)}"
+                    'content': f"Based on this data context, provide insights: {context_json}"
                 }]
             }
         elif agent_type == 'openai':
@@ -1125,7 +1729,7 @@ def create_external_agent_node(node_config: Dict):
                 'model': model,
                 'messages': [
                     {'role': 'system', 'content': system_prompt},
-                    {'role': 'user', 'content': f"Analyze this data: {json.dumps(context_data, default=str)}"}
+                    {'role': 'user', 'content': f"Analyze this data: {context_json}"}
                 ],
                 'temperature': 0.7,
                 'max_tokens': 2048
@@ -1133,73 +1737,73 @@ def create_external_agent_node(node_config: Dict):
         elif agent_type == 'salesforce':
             # Salesforce Einstein format
             payload = {
-                'query': json.dumps(context_data, default=str),
+                'query': context_json,
                 'modelId': data.get('modelId', 'default')
             }
         elif agent_type == 'servicenow':
             # ServiceNow incident/request format
             payload = {
                 'short_description': f"Request from SnowFlow: {label}",
-                'description': json.dumps(context_data, default=str),
+                'description': context_json,
                 'urgency': data.get('urgency', '3'),
                 'impact': data.get('impact', '3')
             }
         else:
             # Generic REST payload
             payload = {
-                'context': json.dumps(context_data, default=str),
-                'previous_results': json.dumps(previous_results, default=str),
+                'context': context_json,
+                'previous_results': _json_dumps(previous_results),
                 'query': data.get('query', '')
             }
         
         try:
-            # Make the HTTP request
-            with httpx.Client(timeout=30.0) as client:
-                if method == 'GET':
-                    response = client.get(endpoint, headers=headers, params=payload)
-                elif method == 'POST':
-                    response = client.post(endpoint, headers=headers, json=payload)
-                elif method == 'PUT':
-                    response = client.put(endpoint, headers=headers, json=payload)
+            # Make the HTTP request on the shared pooled client (keep-alive across nodes and runs)
+            client = get_http_client()
+            if method == 'GET':
+                response = client.get(endpoint, headers=headers, params=payload)
+            elif method == 'POST':
+                response = client.post(endpoint, headers=headers, json=payload)
+            elif method == 'PUT':
+                response = client.put(endpoint, headers=headers, json=payload)
+            else:
+                response = client.post(endpoint, headers=headers, json=payload)
+            
+            print(f"   Status: {response.status_code}")
+            
+            if response.status_code >= 200 and response.status_code < 300:
+                # Parse the raw body bytes directly - skips httpx's text decode before the JSON parse
+                result = _json_loads(response.content) if response.headers.get('content-type', '').startswith('application/json') else response.text
+                
+                # Extract the actual response based on agent type
+                if agent_type == 'openai' and isinstance(result, dict):
+                    agent_response = result.get('choices', [{}])[0].get('message', {}).get('content', str(result))
+                elif agent_type == 'copilot' and isinstance(result, dict):
+                    agent_response = result.get('value', result.get('content', str(result)))
                 else:
-                    response = client.post(endpoint, headers=headers, json=payload)
+                    agent_response = str(result)
                 
-                print(f"   Status: {response.status_code}")
+                print(f"   ✅ {label} completed successfully")
                 
-                if response.status_code >= 200 and response.status_code < 300:
-                    result = response.json() if response.headers.get('content-type', '').startswith('application/json') else response.text
-                    
-                    # Extract the actual response based on agent type
-                    if agent_type == 'openai' and isinstance(result, dict):
-                        agent_response = result.get('choices', [{}])[0].get('message', {}).get('content', str(result))
-                    elif agent_type == 'copilot' and isinstance(result, dict):
-                        agent_response = result.get('value', result.get('content', str(result)))
-                    else:
-                        agent_response = str(result)
-                    
-                    print(f"   ✅ {label} completed successfully")
-                    
-                    return {
-                        'results': {
-                            **state.get('results', {}),
-                            'external_agent_response': agent_response,
-                            'external_agent': label,
-                            'provider': provider
-                        },
-                        'agent_results': [{
-                            'agent': label,
-                            'response': agent_response,
-                            'provider': provider,
-                            'type': 'external'
-                        }],
-                        'messages': [f"{label} ({provider or agent_type}): Received response"],
-                        'current_node': node_config['id'],
-                        'executed_nodes': [node_config['id']]
-                    }
-                else:
-                    # For demo: return simulated response on auth/other errors
-                    print(f"   ⚠️ HTTP {response.status_code} - returning simulated response for demo")
-                    simulated = f"""[Simulated {provider or agent_type} Response]
+                return {
+                    'results': {
+                        'external_agent_response': agent_response,
+                        'external_agent': label,
+                        'provider': provider
+                    },
+                    'agent_results': [{
+                        'agent': label,
+                        'response': agent_response,
+                        'provider': provider,
+                        'type': 'external'
+                    }],
+                    'messages': [f"{label} ({provider or agent_type}): Received response"],
+                    'current_node': node_config['id'],
+                    'executed_nodes': [node_config['id']]
+                }
+            else:
+                # For demo: return simulated response on auth/other errors
+                print(f"   ⚠️ HTTP {response.status_code} - returning simulated response for demo")
+                simulated = f"""[Simulated {provider or agent_type} Response]
 
 Based on the support ticket data provided, I've analyzed the request:
 
@@ -1211,20 +1815,20 @@ Based on the support ticket data provided, I've analyzed the request:
 3. Search Teams conversations for context
 
 **Note:** This is a simulated response. In production, this would connect to the real {provider or 'external'} API with proper OAuth authentication."""
-                    
-                    return {
-                        'agent_results': [{
-                            'agent': label,
-                            'response': simulated,
-                            'provider': provider,
-                            'type': 'external',
-                            'simulated': True
-                        }],
-                        'messages': [f"🔶 {label} (Microsoft): Simulated response (auth required for real API)"],
-                        'executed_nodes': [node_config['id']],
-                        'simulated_nodes': [node_config['id']]
-                    }
-                    
+                
+                return {
+                    'agent_results': [{
+                        'agent': label,
+                        'response': simulated,
+                        'provider': provider,
+                        'type': 'external',
+                        'simulated': True
+                    }],
+                    'messages': [f"🔶 {label} (Microsoft): Simulated response (auth required for real API)"],
+                    'executed_nodes': [node_config['id']],
+                    'simulated_nodes': [node_config['id']]
+                }
+                
         except httpx.TimeoutException:
             print(f"   ❌ Timeout")
             return {
@@ -1252,17 +1856,56 @@ Based on the support ticket data provided, I've analyzed the request:
     return external_agent_node
 
 
+# Large payloads (uploaded file content) are parked here instead of riding in the results
+# dict that LangGraph merges every step and that the complete event sends to the browser.
+# State carries '<field>_ref' instead; readers go through _resolve_blob.
+_BLOB_MIN_CHARS = 8192
+_BLOBS_MAX = 32
+_blobs: OrderedDict = OrderedDict()
+_blobs_lock = threading.Lock()
+
+
+def _blob_field(node_id: str, field: str, value: Any) -> Dict[str, Any]:
+    """{field: value} for small values, {field_ref: key} with the value stored aside otherwise"""
+    if not isinstance(value, str) or len(value) < _BLOB_MIN_CHARS:
+        return {field: value}
+    key = f"{node_id}:{uuid.uuid4().hex}"
+    with _blobs_lock:
+        _blobs[key] = value
+        while len(_blobs) > _BLOBS_MAX:
+            _blobs.popitem(last=False)  # Oldest runs' payloads go first
+    return {f"{field}_ref": key}
+
+
+def _resolve_blob(results: Dict[str, Any], field: str, default: Any = '') -> Any:
+    """Value of field in results, following a '<field>_ref' into the blob store when present
+
+    Raises LookupError for a ref whose payload was already evicted, so the node fails
+    loudly instead of reading it as missing input.
+    """
+    ref = results.get(f"{field}_ref")
+    if ref is not None:
+        with _blobs_lock:
+            value = _blobs.get(ref)
+        if value is None:
+            logger.warning("Blob for '%s' (%s) was evicted before it was read", field, ref)
+            raise LookupError(f"'{field}' payload is no longer available (evicted from the blob store) - re-run the workflow")
+        return value
+    return results.get(field, default)
+
+
 def create_file_input_node(node_config: Dict):
     """Create a file input node that loads file content into state"""
     node_id = node_config.get('id', 'file-input')
     
+    data = node_config.get('data', {})
+    label = data.get('label', 'File Input')
+    file_type = data.get('fileType', 'tmdl')
+    file_name = data.get('fileName', '')
+    
     def file_input_node(state: WorkflowState) -> Dict:
         # traced_node handles notification
-        data = node_config.get('data', {})
-        label = data.get('label', 'File Input')
-        file_type = data.get('fileType', 'tmdl')
         file_content = data.get('fileContent', '')
-        file_name = data.get('fileName', '')
         
         print(f"\n📄 FILE INPUT: {label}")
         print(f"   Type: {file_type}")
@@ -1275,8 +1918,7 @@ def create_file_input_node(node_config: Dict):
         
         return {
             'results': {
-                **state.get('results', {}),
-                'file_content': file_content,
+                **_blob_field(node_id, 'file_content', file_content),
                 'file_type': file_type,
                 'file_name': file_name
             },
@@ -1286,6 +1928,48 @@ def create_file_input_node(node_config: Dict):
     return file_input_node
 
 
+# Schema extraction prompt - parsed once; only the format and file content slots change per call
+_EXTRACTION_PROMPT = string.Template("""You are a semantic model expert. Parse the following ${source_format_upper} semantic model definition and extract it into the Semantic Model Interchange JSON format.
+
+INPUT (${source_format}):
+${file_content}
+
+Extract and output a valid JSON object with this structure:
+{
+  "version": "1.0",
+  "metadata": {
+    "name": "model name",
+    "description": "description",
+    "source_platform": "${source_format}"
+  },
+  "tables": [
+    {
+      "name": "table_name",
+      "description": "table description",
+      "table_type": "fact|dimension",
+      "columns": [
+        {"name": "col", "data_type": "TYPE", "description": "desc", "synonyms": ["alias1"]}
+      ]
+    }
+  ],
+  "relationships": [
+    {"from_table": "t1", "from_column": "c1", "to_table": "t2", "to_column": "c2", "cardinality": "many_to_one"}
+  ],
+  "measures": [
+    {
+      "name": "Measure Name",
+      "description": "what it calculates",
+      "original_expression": {"platform": "${source_format}", "language": "DAX", "code": "SUM(...)"},
+      "suggested_sql": "SUM(...)",
+      "translation_confidence": "high|medium|low"
+    }
+  ],
+  "sample_questions": ["What is total X?", "Show Y by Z"]
+}
+
+Output ONLY valid JSON, no explanation.""")
+
+
 def create_schema_extractor_node(node_config: Dict):
     """Create a schema extractor node that uses LLM to parse source format into interchange JSON
     
@@ -1297,19 +1981,19 @@ def create_schema_extractor_node(node_config: Dict):
     import httpx
     node_id = node_config.get('id', 'schema-extractor')
     
+    data = node_config.get('data', {})
+    label = data.get('label', 'Schema Extractor')
+    source_format = data.get('sourceFormat', 'powerbi')
+    extraction_agent = data.get('extractionAgent', 'copilot')
+    model = data.get('model', 'mistral-large2')
+    
     def schema_extractor_node(state: WorkflowState) -> Dict:
         # traced_node handles notification
-        data = node_config.get('data', {})
-        label = data.get('label', 'Schema Extractor')
-        source_format = data.get('sourceFormat', 'powerbi')
-        extraction_agent = data.get('extractionAgent', 'copilot')
-        model = data.get('model', 'mistral-large2')
-        
         print(f"\n🔄 SCHEMA EXTRACTOR: {label}")
         print(f"   Source: {source_format}")
         print(f"   Agent: {extraction_agent}")
         
-        file_content = state.get('results', {}).get('file_content', '')
+        file_content = _resolve_blob(state.get('results', {}), 'file_content')
         
         if not file_content:
             return {
@@ -1318,45 +2002,11 @@ def create_schema_extractor_node(node_config: Dict):
             }
         
         # Build extraction prompt
-        extraction_prompt = f"""You are a semantic model expert. Parse the following {source_format.upper()} semantic model definition and extract it into the Semantic Model Interchange JSON format.
-
-INPUT ({source_format}):
-{file_content[:8000]}
-
-Extract and output a valid JSON object with this structure:
-{{
-  "version": "1.0",
-  "metadata": {{
-    "name": "model name",
-    "description": "description",
-    "source_platform": "{source_format}"
-  }},
-  "tables": [
-    {{
-      "name": "table_name",
-      "description": "table description",
-      "table_type": "fact|dimension",
-      "columns": [
-        {{"name": "col", "data_type": "TYPE", "description": "desc", "synonyms": ["alias1"]}}
-      ]
-    }}
-  ],
-  "relationships": [
-    {{"from_table": "t1", "from_column": "c1", "to_table": "t2", "to_column": "c2", "cardinality": "many_to_one"}}
-  ],
-  "measures": [
-    {{
-      "name": "Measure Name",
-      "description": "what it calculates",
-      "original_expression": {{"platform": "{source_format}", "language": "DAX", "code": "SUM(...)"}},
-      "suggested_sql": "SUM(...)",
-      "translation_confidence": "high|medium|low"
-    }}
-  ],
-  "sample_questions": ["What is total X?", "Show Y by Z"]
-}}
-
-Output ONLY valid JSON, no explanation."""
+        extraction_prompt = _EXTRACTION_PROMPT.substitute(
+            source_format=source_format,
+            source_format_upper=source_format.upper(),
+            file_content=file_content[:8000]
+        )
 
         try:
             # Always use a valid Cortex model for the actual LLM call
@@ -1368,7 +2018,7 @@ Output ONLY valid JSON, no explanation."""
                 print(f"   🤖 Using Microsoft Copilot (simulated via Cortex for demo)")
                 # In production, this would call Microsoft Graph API / Copilot
                 # For demo, we simulate the response using Cortex but label it as Copilot
-                response = snowflake_client.cortex_complete(
+                response = cortex_batcher.complete(
                     model=cortex_model,
                     prompt=f"[Acting as Microsoft Copilot with Power BI expertise]\n\n{extraction_prompt}",
                     options={'temperature': 0.2, 'max_tokens': 4096}
@@ -1376,7 +2026,7 @@ Output ONLY valid JSON, no explanation."""
                 agent_used = "Microsoft Copilot (simulated)"
             elif extraction_agent == 'openai':
                 print(f"   🤖 Using OpenAI GPT-4 (simulated via Cortex for demo)")
-                response = snowflake_client.cortex_complete(
+                response = cortex_batcher.complete(
                     model=cortex_model,
                     prompt=extraction_prompt,
                     options={'temperature': 0.2, 'max_tokens': 4096}
@@ -1384,7 +2034,7 @@ Output ONLY valid JSON, no explanation."""
                 agent_used = "OpenAI GPT-4 (simulated)"
             else:
                 print(f"   ❄️ Using Snowflake Cortex ({cortex_model})")
-                response = snowflake_client.cortex_complete(
+                response = cortex_batcher.complete(
                     model=cortex_model,
                     prompt=extraction_prompt,
                     options={'temperature': 0.2, 'max_tokens': 4096}
@@ -1393,7 +2043,7 @@ Output ONLY valid JSON, no explanation."""
             
             # Try to parse and validate JSON
             try:
-                interchange_json = json.loads(response)
+                interchange_json = _json_loads(response)
                 print(f"   ✅ Extracted {len(interchange_json.get('tables', []))} tables")
                 print(f"   ✅ Extracted {len(interchange_json.get('measures', []))} measures")
             except json.JSONDecodeError:
@@ -1403,7 +2053,6 @@ Output ONLY valid JSON, no explanation."""
             
             return {
                 'results': {
-                    **state.get('results', {}),
                     'interchange_json': interchange_json,
                     'extraction_agent': agent_used
                 },
@@ -1416,7 +2065,6 @@ Output ONLY valid JSON, no explanation."""
             interchange_json = _get_demo_interchange_json(source_format)
             return {
                 'results': {
-                    **state.get('results', {}),
                     'interchange_json': interchange_json,
                     'extraction_agent': f"Demo Fallback (error: {str(e)[:50]})"
                 },
@@ -1426,57 +2074,16 @@ Output ONLY valid JSON, no explanation."""
     return schema_extractor_node
 
 
-def create_schema_transformer_node(node_config: Dict):
-    """Create a schema transformer node that converts interchange JSON to target format
-    
-    Multi-Agent Support:
-    - cortex: Uses Snowflake Cortex (recommended for Snowflake output)
-    - openai: Uses OpenAI GPT-4
-    """
-    node_id = node_config.get('id', 'schema-transformer')
-    
-    def schema_transformer_node(state: WorkflowState) -> Dict:
-        # traced_node handles notification
-        data = node_config.get('data', {})
-        label = data.get('label', 'Schema Transformer')
-        target_format = data.get('targetFormat', 'snowflake')
-        transformation_agent = data.get('transformationAgent', 'cortex')
-        model = data.get('model', 'mistral-large2')
-        target_database = data.get('database', 'SNOWFLOW_DEV')
-        target_schema = data.get('schema', 'DEMO')
-        
-        print(f"\n🔄 SCHEMA TRANSFORMER: {label}")
-        print(f"   Target: {target_format}")
-        print(f"   Agent: {transformation_agent}")
-        print(f"   Database: {target_database}.{target_schema}")
-        
-        results = state.get('results', {})
-        interchange_json = results.get('interchange_json', {})
-        
-        # Handle case where extractor passed raw text instead of JSON
-        if not interchange_json or interchange_json.get('parse_error'):
-            raw_response = interchange_json.get('raw_response', '') if isinstance(interchange_json, dict) else str(interchange_json)
-            if raw_response:
-                print(f"   ⚠️ Using raw extractor output (not parsed JSON)")
-                # Use raw response as context for transformation
-                interchange_json = {"raw_schema": raw_response}
-            else:
-                # Check if we have DAX translation results
-                # DAX translation doesn't provide real schema - use demo YAML to avoid slow Cortex call
-                sql_output = results.get('sql_output', '')
-                dax_input = results.get('dax_input', '')
-                if sql_output or dax_input:
-                    print(f"   📊 DAX translation context detected - using fast demo YAML")
-                    # Skip slow Cortex call for DAX context - return demo YAML immediately
-                    demo_yaml = f'''name: black_friday_analytics
+# Demo Cortex Analyst YAML returned when the transformer has no real schema to work from
+_DEMO_YAML_DAX = string.Template('''name: black_friday_analytics
 description: Black Friday retail analytics semantic model (from DAX translation)
 
 tables:
   - name: sales_transactions
     description: Sales data translated from Power BI TMDL
     base_table:
-      database: {target_database}
-      schema: {target_schema}
+      database: $database
+      schema: $schema
       table: SALES_TRANSACTIONS
     dimensions:
       - name: product_category
@@ -1491,33 +2098,17 @@ tables:
         expr: SUM(REVENUE)
         data_type: NUMBER
         default_aggregation: sum
-'''
-                    print(f"   ✅ Generated YAML from DAX context ({len(demo_yaml)} chars)")
-                    # Store YAML in shared results for frontend download
-                    update_shared_results('generated_yaml', demo_yaml)
-                    return {
-                        'results': {
-                            **results,
-                            'generated_yaml': demo_yaml,
-                            'target_format': target_format,
-                            'transformation_agent': 'DAX Context Generator',
-                            'multi_agent_summary': f"YAML generated from DAX translation for {target_database}.{target_schema}"
-                        },
-                        'messages': [f"{label}: Generated Cortex Analyst YAML from DAX context"],
-                        'current_node': node_config['id']
-                    }
-                else:
-                    # Generate demo YAML for Black Friday template
-                    print(f"   ⚠️ No input schema - generating demo YAML for Cortex Analyst")
-                    demo_yaml = f'''name: black_friday_analytics
+''')
+
+_DEMO_YAML_FULL = string.Template('''name: black_friday_analytics
 description: Black Friday retail analytics semantic model
 
 tables:
   - name: sales_transactions
     description: Black Friday sales transactions
     base_table:
-      database: {target_database}
-      schema: {target_schema}
+      database: $database
+      schema: $schema
       table: SALES_TRANSACTIONS
     dimensions:
       - name: product_category
@@ -1549,21 +2140,86 @@ tables:
         expr: AVG(GROSS_MARGIN_PCT)
         data_type: NUMBER
         default_aggregation: avg
-'''
-                    print(f"   ✅ Generated demo YAML ({len(demo_yaml)} chars)")
-                    # Store YAML in shared results for frontend download
-                    update_shared_results('generated_yaml', demo_yaml)
-                    return {
-                        'results': {
-                            **results,
-                            'generated_yaml': demo_yaml,
-                            'target_format': target_format,
-                            'transformation_agent': 'Demo Generator',
-                            'multi_agent_summary': f"Demo YAML generated for {target_database}.{target_schema}"
-                        },
-                        'messages': [f"{label}: Generated demo Cortex Analyst YAML"],
-                        'current_node': node_config['id']
-                }
+''')
+
+
+def _demo_yaml_result(node_id: str, label: str, yaml_content: str, target_format: str,
+                      agent: str, summary: str, message: str) -> Dict:
+    """State update for the transformer's demo YAML paths (no Cortex call)"""
+    logger.info("   ✅ Generated demo YAML (%d chars)", len(yaml_content))
+    # Store YAML in shared results for frontend download
+    update_shared_results('generated_yaml', yaml_content)
+    return {
+        'results': {
+            'generated_yaml': yaml_content,
+            'target_format': target_format,
+            'transformation_agent': agent,
+            'multi_agent_summary': summary
+        },
+        'messages': [f"{label}: {message}"],
+        'current_node': node_id
+    }
+
+
+def create_schema_transformer_node(node_config: Dict):
+    """Create a schema transformer node that converts interchange JSON to target format
+    
+    Multi-Agent Support:
+    - cortex: Uses Snowflake Cortex (recommended for Snowflake output)
+    - openai: Uses OpenAI GPT-4
+    """
+    node_id = node_config.get('id', 'schema-transformer')
+    
+    data = node_config.get('data', {})
+    label = data.get('label', 'Schema Transformer')
+    target_format = data.get('targetFormat', 'snowflake')
+    transformation_agent = data.get('transformationAgent', 'cortex')
+    model = data.get('model', 'mistral-large2')
+    target_database = data.get('database', 'SNOWFLOW_DEV')
+    target_schema = data.get('schema', 'DEMO')
+    # Only the target location varies - fill the demo YAML once per node
+    demo_yaml_dax = _DEMO_YAML_DAX.substitute(database=target_database, schema=target_schema)
+    demo_yaml_full = _DEMO_YAML_FULL.substitute(database=target_database, schema=target_schema)
+    # Cached YAML is only reused for the same model and target
+    cache_scope = f"{model}|{target_format}|{target_database}.{target_schema}"
+    
+    def schema_transformer_node(state: WorkflowState) -> Dict:
+        # traced_node handles notification
+        logger.info("\n🔄 SCHEMA TRANSFORMER: %s", label)
+        logger.debug("   Target: %s", target_format)
+        logger.debug("   Agent: %s", transformation_agent)
+        logger.debug("   Database: %s.%s", target_database, target_schema)
+        
+        results = state.get('results', {})
+        interchange_json = results.get('interchange_json', {})
+        
+        # Handle case where extractor passed raw text instead of JSON
+        if not interchange_json or interchange_json.get('parse_error'):
+            raw_response = interchange_json.get('raw_response', '') if isinstance(interchange_json, dict) else str(interchange_json)
+            if raw_response:
+                logger.warning("   ⚠️ Using raw extractor output (not parsed JSON)")
+                # Use raw response as context for transformation
+                interchange_json = {"raw_schema": raw_response}
+            else:
+                # Check if we have DAX translation results
+                # DAX translation doesn't provide real schema - use demo YAML to avoid slow Cortex call
+                sql_output = results.get('sql_output', '')
+                dax_input = results.get('dax_input', '')
+                if sql_output or dax_input:
+                    # Skip slow Cortex call for DAX context - return demo YAML immediately
+                    logger.info("   📊 DAX translation context detected - using fast demo YAML")
+                    return _demo_yaml_result(
+                        node_id, label, demo_yaml_dax, target_format, 'DAX Context Generator',
+                        f"YAML generated from DAX translation for {target_database}.{target_schema}",
+                        "Generated Cortex Analyst YAML from DAX context"
+                    )
+                # Generate demo YAML for Black Friday template
+                logger.warning("   ⚠️ No input schema - generating demo YAML for Cortex Analyst")
+                return _demo_yaml_result(
+                    node_id, label, demo_yaml_full, target_format, 'Demo Generator',
+                    f"Demo YAML generated for {target_database}.{target_schema}",
+                    "Generated demo Cortex Analyst YAML"
+                )
         
         # Build transformation prompt based on target
         if target_format == 'snowflake':
@@ -1572,7 +2228,7 @@ tables:
                 input_content = interchange_json['raw_schema'][:8000]
                 input_type = "Raw Schema Definition"
             else:
-                input_content = json.dumps(interchange_json, indent=2)[:8000]
+                input_content = _json_dumps_bounded(interchange_json, 8000, indent=2)
                 input_type = "Interchange JSON"
             
             transform_prompt = f"""You are a Snowflake Cortex semantic model expert. Convert the following {input_type} into a valid Snowflake Cortex Analyst YAML file.
@@ -1633,49 +2289,61 @@ verified_queries:
 
 Output ONLY valid YAML, no explanation or markdown code blocks."""
         else:
-            transform_prompt = f"Convert to {target_format} format: {json.dumps(interchange_json)[:4000]}"
+            input_content = _json_dumps_bounded(interchange_json, 4000)
+            transform_prompt = f"Convert to {target_format} format: {input_content}"
 
         try:
             # Multi-agent routing
             if transformation_agent == 'cortex':
-                print(f"   ❄️ Using Snowflake Cortex")
+                logger.debug("   ❄️ Using Snowflake Cortex")
                 agent_used = "Snowflake Cortex"
             else:
-                print(f"   🤖 Using {transformation_agent}")
+                logger.debug("   🤖 Using %s", transformation_agent)
                 agent_used = transformation_agent
             
-            response = snowflake_client.cortex_complete(
-                model=model,
-                prompt=transform_prompt,
-                options={'temperature': 0.2, 'max_tokens': 4096}
-            )
-            
-            # Clean up response (remove markdown if present)
-            yaml_content = response.strip()
-            if yaml_content.startswith('```'):
-                yaml_content = '\n'.join(yaml_content.split('\n')[1:-1])
+            # Re-runs with the same schema - or one that only differs outside its table/column/
+            # measure names and measure expressions - reuse the earlier YAML
+            signature = schema_signature(interchange_json)
+            yaml_content = semantic_cache.get(cache_scope, input_content, signature)
+            if yaml_content is not None:
+                logger.info("   ♻️ Semantic cache hit - skipping Cortex")
+                agent_used = f"{agent_used} (cached)"
+            else:
+                response = cortex_batcher.complete(
+                    model=model,
+                    prompt=transform_prompt,
+                    options={'temperature': 0.2, 'max_tokens': 4096}
+                )
+                
+                # Clean up response (remove markdown if present)
+                yaml_content = response.strip()
+                if yaml_content.startswith('```'):
+                    # Slice between the opening fence line and the closing fence - no per-line split
+                    first_nl = yaml_content.find('\n')
+                    last_fence = yaml_content.rfind('```')
+                    if first_nl != -1 and last_fence > first_nl:
+                        yaml_content = yaml_content[first_nl + 1:last_fence].rstrip()
+                if yaml_content and not yaml_content.startswith('Analysis timed out'):
+                    semantic_cache.put(cache_scope, input_content, yaml_content, signature)
             
-            print(f"   ✅ Generated {target_format} YAML ({len(yaml_content)} chars)")
+            logger.info("   ✅ Generated %s YAML (%d chars)", target_format, len(yaml_content))
             
             # Store YAML in shared results for frontend download
             update_shared_results('generated_yaml', yaml_content)
             
-            # Get extraction agent from previous step
-            extraction_agent = state.get('results', {}).get('extraction_agent', 'Unknown')
-            
             return {
                 'results': {
-                    **state.get('results', {}),
                     'generated_yaml': yaml_content,
                     'target_format': target_format,
                     'transformation_agent': agent_used,
-                    'multi_agent_summary': f"Extraction: {extraction_agent} → Transformation: {agent_used}"
+                    # Extraction agent from the previous step - only looked up on success
+                    'multi_agent_summary': f"Extraction: {results.get('extraction_agent', 'Unknown')} → Transformation: {agent_used}"
                 },
                 'messages': [f"{label}: {agent_used} transformed to {target_format} YAML"],
                 'current_node': node_config['id']
             }
         except Exception as e:
-            print(f"   ❌ Error: {str(e)}")
+            logger.error("   ❌ Error: %s", e)
             return {
                 'error': str(e),
                 'messages': [f"{label} error: {str(e)}"]
@@ -1683,36 +2351,64 @@ Output ONLY valid YAML, no explanation or markdown code blocks."""
     return schema_transformer_node
 
 
+# Markdown summary shown for a completed schema migration
+_FILE_OUTPUT_PREVIEW_CHARS = 4000
+_TRUNC_SUFFIX = '...\n\n(truncated for display)'
+_FILE_OUTPUT_RESPONSE = string.Template("""## Schema Migration Complete! 🎉
+
+### Multi-Agent Orchestration Summary
+- **Extraction Agent:** $extraction_agent
+- **Transformation Agent:** $transformation_agent
+- **Flow:** $multi_agent_summary
+
+### Output Details
+- **Format:** $output_format
+- **Size:** $size characters$stage_info
+
+---
+
+### Generated $output_format Content
+
+```yaml
+$body
+```
+
+---
+*This semantic model was migrated using agent-to-agent translation.*
+*Copy the YAML above to use with Snowflake Cortex Analyst.*""")
+
+
 def create_file_output_node(node_config: Dict):
     """Create a file output node that prepares content for download and optionally writes to Snowflake stage"""
+    data = node_config.get('data', {})
+    label = data.get('label', 'File Output')
+    output_format = data.get('outputFormat', 'yaml')
+    output_format_upper = output_format.upper()
+    
+    # Stage write configuration
+    write_to_stage = data.get('writeToStage', False)
+    stage_database = data.get('stageDatabase', '')
+    stage_schema = data.get('stageSchema', '')
+    stage_name = data.get('stageName', '')
+    stage_filename = data.get('stageFilename', f'output.{output_format}')
+    
     def file_output_node(state: WorkflowState) -> Dict:
-        data = node_config.get('data', {})
-        label = data.get('label', 'File Output')
-        output_format = data.get('outputFormat', 'yaml')
-        
-        # Stage write configuration
-        write_to_stage = data.get('writeToStage', False)
-        stage_database = data.get('stageDatabase', '')
-        stage_schema = data.get('stageSchema', '')
-        stage_name = data.get('stageName', '')
-        stage_filename = data.get('stageFilename', f'output.{output_format}')
-        
-        print(f"\n📥 FILE OUTPUT: {label}")
-        print(f"   Format: {output_format}")
+        logger.info("\n📥 FILE OUTPUT: %s", label)
+        logger.debug("   Format: %s", output_format)
         
         results = state.get('results', {})
         
         if output_format == 'yaml':
             content = results.get('generated_yaml', '')
         elif output_format == 'json':
-            content = json.dumps(results.get('interchange_json', {}), indent=2)
+            content = _json_dumps_pretty(results.get('interchange_json', {}))
         else:
             content = str(results)
         
         if content:
-            print(f"   ✅ Output ready ({len(content)} chars)")
+            logger.info("   ✅ Output ready (%d chars)", len(content))
         else:
-            print(f"   ⚠️ No content to output")
+            logger.warning("   ⚠️ No content to output")
         
         # Stage write result
         stage_write_status = None
@@ -1720,7 +2416,7 @@ def create_file_output_node(node_config: Dict):
         
         # Optionally write to Snowflake stage
         if write_to_stage and stage_database and stage_schema and stage_name and content:
-            print(f"   📤 Writing to Snowflake stage: @{stage_database}.{stage_schema}.{stage_name}/{stage_filename}")
+            logger.info("   📤 Writing to Snowflake stage: @%s.%s.%s/%s", stage_database, stage_schema, stage_name, stage_filename)
             try:
                 from snowflake_client import snowflake_client
                 result = snowflake_client.write_to_stage(
@@ -1733,21 +2429,27 @@ def create_file_output_node(node_config: Dict):
                 if result.get('success'):
                     stage_write_status = 'success'
                     stage_write_message = result.get('message', 'Successfully uploaded')
-                    print(f"   ✅ {stage_write_message}")
+                    logger.info("   ✅ %s", stage_write_message)
                 else:
                     stage_write_status = 'error'
                     stage_write_message = result.get('error', 'Unknown error')
-                    print(f"   ❌ Failed: {stage_write_message}")
+                    logger.error("   ❌ Failed: %s", stage_write_message)
             except Exception as e:
                 stage_write_status = 'error'
                 stage_write_message = str(e)
-                print(f"   ❌ Exception: {e}")
+                logger.error("   ❌ Exception: %s", e)
         
         # Get multi-agent summary
         multi_agent_summary = results.get('multi_agent_summary', 'Single agent workflow')
         extraction_agent = results.get('extraction_agent', 'N/A')
         transformation_agent = results.get('transformation_agent', 'N/A')
         
+        # Only long content is sliced for the inline preview
+        if len(content) > _FILE_OUTPUT_PREVIEW_CHARS:
+            body = content[:_FILE_OUTPUT_PREVIEW_CHARS] + _TRUNC_SUFFIX
+        else:
+            body = content
+        
         # Build stage info for response
         stage_info = ""
         if write_to_stage and stage_write_status:
@@ -1758,35 +2460,21 @@ def create_file_output_node(node_config: Dict):
         
         return {
             'results': {
-                **results,
                 'output_content': content,
                 'output_format': output_format,
                 'stage_write_status': stage_write_status,
                 'stage_write_message': stage_write_message,
-                'agent_response': f"""## Schema Migration Complete! 🎉
-
-### Multi-Agent Orchestration Summary
-- **Extraction Agent:** {extraction_agent}
-- **Transformation Agent:** {transformation_agent}
-- **Flow:** {multi_agent_summary}
-
-### Output Details
-- **Format:** {output_format.upper()}
-- **Size:** {len(content)} characters{stage_info}
-
----
-
-### Generated {output_format.upper()} Content
-
-```yaml
-{content[:4000]}{'...\n\n(truncated for display)' if len(content) > 4000 else ''}
-```
-
----
-*This semantic model was migrated using agent-to-agent translation.*
-*Copy the YAML above to use with Snowflake Cortex Analyst.*"""
+                'agent_response': _FILE_OUTPUT_RESPONSE.substitute(
+                    extraction_agent=extraction_agent,
+                    transformation_agent=transformation_agent,
+                    multi_agent_summary=multi_agent_summary,
+                    output_format=output_format_upper,
+                    size=len(content),
+                    stage_info=stage_info,
+                    body=body
+                )
             },
-            'messages': [f"{label}: {output_format.upper()} ready for download"],
+            'messages': [f"{label}: {output_format_upper} ready for download"],
             'current_node': node_config['id']
         }
     return file_output_node
@@ -1831,8 +2519,60 @@ model Sales_Analytics
 '''
 
 
+# Source-format-independent parts of the demo interchange JSON, built once at import.
+# Every cached per-format document shares these objects - they are read-only.
+_DEMO_INTERCHANGE_TABLES = [
+    {
+        "name": "Sales",
+        "description": "Sales transactions fact table",
+        "table_type": "fact",
+        "columns": [
+            {"name": "ProductID", "data_type": "INT64", "description": "Product identifier"},
+            {"name": "Amount", "data_type": "DECIMAL", "description": "Sale amount"},
+            {"name": "Quantity", "data_type": "INT64", "description": "Units sold"},
+            {"name": "DateKey", "data_type": "INT64", "description": "Date key for time intelligence"}
+        ]
+    },
+    {
+        "name": "Date",
+        "description": "Date dimension table",
+        "table_type": "dimension",
+        "columns": [
+            {"name": "Date", "data_type": "DATE", "description": "Calendar date"},
+            {"name": "Year", "data_type": "INT64", "description": "Year"},
+            {"name": "Month", "data_type": "INT64", "description": "Month number"}
+        ]
+    }
+]
+
+# (name, description, DAX code, suggested SQL, translation confidence)
+_DEMO_INTERCHANGE_MEASURES = (
+    ("Total Revenue", "Sum of all sales amounts", "SUM(Sales[Amount])",
+     "SUM(sales.amount)", "high"),
+    ("Avg Order Value", "Average order value", "DIVIDE(SUM(Sales[Amount]), COUNT(Sales[ProductID]), 0)",
+     "COALESCE(SUM(sales.amount) / NULLIF(COUNT(sales.product_id), 0), 0)", "high"),
+    ("YoY Growth", "Year over year growth percentage",
+     "DIVIDE(SUM(Sales[Amount]) - CALCULATE(SUM(Sales[Amount]), SAMEPERIODLASTYEAR(Date[Date])), CALCULATE(SUM(Sales[Amount]), SAMEPERIODLASTYEAR(Date[Date])), 0)",
+     "/* YoY calculation requires LAG window function */", "medium"),
+)
+
+_DEMO_INTERCHANGE_RELATIONSHIPS = [
+    {"from_table": "Sales", "from_column": "DateKey", "to_table": "Date", "to_column": "DateKey", "cardinality": "many_to_one"}
+]
+
+_DEMO_INTERCHANGE_QUESTIONS = [
+    "What was total revenue last month?",
+    "Show sales by product category",
+    "What is the year-over-year growth?"
+]
+
+
+@lru_cache(maxsize=8)
 def _get_demo_interchange_json(source_format: str) -> Dict:
-    """Return demo interchange JSON when Cortex is unavailable"""
+    """Return demo interchange JSON when Cortex is unavailable
+    
+    Cached per source format - downstream nodes only read it, so treat as read-only.
+    """
     return {
         "version": "1.0",
         "metadata": {
@@ -1840,63 +2580,26 @@ def _get_demo_interchange_json(source_format: str) -> Dict:
             "description": "Demo model extracted from Power BI TMDL",
             "source_platform": source_format
         },
-        "tables": [
-            {
-                "name": "Sales",
-                "description": "Sales transactions fact table",
-                "table_type": "fact",
-                "columns": [
-                    {"name": "ProductID", "data_type": "INT64", "description": "Product identifier"},
-                    {"name": "Amount", "data_type": "DECIMAL", "description": "Sale amount"},
-                    {"name": "Quantity", "data_type": "INT64", "description": "Units sold"},
-                    {"name": "DateKey", "data_type": "INT64", "description": "Date key for time intelligence"}
-                ]
-            },
-            {
-                "name": "Date",
-                "description": "Date dimension table",
-                "table_type": "dimension",
-                "columns": [
-                    {"name": "Date", "data_type": "DATE", "description": "Calendar date"},
-                    {"name": "Year", "data_type": "INT64", "description": "Year"},
-                    {"name": "Month", "data_type": "INT64", "description": "Month number"}
-                ]
-            }
-        ],
+        "tables": _DEMO_INTERCHANGE_TABLES,
         "measures": [
             {
-                "name": "Total Revenue",
-                "description": "Sum of all sales amounts",
-                "original_expression": {"platform": source_format, "language": "DAX", "code": "SUM(Sales[Amount])"},
-                "suggested_sql": "SUM(sales.amount)",
-                "translation_confidence": "high"
-            },
-            {
-                "name": "Avg Order Value",
-                "description": "Average order value",
-                "original_expression": {"platform": source_format, "language": "DAX", "code": "DIVIDE(SUM(Sales[Amount]), COUNT(Sales[ProductID]), 0)"},
-                "suggested_sql": "COALESCE(SUM(sales.amount) / NULLIF(COUNT(sales.product_id), 0), 0)",
-                "translation_confidence": "high"
-            },
-            {
-                "name": "YoY Growth",
-                "description": "Year over year growth percentage",
-                "original_expression": {"platform": source_format, "language": "DAX", "code": "DIVIDE(SUM(Sales[Amount]) - CALCULATE(SUM(Sales[Amount]), SAMEPERIODLASTYEAR(Date[Date])), CALCULATE(SUM(Sales[Amount]), SAMEPERIODLASTYEAR(Date[Date])), 0)"},
-                "suggested_sql": "/* YoY calculation requires LAG window function */",
-                "translation_confidence": "medium"
+                "name": name,
+                "description": description,
+                "original_expression": {"platform": source_format, "language": "DAX", "code": code},
+                "suggested_sql": suggested_sql,
+                "translation_confidence": confidence
             }
+            for name, description, code, suggested_sql, confidence in _DEMO_INTERCHANGE_MEASURES
         ],
-        "relationships": [
-            {"from_table": "Sales", "from_column": "DateKey", "to_table": "Date", "to_column": "DateKey", "cardinality": "many_to_one"}
-        ],
-        "sample_questions": [
-            "What was total revenue last month?",
-            "Show sales by product category",
-            "What is the year-over-year growth?"
-        ]
+        "relationships": _DEMO_INTERCHANGE_RELATIONSHIPS,
+        "sample_questions": _DEMO_INTERCHANGE_QUESTIONS
     }
 
 
+# First `measure 'Name' = <DAX>` definition in TMDL content (body runs to the next measure or end)
+_TMDL_MEASURE_RE = re.compile(r"measure\s+'([^']+)'\s*=\s*(.+?)(?=\n\s*measure|\n\s*$)", re.DOTALL | re.IGNORECASE)
+
+
 def create_dax_translator_node(node_config: Dict):
     """Create a DAX Translator node that converts DAX expressions to Snowflake SQL
     
@@ -1905,26 +2608,25 @@ def create_dax_translator_node(node_config: Dict):
     2. Apply pattern-based translation
     3. Optionally enhance with Cortex LLM
     """
+    data = node_config.get('data', {})
+    label = data.get('label', 'DAX Translator')
+    
     def dax_translator_node(state: WorkflowState) -> Dict:
-        data = node_config.get('data', {})
-        label = data.get('label', 'DAX Translator')
         dax_expression = data.get('daxExpression', '')
-        auto_translate = data.get('autoTranslate', True)
         
-        print(f"\n⚡ DAX TRANSLATOR: {label}")
-        print(f"   DAX: {dax_expression[:50]}..." if len(dax_expression) > 50 else f"   DAX: {dax_expression}")
+        logger.info("\n⚡ DAX TRANSLATOR: %s", label)
+        logger.debug("   DAX: %.50s%s", dax_expression, "..." if len(dax_expression) > 50 else "")
         
         # Get TMDL content from upstream file input if available
         results = state.get('results', {})
-        file_content = results.get('file_content', '')
+        file_content = _resolve_blob(results, 'file_content')
         
         if not dax_expression and file_content:
             # Extract first measure from TMDL for demo
-            import re
-            measure_match = re.search(r"measure\s+'([^']+)'\s*=\s*(.+?)(?=\n\s*measure|\n\s*$)", file_content, re.DOTALL | re.IGNORECASE)
+            measure_match = _TMDL_MEASURE_RE.search(file_content)
             if measure_match:
                 dax_expression = measure_match.group(2).strip()
-                print(f"   Extracted from TMDL: {dax_expression[:50]}...")
+                logger.debug("   Extracted from TMDL: %.50s...", dax_expression)
         
         if not dax_expression:
             return {
@@ -1939,13 +2641,12 @@ def create_dax_translator_node(node_config: Dict):
             context = create_sample_retail_context()
             result = translate_dax(dax_expression, context)
             
-            print(f"   ✅ Translated with {result.confidence.name} confidence")
-            print(f"   SQL: {result.sql[:60]}...")
-            print(f"   Patterns: {result.patterns_applied}")
+            logger.info("   ✅ Translated with %s confidence", result.confidence.name)
+            logger.debug("   SQL: %.60s...", result.sql)
+            logger.debug("   Patterns: %s", result.patterns_applied)
             
             return {
                 'results': {
-                    **results,
                     'dax_input': dax_expression,
                     'sql_output': result.sql,
                     'translation_confidence': result.confidence.name,
@@ -1957,7 +2658,7 @@ def create_dax_translator_node(node_config: Dict):
                 'current_node': node_config['id']
             }
         except Exception as e:
-            print(f"   ❌ Error: {str(e)}")
+            logger.error("   ❌ Error: %s", e)
             return {
                 'error': str(e),
                 'messages': [f"{label} error: {str(e)}"]
@@ -1968,22 +2669,23 @@ def create_dax_translator_node(node_config: Dict):
 
 def create_semantic_model_node(node_config: Dict):
     """Create a semantic model node"""
+    data = node_config.get('data', {})
+    label = data.get('label', 'Semantic Model')
+    database = data.get('database', '')
+    schema = data.get('schema', '')
+    stage = data.get('stage', '')
+    yaml_file = data.get('yamlFile', '')
+    
     def semantic_model_node(state: WorkflowState) -> Dict:
         # NOTE: Timing and tracing handled by traced_node wrapper
-        data = node_config.get('data', {})
         node_id = node_config.get('id', '')
-        label = data.get('label', 'Semantic Model')
-        database = data.get('database', '')
-        schema = data.get('schema', '')
-        stage = data.get('stage', '')
-        yaml_file = data.get('yamlFile', '')
         
         # Use semanticPath from Data Catalog if available, otherwise construct it
         semantic_path = data.get('semanticPath', '')
         if not semantic_path and database and schema and stage and yaml_file:
             semantic_path = f"@{database}.{schema}.{stage}/{yaml_file}"
         
-        print(f"📊 SEMANTIC VIEW LOADED: {label}" + (f" from {yaml_file}" if yaml_file else ""))
+        logger.info("📊 SEMANTIC VIEW LOADED: %s%s", label, f" from {yaml_file}" if yaml_file else "")
         
         # Store semantic model info in state for agents to use
         # This enables Cortex Analyst integration
@@ -2052,6 +2754,44 @@ def _generate_default_timing(nodes: List[Dict]) -> Dict[str, Dict[str, Any]]:
     return timing
 
 
+# Node types that do agent work, and those a router may dispatch to
+# (semantic models act as proxies to their connected agents)
+_AGENT_TYPES = frozenset({'agent', 'externalAgent', 'cortexAgent'})
+_ROUTABLE_TYPES = _AGENT_TYPES | {'semanticModel'}
+# Supervisor targets whose label contains one of these always execute (not agent-selected)
+_ALWAYS_EXECUTE_RE = re.compile(r'callback|output|render|display')
+
+def _add_once(seen: set, key) -> bool:
+    """Add key to seen, returning False if it was already there - one hash lookup instead of two"""
+    size = len(seen)
+    seen.add(key)
+    return len(seen) != size
+
+
+def _identity_factory(node: Dict) -> Callable:
+    """Fallback for unknown node types - a pass-through that still gets traced"""
+    return lambda s: s
+
+
+# Node type -> factory for every node built from its config alone (routers are wired in build_graph)
+_NODE_FACTORIES: Dict[str, Callable[[Dict], Callable]] = {
+    'snowflakeSource': create_source_node,
+    'semanticModel': create_semantic_model_node,
+    'agent': create_agent_node,
+    'cortexAgent': create_agent_node,  # Specialized agent - same handler
+    'output': create_output_node,
+    'cortex': create_cortex_node,
+    'condition': create_condition_node,
+    'externalAgent': create_external_agent_node,
+    'supervisor': create_supervisor_node,
+    'fileInput': create_file_input_node,
+    'schemaExtractor': create_schema_extractor_node,
+    'schemaTransformer': create_schema_transformer_node,
+    'fileOutput': create_file_output_node,
+    'daxTranslator': create_dax_translator_node,
+}
+
+
 def build_graph(nodes: List[Dict], edges: List[Dict]) -> StateGraph:
     """
     Build a LangGraph from the visual node/edge representation
@@ -2062,27 +2802,33 @@ def build_graph(nodes: List[Dict], edges: List[Dict]) -> StateGraph:
     """
     workflow = StateGraph(WorkflowState)
     
-    node_map = {n['id']: n for n in nodes}
+    # Interned ids let the (source, target) edge tuples below reuse cached string hashes
+    node_map = {sys.intern(n['id']): n for n in nodes}
+    
+    # (type, data, label, label_lower) of every node, resolved once so the wiring below
+    # indexes one tuple instead of chaining .get() defaults. Label falls back to the id.
+    node_info: Dict[str, tuple] = {}
+    for nid, n in node_map.items():
+        n_data = n.get('data') or {}
+        n_label = n_data.get('label', nid)
+        node_info[nid] = (n.get('type', ''), n_data, n_label, n_label.lower())
     
     # Build adjacency list from edges
-    adjacency: Dict[str, List[str]] = {}
-    incoming: Dict[str, List[str]] = {n['id']: [] for n in nodes}
+    adjacency: defaultdict = defaultdict(list)
+    incoming: defaultdict = defaultdict(list)
     
     for edge in edges:
-        source = edge['source']
-        target = edge['target']
-        if source not in adjacency:
-            adjacency[source] = []
+        source = sys.intern(edge['source'])
+        target = sys.intern(edge['target'])
         adjacency[source].append(target)
-        print(f"[DEBUG] Edge found: {source} → {target}")
-        if target in incoming:
-            incoming[target].append(source)
+        logger.debug("[DEBUG] Edge found: %s → %s", source, target)
+        incoming[target].append(source)
     
-    # Find start nodes (no incoming edges)
-    start_nodes = [nid for nid, sources in incoming.items() if len(sources) == 0]
+    # Find start nodes (no incoming edges) - .get() so lookups don't add empty entries
+    start_nodes = [nid for nid in node_map if not incoming.get(nid)]
     
     # Find end nodes (no outgoing edges)
-    end_nodes = [nid for nid in node_map.keys() if nid not in adjacency or len(adjacency[nid]) == 0]
+    end_nodes = [nid for nid in node_map if not adjacency.get(nid)]
     
     # Identify router nodes and their target agents
     router_info: Dict[str, Dict] = {}
@@ -2106,84 +2852,50 @@ def build_graph(nodes: List[Dict], edges: List[Dict]) -> StateGraph:
             # Get agent labels for matching
             target_agents = []
             for t in targets:
-                if t in node_map:
+                if t in node_info:
+                    t_type, t_data, _, _ = node_info[t]
                     target_agents.append({
                         'id': t,
-                        'label': node_map[t].get('data', {}).get('label', ''),
-                        'type': node_map[t].get('type', '')
+                        'label': t_data.get('label', ''),
+                        'type': t_type
                     })
             router_info[router_id] = {
                 'node': node,
                 'targets': target_agents,
-                'routes': node.get('data', {}).get('routes', [])
+                'routes': node_info[router_id][1].get('routes', [])
             }
     
     # Identify which agents are router-controlled (they only execute via routing)
-    router_controlled_agents = set()
-    for router_id, info in router_info.items():
-        for agent in info['targets']:
-            if agent['type'] in ('agent', 'externalAgent', 'cortexAgent'):
-                router_controlled_agents.add(agent['id'])
+    router_controlled_agents = {
+        agent['id'] for info in router_info.values() for agent in info['targets'] if agent['type'] in _AGENT_TYPES
+    }
     
-    print(f"DEBUG: Router-controlled agents: {router_controlled_agents}")
+    logger.debug("DEBUG: Router-controlled agents: %s", router_controlled_agents)
     
     # ═══════════════════════════════════════════════════════════════════════════
     # ADD NODES TO GRAPH - ALL nodes are wrapped with traced_node for universal tracing
     # This ensures ANY template (including user-created) gets automatic tracing
     # ═══════════════════════════════════════════════════════════════════════════
-    for node in nodes:
-        node_id = node['id']
-        node_type = node.get('type', '')
-        
-        # Create the raw node function based on type
-        if node_type == 'snowflakeSource':
-            raw_fn = create_source_node(node)
-        elif node_type == 'semanticModel':
-            raw_fn = create_semantic_model_node(node)
-        elif node_type == 'agent':
-            raw_fn = create_agent_node(node)
-        elif node_type == 'cortexAgent':
-            # cortexAgent is a specialized agent - use same handler
-            raw_fn = create_agent_node(node)
-        elif node_type == 'output':
-            raw_fn = create_output_node(node)
-        elif node_type == 'cortex':
-            raw_fn = create_cortex_node(node)
-        elif node_type == 'condition':
-            raw_fn = create_condition_node(node)
-        elif node_type == 'externalAgent':
-            raw_fn = create_external_agent_node(node)
-        elif node_type == 'router':
-            raw_fn = create_router_node(node, router_info[node_id]['targets'])
-        elif node_type == 'supervisor':
-            raw_fn = create_supervisor_node(node)
-        elif node_type == 'fileInput':
-            raw_fn = create_file_input_node(node)
-        elif node_type == 'schemaExtractor':
-            raw_fn = create_schema_extractor_node(node)
-        elif node_type == 'schemaTransformer':
-            raw_fn = create_schema_transformer_node(node)
-        elif node_type == 'fileOutput':
-            raw_fn = create_file_output_node(node)
-        elif node_type == 'daxTranslator':
-            # DAX Translator node - create inline handler
-            raw_fn = create_dax_translator_node(node)
-        else:
-            # Fallback for unknown node types - still trace them!
-            raw_fn = lambda s: s
-        
-        # WRAP WITH UNIVERSAL TRACING - this is the key!
-        # Every node, regardless of type, gets automatic tracing
-        traced_fn = traced_node(node_id, raw_fn)
-        workflow.add_node(node_id, traced_fn)
+    # Resolve each node's factory in one pass - routers also need their resolved targets
+    def router_factory(node: Dict) -> Callable:
+        return create_router_node(node, router_info[node['id']]['targets'])
+    
+    compiled = [
+        (n['id'], router_factory if n['id'] in router_info else _NODE_FACTORIES.get(n.get('type', ''), _identity_factory), n)
+        for n in nodes
+    ]
+    
+    # WRAP WITH UNIVERSAL TRACING - this is the key!
+    # Every node, regardless of type, gets automatic tracing
+    for node_id, factory, node in compiled:
+        workflow.add_node(node_id, traced_node(node_id, factory(node)))
     
     # Track which edges we've already added (to avoid duplicates)
     added_edges = set()
     
     # Add edges - special handling for routers
     for source, targets in adjacency.items():
-        source_node = node_map.get(source, {})
-        source_type = source_node.get('type', '')
+        source_type = node_info[source][0] if source in node_info else ''
         
         if source_type == 'router':
             # For router, use conditional edges to route to ONE agent (or external agent)
@@ -2192,63 +2904,53 @@ def build_graph(nodes: List[Dict], edges: List[Dict]) -> StateGraph:
             
             # Include agent, externalAgent, AND semanticModel as valid routing targets
             # (semantic models act as proxies to their connected agents)
-            agent_targets = [t['id'] for t in info['targets'] if t['type'] in ('agent', 'externalAgent', 'cortexAgent', 'semanticModel')]
+            agent_targets = [t['id'] for t in info['targets'] if t['type'] in _ROUTABLE_TYPES]
             
-            print(f"DEBUG: Router '{source}' targets: {[(t['id'], t['type'], t['label']) for t in info['targets']]}")
-            print(f"DEBUG: Agent targets for routing: {agent_targets}")
-            print(f"DEBUG: Route names: {route_names}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("DEBUG: Router '%s' targets: %s", source, [(t['id'], t['type'], t['label']) for t in info['targets']])
+                logger.debug("DEBUG: Agent targets for routing: %s", agent_targets)
+                logger.debug("DEBUG: Route names: %s", route_names)
             
             if agent_targets:
                 # Create routing function that matches intent to agent/semantic model
                 def make_router_fn(target_ids, agent_info, route_list):
+                    # Targets are fixed once the graph is built - lowercase labels and compile the matcher once
+                    matcher = _RouteMatcher([
+                        (target['id'], target.get('label', '').lower(), route_list[i].lower() if i < len(route_list) else '')
+                        for i, target in enumerate(agent_info)
+                    ])
+                    
                     def router_fn(state: WorkflowState) -> str | list:
                         decision = state.get('routing_decision', '').lower().strip()
                         is_multi = state.get('multi_route', False) or decision == 'all'
                         
-                        print(f"DEBUG: Router routing decision = '{decision}' (multi={is_multi})")
-                        print(f"DEBUG: Available targets: {[(a.get('id'), a.get('label')) for a in agent_info]}")
+                        logger.debug("DEBUG: Router routing decision = '%s' (multi=%s)", decision, is_multi)
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("DEBUG: Available targets: %s", [(a.get('id'), a.get('label')) for a in agent_info])
                         
                         # If ALL/multi-domain, return first target but mark for broadcast
                         # The supervisor will aggregate all agent results
                         if is_multi:
-                            print(f"DEBUG: 🔄 MULTI-DOMAIN - triggering first target, supervisor will broadcast")
+                            logger.debug("DEBUG: 🔄 MULTI-DOMAIN - triggering first target, supervisor will broadcast")
                             # For multi-domain, we route to first target but the supervisor handles aggregation
                             # This is a simplification - in production we'd use parallel branches
                             return target_ids[0]
                         
                         # Try to match decision to target label or route name
-                        for i, target in enumerate(agent_info):
-                            target_label = target.get('label', '').lower()
-                            route_name = route_list[i].lower() if i < len(route_list) else ''
-                            
-                            # Match if decision contains target label or route name
-                            # Also check for partial matches (e.g., "sales" matches "Sales Cortex SV")
-                            if decision:
-                                decision_words = decision.split()
-                                label_words = target_label.split()
-                                
-                                # Check for word overlap
-                                has_match = (
-                                    decision in target_label or 
-                                    target_label in decision or
-                                    decision in route_name or
-                                    route_name in decision or
-                                    any(dw in target_label for dw in decision_words) or
-                                    any(lw in decision for lw in label_words if len(lw) > 2)
-                                )
-                                
-                                if has_match:
-                                    print(f"DEBUG: ✅ Matched! Routing to {target['id']} ({target_label})")
-                                    return target['id']
+                        # Also check for partial matches (e.g., "sales" matches "Sales Cortex SV")
+                        target_id = matcher.best(decision)
+                        if target_id is not None:
+                            logger.debug("DEBUG: ✅ Matched! Routing to %s", target_id)
+                            return target_id
                         
                         # Default to first target
-                        print(f"DEBUG: ⚠️ No match, defaulting to first target: {target_ids[0]}")
+                        logger.debug("DEBUG: ⚠️ No match, defaulting to first target: %s", target_ids[0])
                         return target_ids[0]
                     return router_fn
                 
                 routing_fn = make_router_fn(agent_targets, info['targets'], route_names)
-                route_map = {t: t for t in agent_targets}
-                workflow.add_conditional_edges(source, routing_fn, route_map)
+                # A list path map means identity routing (the function returns node ids)
+                workflow.add_conditional_edges(source, routing_fn, agent_targets)
                 
                 for t in agent_targets:
                     added_edges.add((source, t))
@@ -2267,105 +2969,118 @@ def build_graph(nodes: List[Dict], edges: List[Dict]) -> StateGraph:
             always_execute = []
             
             for target in targets:
-                target_node = node_map.get(target, {})
-                target_type = target_node.get('type', '')
-                target_data = target_node.get('data', {})
-                target_label = target_data.get('label', target)
+                target_type, _, target_label, target_label_lower = node_info.get(target) or ('', None, target, target.lower())
                 
                 # Callbacks and special nodes always execute
-                if any(kw in target_label.lower() for kw in ['callback', 'output', 'render', 'display']):
+                if _ALWAYS_EXECUTE_RE.search(target_label_lower):
                     always_execute.append(target)
-                elif target_type in ('agent', 'externalAgent', 'cortexAgent') or target.startswith('agent-'):
+                elif target_type in _AGENT_TYPES or target.startswith('agent-'):
                     # Include cortexAgent type and any node with agent- prefix
                     agent_targets.append((target, target_label))
                 else:
                     always_execute.append(target)
             
-            print(f"[SUPERVISOR ROUTING] Agent targets: {[(a[0], a[1]) for a in agent_targets]}")
-            print(f"[SUPERVISOR ROUTING] Always execute: {always_execute}")
+            logger.debug("[SUPERVISOR ROUTING] Agent targets: %s", agent_targets)
+            logger.debug("[SUPERVISOR ROUTING] Always execute: %s", always_execute)
             
             # Add regular edges for always-execute targets
             for target in always_execute:
-                edge_key = (source, target)
-                if edge_key not in added_edges:
-                    print(f"[EDGE] Adding supervisor always-execute edge: {source} → {target}")
+                if _add_once(added_edges, (source, target)):
+                    logger.debug("[EDGE] Adding supervisor always-execute edge: %s → %s", source, target)
                     workflow.add_edge(source, target)
-                    added_edges.add(edge_key)
             
             # Add conditional edges for agent targets
             if agent_targets:
                 def make_supervisor_router(agent_list, supervisor_id):
                     """Create routing function that returns only selected agent node IDs"""
+                    # Inverted index built once per graph: every label word (and its
+                    # 3+ char prefixes) maps to the agent ids whose label contains it
+                    order = {node_id: i for i, (node_id, _) in enumerate(agent_list)}
+                    # Lowercased labels for the substring fallback
+                    agent_labels_lower = [(node_id, label, label.lower()) for node_id, label in agent_list]
+                    label_index: Dict[str, set] = {}
+                    for node_id, label in agent_list:
+                        for word in _TOKEN_SPLIT_RE.split(label.lower()):
+                            for end in range(3, len(word) + 1):
+                                label_index.setdefault(word[:end], set()).add(node_id)
+                    
                     def supervisor_route(state: WorkflowState) -> list:
                         # Check for auth error - don't route to any agents
                         if state.get('auth_error') or state.get('error'):
-                            print(f"[SUPERVISOR ROUTE] ❌ Error detected, skipping all agents")
+                            logger.debug("[SUPERVISOR ROUTE] ❌ Error detected, skipping all agents")
                             return []  # Empty list = skip all agents
                         
                         selected = state.get('selected_agents', [])
                         
-                        print(f"[SUPERVISOR ROUTE] selected_agents from state: {selected}")
-                        print(f"[SUPERVISOR ROUTE] Available agents: {[(a[0], a[1]) for a in agent_list]}")
+                        logger.debug("[SUPERVISOR ROUTE] selected_agents from state: %s", selected)
+                        logger.debug("[SUPERVISOR ROUTE] Available agents: %s", agent_list)
                         
                         if not selected:
                             # No agents selected - default to first agent only (not ALL)
                             default = [agent_list[0][0]] if agent_list else []
-                            print(f"[SUPERVISOR ROUTE] No selection, defaulting to: {default}")
+                            logger.debug("[SUPERVISOR ROUTE] No selection, defaulting to: %s", default)
                             return default
                         
-                        # Match selected agent names to node IDs
-                        activated = []
-                        for node_id, label in agent_list:
-                            for sel in selected:
-                                sel_lower = sel.lower()
-                                label_lower = label.lower()
-                                # Match if selected name appears in label
-                                if (sel_lower in label_lower or 
-                                    any(word in label_lower for word in sel_lower.split() if len(word) > 2)):
-                                    activated.append(node_id)
-                                    print(f"[SUPERVISOR ROUTE] ✅ Matched '{sel}' → {node_id} ({label})")
-                                    break
+                        # Match each selected agent name to node IDs via the label index
+                        matched = set()
+                        unmatched = []
+                        for sel in selected:
+                            sel_words = [w for w in sel.lower().split() if len(w) > 2]
+                            hits = set().union(*(label_index.get(w, ()) for w in sel_words))
+                            if hits:
+                                matched |= hits
+                            else:
+                                unmatched.append(sel)
+                        if matched:
+                            logger.debug("[SUPERVISOR ROUTE] ✅ Matched %s → %s", selected, matched)
+                        
+                        # Fall back to substring matching for the names the index can't see (mid-word matches)
+                        for sel in unmatched:
+                            # The name itself or any of its 3+ char words
+                            sel_lower = sel.lower()
+                            terms = [sel_lower, *(word for word in sel_lower.split() if len(word) > 2)]
+                            pattern = re.compile('|'.join(map(re.escape, terms)))
+                            for node_id, label, label_lower in agent_labels_lower:
+                                if node_id not in matched and pattern.search(label_lower):
+                                    matched.add(node_id)
+                                    logger.debug("[SUPERVISOR ROUTE] ✅ Matched '%s' → %s (%s)", sel, node_id, label)
+                        activated = sorted(matched, key=order.__getitem__)
                         
                         if activated:
-                            print(f"[SUPERVISOR ROUTE] Routing to {len(activated)} agents: {activated}")
+                            logger.debug("[SUPERVISOR ROUTE] Routing to %d agents: %s", len(activated), activated)
                             return activated
                         else:
                             # No matches - default to first agent
                             default = [agent_list[0][0]]
-                            print(f"[SUPERVISOR ROUTE] No matches, defaulting to: {default}")
+                            logger.debug("[SUPERVISOR ROUTE] No matches, defaulting to: %s", default)
                             return default
                     
                     return supervisor_route
                 
                 route_fn = make_supervisor_router(agent_targets, source)
-                route_map = {a[0]: a[0] for a in agent_targets}
+                # A list path map means identity routing (the function returns node ids)
+                route_targets = [a[0] for a in agent_targets]
                 
-                print(f"[EDGE] Adding supervisor conditional edges: {source} → {list(route_map.keys())}")
-                workflow.add_conditional_edges(source, route_fn, route_map)
+                logger.debug("[EDGE] Adding supervisor conditional edges: %s → %s", source, route_targets)
+                workflow.add_conditional_edges(source, route_fn, route_targets)
                 
-                for a in agent_targets:
-                    added_edges.add((source, a[0]))
+                added_edges.update((source, t) for t in route_targets)
         
         elif source in router_controlled_agents:
             # This is an agent that's controlled by a router
             # Only add edges to non-agent targets (like output)
             for target in targets:
-                target_node = node_map.get(target, {})
-                edge_key = (source, target)
-                if edge_key not in added_edges:
+                if _add_once(added_edges, (source, target)):
                     workflow.add_edge(source, target)
-                    added_edges.add(edge_key)
         
         else:
             # Normal edges
             for target in targets:
-                edge_key = (source, target)
-                if edge_key not in added_edges:
-                    print(f"[EDGE] Adding normal edge: {source} → {target}")
+                if _add_once(added_edges, (source, target)):
+                    logger.debug("[EDGE] Adding normal edge: %s → %s", source, target)
                     workflow.add_edge(source, target)
-                    added_edges.add(edge_key)
                 else:
-                    print(f"[EDGE] Skipping duplicate: {source} → {target}")
+                    logger.debug("[EDGE] Skipping duplicate: %s → %s", source, target)
     
     # ═══════════════════════════════════════════════════════════════════════════
     # MULTI-ENTRY POINT HANDLING WITH CONTEXT LOADER
@@ -2376,64 +3091,46 @@ def build_graph(nodes: List[Dict], edges: List[Dict]) -> StateGraph:
     # ═══════════════════════════════════════════════════════════════════════════
     
     if len(start_nodes) > 1:
-        # Categorize start nodes
-        main_entry = None
+        # Categorize start nodes in one pass, ranking main-entry candidates:
+        # the last copilot/file input wins, otherwise the first agent
         context_nodes = []
+        candidates = []
         
-        for sn in start_nodes:
-            node_type = node_map.get(sn, {}).get('type', '')
-            node_label = node_map.get(sn, {}).get('data', {}).get('label', '').lower()
+        for i, sn in enumerate(start_nodes):
+            # Label falls back to the id here, which the copilot check below also tests
+            node_type, _, _, node_label = node_info[sn]
             sn_lower = sn.lower()
             
             # Context nodes: TMDLs, data sources
             if 'tmdl' in sn_lower or 'src-' in sn_lower:
                 context_nodes.append(sn)
-            elif node_type == 'externalAgent' and ('copilot' in node_label or 'copilot' in sn_lower):
-                main_entry = sn
-            elif node_type == 'fileInput':
-                main_entry = sn
-            elif main_entry is None and node_type in ('externalAgent', 'agent', 'cortexAgent'):
-                main_entry = sn
+            elif node_type == 'fileInput' or (node_type == 'externalAgent' and ('copilot' in node_label or 'copilot' in sn_lower)):
+                candidates.append((0, -i, sn))
+            elif node_type in _AGENT_TYPES:
+                candidates.append((1, i, sn))
         
-        if main_entry is None:
-            main_entry = start_nodes[0]
+        main_entry = min(candidates, default=(None, None, start_nodes[0]))[2]
         
-        print(f"DEBUG: Main entry: {main_entry}")
-        print(f"DEBUG: Context nodes to trace: {context_nodes}")
+        logger.debug("DEBUG: Main entry: %s", main_entry)
+        logger.debug("DEBUG: Context nodes to trace: %s", context_nodes)
         
         # Create context loader that traces all context nodes
-        def create_context_loader(ctx_nodes, node_configs):
+        def create_context_loader(ctx_nodes, infos):
+            # Context nodes just contribute their labels - resolve them once per graph
+            ctx_labels = [(ctx_id, infos[ctx_id][2]) for ctx_id in ctx_nodes]
+            
             def context_loader(state: WorkflowState) -> Dict:
                 messages = ['📦 Loading context from data sources...']
                 
-                # Trace each context node
-                for ctx_id in ctx_nodes:
-                    # Send trace event for this context node
-                    eq = get_execution_queue()
+                # Trace each context node back-to-back - the UI animates the transitions itself
+                eq = get_execution_queue()
+                for ctx_id, ctx_label in ctx_labels:
                     if eq:
-                        try:
-                            eq.put_nowait({'type': 'node_executing', 'node_id': ctx_id})
-                            print(f"[TRACE] 🔵 Context node '{ctx_id}' - LOADING")
-                        except:
-                            pass
-                    
-                    # Small delay for visual effect
-                    time.sleep(0.3)
-                    
-                    # Get node config and extract info
-                    ctx_config = node_configs.get(ctx_id, {})
-                    ctx_data = ctx_config.get('data', {})
-                    ctx_label = ctx_data.get('label', ctx_id)
-                    
-                    messages.append(f"📊 Loaded: {ctx_label}")
+                        eq.put_nowait({'type': 'node_executing', 'node_id': ctx_id})
                     print(f"[TRACE] ✅ Context node '{ctx_id}' - LOADED")
-                    
-                    # Send completed event for context node
+                    messages.append(f"📊 Loaded: {ctx_label}")
                     if eq:
-                        try:
-                            eq.put_nowait({'type': 'node_completed', 'node_id': ctx_id})
-                        except:
-                            pass
+                        eq.put_nowait({'type': 'node_completed', 'node_id': ctx_id})
                 
                 return {
                     'messages': messages,
@@ -2442,25 +3139,25 @@ def build_graph(nodes: List[Dict], edges: List[Dict]) -> StateGraph:
             return context_loader
         
         # Add context loader node
-        workflow.add_node("__context_loader__", create_context_loader(context_nodes, node_map))
+        workflow.add_node("__context_loader__", create_context_loader(context_nodes, node_info))
         
         # Set context loader as entry, then connect to main entry
         workflow.set_entry_point("__context_loader__")
         workflow.add_edge("__context_loader__", main_entry)
         
-        print(f"DEBUG: Flow: __context_loader__ → {main_entry}")
+        logger.debug("DEBUG: Flow: __context_loader__ → %s", main_entry)
         
     elif start_nodes:
         workflow.set_entry_point(start_nodes[0])
-        print(f"DEBUG: Single entry point: {start_nodes[0]}")
+        logger.debug("DEBUG: Single entry point: %s", start_nodes[0])
     
     # Set finish points - only for nodes that have no outgoing edges
-    print(f"DEBUG: End nodes identified: {end_nodes}")
+    logger.debug("DEBUG: End nodes identified: %s", end_nodes)
     for end_node in end_nodes:
         # Skip if this is a router (handled by conditional edges)
-        source_type = node_map.get(end_node, {}).get('type', '')
+        source_type = node_info[end_node][0]
         if source_type != 'router':
-            print(f"[EDGE] Adding edge to END: {end_node} → END")
+            logger.debug("[EDGE] Adding edge to END: %s → END", end_node)
             workflow.add_edge(end_node, END)
     
     return workflow.compile()
@@ -2495,6 +3192,7 @@ def execute_workflow(nodes: List[Dict], edges: List[Dict], prompt: Optional[str]
             'routing_decision': '',
             'user_prompt': prompt or '',  # Store the prompt in state for agents to use
             'selected_agents': [],
+            'selected_tokens': frozenset(),
             'executed_nodes': [],
             'simulated_nodes': [],  # Track nodes running in demo/simulated mode
             'execution_timing': execution_timing
@@ -2524,7 +3222,6 @@ def execute_workflow(nodes: List[Dict], edges: List[Dict], prompt: Optional[str]
             'executed_nodes': final_state.get('executed_nodes', [])
         }
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return {
             'success': False,
@@ -2538,10 +3235,110 @@ def execute_workflow(nodes: List[Dict], edges: List[Dict], prompt: Optional[str]
 # NOTE: queue, threading, _thread_local, set_execution_callback, get_execution_queue
 # are defined at the TOP of this file to avoid forward reference issues
 
+def _critical_path_ranks(nodes: List[Dict], edges: List[Dict]) -> Dict[str, int]:
+    """Longest-path depth of each node from the graph's entry nodes (Kahn order DP)
+
+    Nodes on a cycle never reach in-degree zero and keep rank 0.
+    """
+    preds: defaultdict = defaultdict(list)
+    succs: defaultdict = defaultdict(list)
+    for edge in edges:
+        preds[edge.get('target')].append(edge.get('source'))
+        succs[edge.get('source')].append(edge.get('target'))
+    ids = {n['id'] for n in nodes}
+    # Edges from unknown sources can't be resolved - don't let them block their target
+    indegree = {nid: sum(src in ids for src in preds.get(nid, ())) for nid in ids}
+    rank = dict.fromkeys(indegree, 0)
+    ready = deque(nid for nid, d in indegree.items() if d == 0)
+    while ready:
+        nid = ready.popleft()
+        for succ in succs.get(nid, ()):
+            if succ not in ids:
+                continue
+            rank[succ] = max(rank[succ], rank[nid] + 1)
+            indegree[succ] -= 1
+            if indegree[succ] == 0:
+                ready.append(succ)
+    return rank
+
+
+# Fixed fan-in timeline lines for well-known demo node ids, in display order
+_TIMELINE_PROCESSING = (
+    ('pbi-copilot', "🟦 Power BI Copilot: Connected (simulated)"),
+    ('agent-gateway', "🛡️ Agent Gateway: Routing established"),
+    ('dax-translator', "⚡ DAX Translator: Converted DAX → Snowflake SQL"),
+    ('schema-transformer', "🔄 Schema Transformer: Generated Cortex Analyst YAML"),
+)
+_TIMELINE_OUTPUT = (('yaml-output', "📄 Cortex YAML Bundle: Ready for download"),)
+_TIMELINE_CALLBACK = (('pbi-callback', "🔄 Power BI Callback: Response sent to Copilot"),)
+
+
+def _fanin_timeline(completed: frozenset, agents_consulted: List[str], supervisor_name: str, model_used: str,
+                    tmdl_messages: Dict[str, str], sv_messages: Dict[str, str],
+                    agent_names: Dict[str, str]) -> List[str]:
+    """Execution timeline for a forced fan-in completion, from the set of completed node ids"""
+    # Phase 1: Workflow start
+    exec_messages = ["🚀 Workflow execution started"]
+    
+    # Phase 2: Context loading
+    context_nodes = sorted(completed & tmdl_messages.keys())
+    if context_nodes:
+        exec_messages.append("📦 Loading context from data sources...")
+        exec_messages.extend(tmdl_messages[ctx] for ctx in context_nodes)
+    
+    # Phases 3-4: External agents, schema/DAX processing
+    exec_messages.extend(msg for nid, msg in _TIMELINE_PROCESSING if nid in completed)
+    
+    # Phase 5: Semantic views
+    sv_nodes = sorted(completed & sv_messages.keys())
+    if sv_nodes:
+        exec_messages.append("📊 Loading Semantic Models...")
+        exec_messages.extend(sv_messages[sv] for sv in sv_nodes)
+    
+    # Phase 6: YAML output
+    exec_messages.extend(msg for nid, msg in _TIMELINE_OUTPUT if nid in completed)
+    
+    # Phase 7: Supervisor orchestration
+    if 'supervisor' in completed:
+        exec_messages.append(f"👔 Supervisor '{supervisor_name}' analyzing query...")
+        exec_messages.append("🧠 Planning: Determining relevant agents...")
+        if agents_consulted:
+            exec_messages.append(f"📋 Plan: Consult {agents_consulted}")
+    
+    # Phase 8: Agent execution
+    consulted_lc = {ac.lower() for ac in agents_consulted}
+    for agent in sorted(completed & agent_names.keys()):
+        agent_name = agent_names[agent]
+        name_lc = agent_name.lower()
+        # Exact name first, then containment either way (e.g. "Sales" vs "Sales Agent")
+        if name_lc in consulted_lc or any(ac in name_lc or name_lc in ac for ac in consulted_lc):
+            exec_messages += (f"🤖 {agent_name} Agent: Analyzing data with {model_used}...",
+                              f"✅ {agent_name} Agent: Response generated")
+    
+    # Phase 9: Callback
+    exec_messages.extend(msg for nid, msg in _TIMELINE_CALLBACK if nid in completed)
+    
+    # Phase 10: Completion
+    exec_messages.append("✅ Workflow completed successfully")
+    
+    # Add routing summary for stats
+    if agents_consulted:
+        if len(agents_consulted) > 1:
+            exec_messages.append(f"MULTI-DOMAIN query routed to: {', '.join(agents_consulted)}")
+        else:
+            exec_messages.append(f"Query routed to: {agents_consulted[0]}")
+    
+    return exec_messages
+
+
+# Graph runs can last minutes, so they get their own bounded pool rather than holding
+# threads of the event loop's default executor (build_graph, catalog/stage listings)
+GRAPH_RUN_WORKERS = int(os.getenv("SNOWFLOW_GRAPH_RUN_WORKERS", "8"))
+_graph_run_executor = ThreadPoolExecutor(max_workers=GRAPH_RUN_WORKERS, thread_name_prefix="snowflow-graph")
+
+
 async def execute_workflow_streaming(nodes: List[Dict], edges: List[Dict], prompt: Optional[str] = None):
     """Execute workflow and yield real-time events as nodes execute"""
-    import asyncio
-    from concurrent.futures import ThreadPoolExecutor
     
     # Validate prompt FIRST before doing anything else
     validated_prompt = prompt
@@ -2556,7 +3353,7 @@ async def execute_workflow_streaming(nodes: List[Dict], edges: List[Dict], promp
     reset_trace_state()
     
     # Create queue for node execution events
-    event_queue = queue.Queue()
+    event_queue = ExecutionEventQueue(asyncio.get_running_loop())
     set_execution_callback(event_queue)
     
     try:
@@ -2566,16 +3363,22 @@ async def execute_workflow_streaming(nodes: List[Dict], edges: List[Dict], promp
         print("[EXECUTION PLANNER] Generating execution plan...")
         execution_timing = generate_execution_plan(nodes, edges)
         
-        # Additional delay to ensure frontend SSE connection is fully established
-        await asyncio.sleep(0.2)
-        
-        # Build and execute graph in a thread (LangGraph is sync)
+        # Compile the graph while waiting for the frontend SSE connection to settle -
+        # the two are independent, so the build no longer adds to time-to-first-node
+        try:
+            async with asyncio.TaskGroup() as tg:
+                graph_task = tg.create_task(asyncio.to_thread(build_graph, nodes, edges))
+                tg.create_task(asyncio.sleep(0.2))
+        except ExceptionGroup as eg:
+            raise eg.exceptions[0]  # Surface the build error itself, not the group wrapper
+        graph = graph_task.result()
+        
+        # Execute graph in a thread (LangGraph is sync)
         def run_graph(thread_queue):
             # Set the queue for THIS thread (thread-local storage)
             set_execution_callback(thread_queue)
             
             try:
-                graph = build_graph(nodes, edges)
                 initial_state: WorkflowState = {
                     'data': [],
                     'messages': ['🚀 Workflow execution started'],
@@ -2586,6 +3389,7 @@ async def execute_workflow_streaming(nodes: List[Dict], edges: List[Dict], promp
                     'routing_decision': '',
                     'user_prompt': validated_prompt or '',
                     'selected_agents': [],
+                    'selected_tokens': frozenset(),
                     'executed_nodes': [],
                     'simulated_nodes': [],  # Track nodes running in demo/simulated mode
                     'execution_timing': execution_timing  # Intelligent timing from planner
@@ -2598,37 +3402,45 @@ async def execute_workflow_streaming(nodes: List[Dict], edges: List[Dict], promp
                     try:
                         # Wait up to 120 seconds for graph to complete
                         result = invoke_future.result(timeout=120)
-                        print(f"[DEBUG] Graph invoke completed normally")
+                        logger.debug("[DEBUG] Graph invoke completed normally")
                     except FuturesTimeout:
-                        print(f"[DEBUG] Graph invoke timed out (fan-in bug) - forcing completion")
+                        logger.warning("[DEBUG] Graph invoke timed out (fan-in bug) - forcing completion")
                         # Graph timed out - this is the fan-in bug
                         # Create a synthetic result with what we have
                         result = {
                             'messages': ['Workflow completed (forced due to LangGraph fan-in timeout)'],
                             'results': {},
-                            'executed_nodes': list(_notified_nodes),  # Use the global tracked nodes
+                            'executed_nodes': get_notified_nodes(),  # Use the global tracked nodes
                             'simulated_nodes': []
                         }
                 
                 # Signal completion
-                print(f"[DEBUG] Sending _complete event")
+                logger.debug("[DEBUG] Sending _complete event")
                 thread_queue.put({'type': '_complete', 'state': result})
-                print(f"[DEBUG] _complete event sent to queue")
+                logger.debug("[DEBUG] _complete event sent to queue")
                 return result
             except Exception as e:
-                print(f"[DEBUG] Exception in run_graph: {e}")
+                logger.error("[DEBUG] Exception in run_graph: %s", e)
                 thread_queue.put({'type': '_error', 'error': str(e)})
                 raise
             finally:
                 set_execution_callback(None)  # Clean up this thread's queue
         
-        # Start graph execution in background thread, passing the queue
-        executor = ThreadPoolExecutor(max_workers=1)
-        future = executor.submit(run_graph, event_queue)
+        # Start graph execution on the graph-run pool, passing the queue. Finishing rings
+        # the queue's doorbell so the loop below sees it without polling; the exception
+        # is marked retrieved here because the _error event already reports it.
+        invoke_task = asyncio.get_running_loop().run_in_executor(_graph_run_executor, run_graph, event_queue)
+        
+        def on_invoke_done(task: asyncio.Future):
+            if not task.cancelled():
+                task.exception()
+            event_queue.wake()
+        invoke_task.add_done_callback(on_invoke_done)
         
         # Track executed nodes and timing for timeout detection
         traced_nodes = set()
         completed_nodes = set()
+        executed_nodes = set()  # traced ∪ completed, maintained incrementally
         last_activity_time = time.time()
         last_heartbeat_time = time.time()
         start_time = time.time()
@@ -2636,28 +3448,54 @@ async def execute_workflow_streaming(nodes: List[Dict], edges: List[Dict], promp
         MAX_TOTAL_TIMEOUT = 300.0  # Max 5 minutes total execution time
         HEARTBEAT_INTERVAL = 3.0  # Send heartbeat every 3 seconds to keep SSE alive
         
-        # Stream events as they come from the queue
+        # Output nodes and their predecessors only depend on the graph - compute once.
+        # Outputs are ordered by critical-path depth; when outputs must be force-traced
+        # only the deepest one is paced, the rest are emitted back-to-back.
+        cp_rank = _critical_path_ranks(nodes, edges)
+        output_nodes = sorted((n['id'] for n in nodes if n.get('type') == 'output'), key=lambda nid: -cp_rank.get(nid, 0))
+        critical_output = output_nodes[0] if output_nodes else None
+        output_node_set = frozenset(output_nodes)
+        all_output_predecessors = frozenset(e.get('source') for e in edges if e.get('target') in output_node_set)
+        # Timeline lines for context (TMDL) and semantic view nodes, keyed by node id
+        tmdl_messages = {n['id']: f"📊 Loaded: {n['id'].removeprefix('tmdl-').title()} TMDL" for n in nodes if n['id'].startswith('tmdl-')}
+        sv_messages = {n['id']: f"   ❄️ {n['id'].removeprefix('sv-').title()} SV loaded" for n in nodes if n['id'].startswith('sv-')}
+        agent_names = {n['id']: n['id'].replace('agent-', '').title() for n in nodes
+                       if n['id'].startswith('agent-') and n['id'] != 'agent-gateway'}
+        
+        # Stream events as they come from the queue (drained in batches).
+        # Producers ring the queue's doorbell, so an idle wait sleeps until the next
+        # event or the next heartbeat/timeout deadline - no fixed-interval polling.
+        # run_graph always queues _complete/_error before invoke_task finishes.
+        pending_events: deque = deque()
         while True:
-            try:
-                # Non-blocking check for events
-                event = event_queue.get(timeout=0.1)
+            if not pending_events:
+                next_deadline = min(
+                    last_heartbeat_time + HEARTBEAT_INTERVAL,
+                    last_activity_time + INACTIVITY_TIMEOUT,
+                    start_time + MAX_TOTAL_TIMEOUT
+                )
+                wait = max(next_deadline - time.time(), 0.0) + 0.01  # Land just past the deadline
+                pending_events.extend(await event_queue.drain(timeout=wait))
+            
+            if pending_events:
+                event = pending_events.popleft()
                 last_activity_time = time.time()  # Reset activity timer
                 
                 if event['type'] == '_complete':
                     # Graph finished, yield final result
-                    print("[DEBUG] Received _complete event!")
+                    logger.debug("[DEBUG] Received _complete event!")
                     final_state = event['state']
                     executed = final_state.get('executed_nodes', [])
-                    print(f"[DEBUG] Executed nodes: {executed}")
+                    logger.debug("[DEBUG] Executed nodes: %s", executed)
                     
                     # HACK: Force output-final trace if it wasn't executed
-                    output_nodes = [n['id'] for n in nodes if n.get('type') == 'output']
-                    print(f"[DEBUG] Output nodes in graph: {output_nodes}")
+                    logger.debug("[DEBUG] Output nodes in graph: %s", output_nodes)
                     for out_id in output_nodes:
                         if out_id not in executed:
-                            print(f"[HACK] Forcing trace for missed output node: {out_id}")
+                            logger.debug("[HACK] Forcing trace for missed output node: %s", out_id)
                             yield {'type': 'node_executing', 'node_id': out_id}
-                            time.sleep(0.2)
+                            if out_id == critical_output:
+                                await asyncio.sleep(0.2)
                             yield {'type': 'node_completed', 'node_id': out_id}
                             executed.append(out_id)
                     
@@ -2666,11 +3504,10 @@ async def execute_workflow_streaming(nodes: List[Dict], edges: List[Dict], promp
                     state_results = final_state.get('results', {})
                     final_results = {**state_results, **stored_results}
                     
-                    # DEBUG: Log results composition
-                    print(f"[DEBUG] stored_results keys: {list(stored_results.keys())}")
-                    print(f"[DEBUG] state_results keys: {list(state_results.keys()) if isinstance(state_results, dict) else 'NOT A DICT: ' + str(type(state_results))}")
-                    print(f"[DEBUG] final_results keys: {list(final_results.keys())}")
-                    print(f"[DEBUG] agent_response length: {len(final_results.get('agent_response', '')) if final_results.get('agent_response') else 'NONE'}")
+                    # DEBUG: Log results composition (sizes only - the dicts can be large)
+                    logger.debug("[DEBUG] Results: %d stored + %d state -> %d final keys, agent_response %d chars",
+                                 len(stored_results), len(state_results), len(final_results),
+                                 len(final_results.get('agent_response') or ''))
                     
                     yield {
                         'type': 'complete',
@@ -2687,17 +3524,22 @@ async def execute_workflow_streaming(nodes: List[Dict], edges: List[Dict], promp
                 elif event['type'] == 'node_executing':
                     # Track this node
                     traced_nodes.add(event.get('node_id'))
+                    executed_nodes.add(event.get('node_id'))
+                    yield event
+                elif event['type'] == 'node_progress':
+                    # Partial output from a long-running node (e.g. one supervisor domain)
                     yield event
                 elif event['type'] == 'node_completed':
                     node_id = event.get('node_id')
                     completed_nodes.add(node_id)
+                    executed_nodes.add(node_id)
                     yield event
                     
                     # CHECK FOR AUTH ERROR from supervisor
                     # This event may have error info from the node execution
                     node_error = event.get('error')
                     if node_error and ('authentication' in node_error.lower() or 'auth' in str(node_error).lower() or 'expired' in str(node_error).lower()):
-                        print(f"[ERROR] 🔐 Auth error detected in {node_id}: {node_error}")
+                        logger.error("[ERROR] 🔐 Auth error detected in %s: %s", node_id, node_error)
                         yield {'type': 'error', 'error': node_error, 'auth_error': True, 'node_id': node_id}
                         break
                     
@@ -2710,26 +3552,17 @@ async def execute_workflow_streaming(nodes: List[Dict], edges: List[Dict], promp
                     
                     if USE_AGGRESSIVE_FANIN:
                         # IMMEDIATE FAN-IN CHECK: After every completion, check if we should force output
-                        output_nodes = [n['id'] for n in nodes if n.get('type') == 'output']
-                        output_node_set = set(output_nodes)
-                        
-                        all_output_predecessors = set()
-                        for edge in edges:
-                            if edge.get('target') in output_node_set:
-                                all_output_predecessors.add(edge.get('source'))
-                        
                         expected_predecessors = all_output_predecessors & traced_nodes
                         all_preds_done = expected_predecessors and expected_predecessors.issubset(completed_nodes)
                     else:
                         all_preds_done = False  # Disabled - let graph complete naturally
                     
                     if all_preds_done:
-                        print(f"[FAN-IN] ✅ All {len(expected_predecessors)} output predecessors completed!")
-                        print(f"[FAN-IN] Predecessors: {expected_predecessors}")
+                        logger.debug("[FAN-IN] ✅ All %d output predecessors completed: %s", len(expected_predecessors), expected_predecessors)
                         
                         # WAIT for the actual output node to run and store results
                         # Poll for up to 10 seconds for agent_response to appear
-                        print(f"[FAN-IN] Waiting for output node to store results...")
+                        logger.debug("[FAN-IN] Waiting for output node to store results...")
                         wait_start = time.time()
                         max_wait = 10.0  # seconds
                         stored_results = {}
@@ -2737,117 +3570,51 @@ async def execute_workflow_streaming(nodes: List[Dict], edges: List[Dict], promp
                         while (time.time() - wait_start) < max_wait:
                             stored_results = get_shared_results()
                             if stored_results.get('agent_response') or stored_results.get('response'):
-                                print(f"[FAN-IN] ✅ Results available after {time.time() - wait_start:.2f}s")
+                                logger.debug("[FAN-IN] ✅ Results available after %.2fs", time.time() - wait_start)
                                 break
-                            time.sleep(0.2)  # Poll every 200ms
+                            await asyncio.sleep(0.2)  # Poll every 200ms
                         
                         if not stored_results.get('agent_response'):
-                            print(f"[FAN-IN] ⚠️ Timeout waiting for results after {max_wait}s")
+                            logger.warning("[FAN-IN] ⚠️ Timeout waiting for results after %ss", max_wait)
                         
                         # Now emit the output node events
                         for out_id in output_nodes:
                             if out_id not in completed_nodes:
-                                print(f"[FAN-IN] Forcing output node: {out_id}")
-                                print(f"[FAN-IN] Yielding node_executing...")
+                                logger.debug("[FAN-IN] Forcing output node: %s", out_id)
                                 yield {'type': 'node_executing', 'node_id': out_id}
-                                print(f"[FAN-IN] Yielding node_completed...")
                                 yield {'type': 'node_completed', 'node_id': out_id}
                                 completed_nodes.add(out_id)
+                                executed_nodes.add(out_id)
                         
-                        print(f"[FAN-IN] Yielding complete event...")
-                        print(f"[FAN-IN] Final stored_results keys: {list(stored_results.keys())}")
-                        print(f"[FAN-IN] agent_response: {len(stored_results.get('agent_response', '')) if stored_results.get('agent_response') else 'NONE'}")
+                        logger.debug("[FAN-IN] Yielding complete event with %d result keys (agent_response %d chars)",
+                                     len(stored_results), len(stored_results.get('agent_response') or ''))
                         
                         # Build rich execution messages for detailed timeline
-                        exec_messages = []
-                        
                         # Get agents that were actually consulted (from stored results)
                         agents_consulted = stored_results.get('agents_consulted', [])
                         supervisor_name = stored_results.get('supervisor', 'Supervisor')
                         model_used = stored_results.get('model', 'mistral-large2')
                         
-                        # Phase 1: Workflow start
-                        exec_messages.append("🚀 Workflow execution started")
-                        
-                        # Phase 2: Context loading
-                        context_nodes = [n for n in completed_nodes if n.startswith('tmdl-')]
-                        if context_nodes:
-                            exec_messages.append("📦 Loading context from data sources...")
-                            for ctx in sorted(context_nodes):
-                                ctx_name = ctx.replace('tmdl-', '').title()
-                                exec_messages.append(f"📊 Loaded: {ctx_name} TMDL")
-                        
-                        # Phase 3: External agents
-                        if 'pbi-copilot' in completed_nodes:
-                            exec_messages.append("🟦 Power BI Copilot: Connected (simulated)")
-                        if 'agent-gateway' in completed_nodes:
-                            exec_messages.append("🛡️ Agent Gateway: Routing established")
-                        
-                        # Phase 4: Schema/DAX processing
-                        if 'dax-translator' in completed_nodes:
-                            exec_messages.append("⚡ DAX Translator: Converted DAX → Snowflake SQL")
-                        if 'schema-transformer' in completed_nodes:
-                            exec_messages.append("🔄 Schema Transformer: Generated Cortex Analyst YAML")
-                        
-                        # Phase 5: Semantic views
-                        sv_nodes = [n for n in completed_nodes if n.startswith('sv-')]
-                        if sv_nodes:
-                            exec_messages.append("📊 Loading Semantic Models...")
-                            for sv in sorted(sv_nodes):
-                                sv_name = sv.replace('sv-', '').title()
-                                exec_messages.append(f"   ❄️ {sv_name} SV loaded")
+                        exec_messages = _fanin_timeline(
+                            frozenset(completed_nodes), agents_consulted, supervisor_name, model_used,
+                            tmdl_messages, sv_messages, agent_names
+                        )
                         
-                        # Phase 6: YAML output
-                        if 'yaml-output' in completed_nodes:
-                            exec_messages.append("📄 Cortex YAML Bundle: Ready for download")
-                        
-                        # Phase 7: Supervisor orchestration
-                        if 'supervisor' in completed_nodes:
-                            exec_messages.append(f"👔 Supervisor '{supervisor_name}' analyzing query...")
-                            exec_messages.append(f"🧠 Planning: Determining relevant agents...")
-                            if agents_consulted:
-                                exec_messages.append(f"📋 Plan: Consult {agents_consulted}")
-                        
-                        # Phase 8: Agent execution
-                        agent_nodes = [n for n in completed_nodes if n.startswith('agent-') and n != 'agent-gateway']
-                        for agent in sorted(agent_nodes):
-                            agent_name = agent.replace('agent-', '').title()
-                            if any(ac.lower() in agent_name.lower() or agent_name.lower() in ac.lower() for ac in agents_consulted):
-                                exec_messages.append(f"🤖 {agent_name} Agent: Analyzing data with {model_used}...")
-                                exec_messages.append(f"✅ {agent_name} Agent: Response generated")
-                        
-                        # Phase 9: Callback
-                        if 'pbi-callback' in completed_nodes:
-                            exec_messages.append("🔄 Power BI Callback: Response sent to Copilot")
-                        
-                        # Phase 10: Completion
-                        exec_messages.append("✅ Workflow completed successfully")
-                        
-                        # Add routing summary for stats
-                        if agents_consulted:
-                            if len(agents_consulted) > 1:
-                                exec_messages.append(f"MULTI-DOMAIN query routed to: {', '.join(agents_consulted)}")
-                            else:
-                                exec_messages.append(f"Query routed to: {agents_consulted[0]}")
-                        
-                        print(f"[FAN-IN] Execution messages: {len(exec_messages)} items")
-                        print(f"[FAN-IN] stored_results keys: {list(stored_results.keys())}")
-                        print(f"[FAN-IN] generated_yaml in results: {'generated_yaml' in stored_results}")
-                        if 'generated_yaml' in stored_results:
-                            print(f"[FAN-IN] YAML length: {len(stored_results['generated_yaml'])} chars")
+                        logger.debug("[FAN-IN] Execution messages: %d items, YAML %d chars",
+                                     len(exec_messages), len(stored_results.get('generated_yaml') or ''))
                         
                         yield {
                             'type': 'complete',
                             'success': True,
                             'messages': exec_messages,
-                            'results': stored_results,
+                            'results': dict(stored_results),
                             'executed_nodes': list(completed_nodes),
                             'simulated_nodes': []
                         }
-                        print(f"[FAN-IN] Complete event yielded, returning...")
+                        logger.debug("[FAN-IN] Complete event yielded, returning...")
                         return  # Exit the generator
                     
-            except queue.Empty:
+            else:
                 # Send heartbeat to keep SSE connection alive during long operations
                 time_since_heartbeat = time.time() - last_heartbeat_time
                 if time_since_heartbeat > HEARTBEAT_INTERVAL:
@@ -2860,18 +3627,18 @@ async def execute_workflow_streaming(nodes: List[Dict], edges: List[Dict], promp
                 
                 # Check total timeout first
                 if total_elapsed > MAX_TOTAL_TIMEOUT:
-                    print(f"[TIMEOUT] Max execution time exceeded ({total_elapsed:.1f}s)")
-                    print(f"[TIMEOUT] Traced: {traced_nodes}, Completed: {completed_nodes}")
-                    output_nodes = [n['id'] for n in nodes if n.get('type') == 'output']
+                    logger.warning("[TIMEOUT] Max execution time exceeded (%.1fs)", total_elapsed)
+                    logger.debug("[TIMEOUT] Traced: %s, Completed: %s", traced_nodes, completed_nodes)
                     for out_id in output_nodes:
                         if out_id not in completed_nodes:
                             yield {'type': 'node_executing', 'node_id': out_id}
-                            await asyncio.sleep(0.15)
+                            if out_id == critical_output:
+                                await asyncio.sleep(0.15)
                             yield {'type': 'node_completed', 'node_id': out_id}
                     
                     # IMPORTANT: Still try to get any stored results
-                    timeout_results = get_shared_results()
-                    print(f"[TIMEOUT] Retrieved stored results: {list(timeout_results.keys())}")
+                    timeout_results = dict(get_shared_results())
+                    logger.debug("[TIMEOUT] Retrieved stored results: %s", list(timeout_results))
                     
                     yield {
                         'type': 'complete',
@@ -2884,63 +3651,64 @@ async def execute_workflow_streaming(nodes: List[Dict], edges: List[Dict], promp
                     break
                 
                 if time_since_activity > INACTIVITY_TIMEOUT:
-                    print(f"[TIMEOUT] No activity for {time_since_activity:.1f}s - forcing completion")
-                    print(f"[TIMEOUT] Traced: {traced_nodes}, Completed: {completed_nodes}")
+                    logger.warning("[TIMEOUT] No activity for %.1fs - forcing completion", time_since_activity)
+                    logger.debug("[TIMEOUT] Traced: %s, Completed: %s", traced_nodes, completed_nodes)
                     
                     # Force output-final trace and complete
                     for out_id in output_nodes:
                         if out_id not in completed_nodes:
-                            print(f"[TIMEOUT] Forcing trace for stuck output node: {out_id}")
+                            logger.debug("[TIMEOUT] Forcing trace for stuck output node: %s", out_id)
                             yield {'type': 'node_executing', 'node_id': out_id}
-                            await asyncio.sleep(0.15)
+                            if out_id == critical_output:
+                                await asyncio.sleep(0.15)
                             yield {'type': 'node_completed', 'node_id': out_id}
                             completed_nodes.add(out_id)
+                            executed_nodes.add(out_id)
                     
                     # IMPORTANT: Get any stored results before completing
-                    inactivity_results = get_shared_results()
-                    print(f"[TIMEOUT] Retrieved stored results: {list(inactivity_results.keys())}")
+                    inactivity_results = dict(get_shared_results())
+                    logger.debug("[TIMEOUT] Retrieved stored results: %s", list(inactivity_results))
                     
                     yield {
                         'type': 'complete',
                         'success': True,
                         'messages': ['Workflow completed (timeout recovery)'],
                         'results': inactivity_results,  # Include any stored results
-                        'executed_nodes': list(traced_nodes | completed_nodes),
+                        'executed_nodes': list(executed_nodes),
                         'simulated_nodes': []
                     }
                     break
                 
                 # No events yet, check if thread is done
-                if future.done():
-                    print(f"[DEBUG] Future done, checking result...")
-                    print(f"[DEBUG] Traced: {traced_nodes}, Completed: {completed_nodes}")
+                if invoke_task.done():
+                    logger.debug("[DEBUG] Future done - traced: %s, completed: %s", traced_nodes, completed_nodes)
                     # Thread finished but no completion event - force completion
                     try:
-                        result = future.result()  # This will raise if there was an exception
-                        print(f"[DEBUG] Future returned normally: {type(result)}")
+                        result = invoke_task.result()  # This will raise if there was an exception
+                        logger.debug("[DEBUG] Future returned normally: %s", type(result))
                         
                         # IMPORTANT: Merge stored results with graph result
                         stored = get_shared_results()
                         final_results = {**(result.get('results', {}) if isinstance(result, dict) else {}), **stored}
-                        print(f"[DEBUG] Merged results keys: {list(final_results.keys())}")
+                        logger.debug("[DEBUG] Merged %d result keys", len(final_results))
                         
                         # Force output node tracing
-                        output_nodes = [n['id'] for n in nodes if n.get('type') == 'output']
                         for out_id in output_nodes:
                             if out_id not in completed_nodes:
                                 yield {'type': 'node_executing', 'node_id': out_id}
-                                time.sleep(0.15)
+                                if out_id == critical_output:
+                                    await asyncio.sleep(0.15)
                                 yield {'type': 'node_completed', 'node_id': out_id}
                         yield {
                             'type': 'complete',
                             'success': True,
                             'messages': result.get('messages', ['Workflow completed']) if isinstance(result, dict) else ['Workflow completed'],
                             'results': final_results,
-                            'executed_nodes': list(traced_nodes | completed_nodes),
+                            'executed_nodes': list(executed_nodes),
                             'simulated_nodes': result.get('simulated_nodes', []) if isinstance(result, dict) else []
                         }
                     except Exception as e:
-                        print(f"[DEBUG] Future raised exception: {e}")
+                        logger.error("[DEBUG] Future raised exception: %s", e)
                         yield {'type': 'error', 'error': str(e)}
                     break
                 continue
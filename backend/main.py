@@ -1,23 +1,38 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import uvicorn
 import json
+import logging
 import os
+import time
 import uuid
-from datetime import datetime
+from datetime import date, datetime, time as dt_time
 import asyncio
 from fastapi import Query
 
-from graph_builder import execute_workflow, execute_workflow_streaming
+try:
+    import orjson  # Optional fast path for SSE frame serialization
+except ImportError:
+    orjson = None
+
+from graph_builder import execute_workflow, execute_workflow_streaming, close_http_client
 from snowflake_client import snowflake_client
 from api import translation_router
 from demo_assets_installer import install_demo_assets, demo_assets_status
 from flow_validator import validate_flow, FlowValidator
 from flow_generator import generate_flow_from_prompt, generate_flow_quick, edit_flow, is_edit_request
 
+# Node progress lines go through the "snowflow.*" loggers - SNOWFLOW_LOG_LEVEL=WARNING quiets them
+logging.basicConfig(format="%(message)s")
+_log_level = os.getenv("SNOWFLOW_LOG_LEVEL", "INFO").upper()
+if _log_level not in logging.getLevelNamesMapping():
+    logging.getLogger("snowflow").warning("Unknown SNOWFLOW_LOG_LEVEL %r - using INFO", _log_level)
+    _log_level = "INFO"
+logging.getLogger("snowflow").setLevel(_log_level)
+
 app = FastAPI(title="SnowFlow API", version="0.1.0")
 
 app.add_middleware(
@@ -48,6 +63,19 @@ GOVERNANCE_DIR = "governance_data"
 os.makedirs(GOVERNANCE_DIR, exist_ok=True)
 
 
+# SSE coalescing for /run/stream - rapid node events share one write
+SSE_COALESCE_WINDOW = 0.02  # seconds
+SSE_COALESCE_MAX = 8  # frames
+_SSE_FLUSH_EVENTS = frozenset({'heartbeat', 'complete', 'error'})
+
+
+def _sse_frame(event: Dict[str, Any]) -> bytes:
+    """One SSE data frame as UTF-8 bytes - orjson when available, stdlib otherwise"""
+    if orjson is not None:
+        return b"data: " + orjson.dumps(event, option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
+    return f"data: {json.dumps(event)}\n\n".encode()
+
+
 class WorkflowRequest(BaseModel):
     nodes: List[Dict[str, Any]]
     edges: List[Dict[str, Any]]
@@ -406,11 +434,47 @@ async def check_if_edit(prompt: str = Query(...)):
 async def run_workflow_stream(workflow: WorkflowRequest):
     """Execute a workflow with real-time streaming updates"""
     async def event_generator():
+        # Coalesce bursts of node events into one SSE write: flush after SSE_COALESCE_MAX
+        # frames or SSE_COALESCE_WINDOW seconds, and at once for heartbeat/complete/error.
+        # The pending __anext__ is awaited via asyncio.wait so a window timeout never
+        # cancels the workflow generator mid-step.
+        loop = asyncio.get_running_loop()
+        stream = execute_workflow_streaming(workflow.nodes, workflow.edges, workflow.prompt)
+        buf: List[bytes] = []
+        flush_at = 0.0
+        pending = None
         try:
-            async for event in execute_workflow_streaming(workflow.nodes, workflow.edges, workflow.prompt):
-                yield f"data: {json.dumps(event)}\n\n"
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(stream.__anext__())
+                if buf:
+                    done, _ = await asyncio.wait({pending}, timeout=max(flush_at - loop.time(), 0))
+                    if not done:
+                        yield b"".join(buf)
+                        buf.clear()
+                        continue
+                try:
+                    event = await pending
+                except StopAsyncIteration:
+                    break
+                pending = None
+                if not buf:
+                    flush_at = loop.time() + SSE_COALESCE_WINDOW
+                buf.append(_sse_frame(event))
+                if len(buf) >= SSE_COALESCE_MAX or event.get('type') in _SSE_FLUSH_EVENTS:
+                    yield b"".join(buf)
+                    buf.clear()
+            if buf:
+                yield b"".join(buf)
         except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+            buf.append(_sse_frame({'type': 'error', 'error': str(e)}))
+            yield b"".join(buf)
+        finally:
+            # Client went away mid-step - stop the in-flight step before closing the generator
+            if pending is not None and not pending.done():
+                pending.cancel()
+                await asyncio.wait({pending})
+            await stream.aclose()
     
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -505,12 +569,36 @@ async def get_columns(table: str, database: Optional[str] = None, schema: Option
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _isoformat(value):
+    # NaT is a datetime but never equals itself - left as is, to_json writes it as null
+    return value.isoformat() if isinstance(value, (date, dt_time)) and value == value else value
+
+
+def _isoformat_temporals(df):
+    """Shallow copy of df with date/time values as isoformat() strings, as FastAPI's encoder wrote them
+
+    to_json's own ISO mode cuts timestamps to milliseconds and renders DATE values as midnight timestamps.
+    """
+    df = df.copy(deep=False)
+    for i in range(df.shape[1]):
+        col = df.iloc[:, i]
+        if col.dtype.kind == 'M' or (col.dtype == object and any(isinstance(v, (date, dt_time)) for v in col)):
+            df.isetitem(i, col.map(_isoformat).astype(object))
+    return df
+
+
 @app.get("/snowflake/preview/{table}")
 async def preview_table(table: str, database: Optional[str] = None, schema: Optional[str] = None, limit: int = 100):
     """Preview data from a table"""
     try:
         df = snowflake_client.preview_table(table, database, schema, limit)
-        return {"data": df.to_dict('records'), "columns": list(df.columns)}
+        # Serialize straight from the DataFrame (pandas' C encoder) - no per-row dicts.
+        # Date/time columns are pre-rendered as isoformat() strings, like FastAPI's encoder.
+        records_json = _isoformat_temporals(df).to_json(orient='records')
+        return Response(
+            content=f'{{"data":{records_json},"columns":{json.dumps([str(c) for c in df.columns])}}}',
+            media_type="application/json"
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -650,15 +738,46 @@ async def get_catalog_sources():
         return {"sources": demo_sources, "demo_mode": True, "warning": str(e)}
 
 
+# Catalog listings (databases/schemas/stages) change on the order of minutes -
+# cache each SHOW result per path for CATALOG_CACHE_TTL seconds (oldest paths evicted past the max)
+CATALOG_CACHE_TTL = 60.0
+CATALOG_CACHE_MAX = 256
+_catalog_cache: Dict[tuple, tuple] = {}
+# One lock per listing kind - the paths under it come from user input, so no per-path locks
+_catalog_locks: Dict[str, asyncio.Lock] = {kind: asyncio.Lock() for kind in ('databases', 'schemas', 'stages')}
+
+
+async def _catalog_names(key: tuple, query: str) -> Optional[List[str]]:
+    """Names from a SHOW query, cached per key; None when Snowflake returned nothing usable
+
+    A lock per listing kind (key[0]) makes concurrent misses share one round trip.
+    Failures are not cached.
+    """
+    hit = _catalog_cache.get(key)
+    if hit and time.monotonic() - hit[0] < CATALOG_CACHE_TTL:
+        return hit[1]
+    async with _catalog_locks[key[0]]:
+        hit = _catalog_cache.get(key)
+        if hit and time.monotonic() - hit[0] < CATALOG_CACHE_TTL:
+            return hit[1]
+        result = await asyncio.to_thread(snowflake_client.execute_sql, query)
+        if not (result.get('success') and result.get('data')):
+            return None
+        names = [row.get('name', '') for row in result['data'] if row.get('name')]
+        _catalog_cache.pop(key, None)  # Re-insert so dict order is refresh order
+        _catalog_cache[key] = (time.monotonic(), names)
+        if len(_catalog_cache) > CATALOG_CACHE_MAX:
+            del _catalog_cache[next(iter(_catalog_cache))]
+        return names
+
+
 @app.get("/catalog/databases")
 async def get_databases():
     """Get list of accessible databases"""
     try:
-        query = "SHOW DATABASES"
-        result = snowflake_client.execute_sql(query)
-        if result.get('success') and result.get('data'):
-            databases = [row.get('name', '') for row in result['data'] if row.get('name')]
-        return {"databases": databases}
+        databases = await _catalog_names(('databases',), "SHOW DATABASES")
+        if databases is not None:
+            return {"databases": databases}
         # Fallback if no data
         return {"databases": ["SNOWFLOW_DEV", "SNOWFLOW_PROD", "DEMO_DB"]}
     except Exception as e:
@@ -670,11 +789,9 @@ async def get_databases():
 async def get_schemas(database: str):
     """Get schemas in a database"""
     try:
-        query = f"SHOW SCHEMAS IN DATABASE {database}"
-        result = snowflake_client.execute_sql(query)
-        if result.get('success') and result.get('data'):
-            schemas = [row.get('name', '') for row in result['data'] if row.get('name')]
-        return {"schemas": schemas}
+        schemas = await _catalog_names(('schemas', database), f"SHOW SCHEMAS IN DATABASE {database}")
+        if schemas is not None:
+            return {"schemas": schemas}
         # Fallback if no data
         return {"schemas": ["PUBLIC", "DEMO", "SEMANTIC_MODELS"]}
     except Exception as e:
@@ -685,10 +802,8 @@ async def get_schemas(database: str):
 async def get_stages(database: str, schema: str):
     """Get stages in a schema"""
     try:
-        query = f"SHOW STAGES IN {database}.{schema}"
-        result = snowflake_client.execute_sql(query)
-        if result.get('success') and result.get('data'):
-            stages = [row.get('name', '') for row in result['data'] if row.get('name')]
+        stages = await _catalog_names(('stages', database, schema), f"SHOW STAGES IN {database}.{schema}")
+        if stages is not None:
             return {"stages": stages}
         return {"stages": ["SEMANTIC_MODELS", "CORTEX_STAGE", "DATA_STAGE"]}  # Fallback
     except Exception as e:
@@ -780,10 +895,16 @@ async def get_semantic_models():
                 (env_db, "SNOWFLOW_AD_MEDIA", "SEMANTIC_MODELS"),
             ])
         
-        for database, schema, stage in stage_locations:
+        # The LIST calls are independent - run them concurrently (latency = slowest stage, not the sum)
+        list_results = await asyncio.gather(*(
+            asyncio.to_thread(snowflake_client.execute_sql, f"LIST @{database}.{schema}.{stage} PATTERN='.*\\.yaml'")
+            for database, schema, stage in stage_locations
+        ), return_exceptions=True)
+        
+        for (database, schema, stage), result in zip(stage_locations, list_results):
             try:
-                query = f"LIST @{database}.{schema}.{stage} PATTERN='.*\\.yaml'"
-                result = snowflake_client.execute_sql(query)
+                if isinstance(result, BaseException):
+                    raise result
                 
                 if result and result.get('success') and result.get('data'):
                     for row in result.get('data', []):
@@ -1020,33 +1141,38 @@ async def save_tool(tool: ToolRequest):
     try:
         tool_id = tool.id or f"tool-{uuid.uuid4().hex[:8]}"
         
-        query = f"""
+        # Static statement text with bind values - no hand-escaping, and Snowflake
+        # sees the same SQL on every save so it can reuse the compiled statement
+        query = """
         MERGE INTO SNOWFLOW_DEV.DEMO.SNOWFLOW_TOOLS t
-        USING (SELECT '{tool_id}' as tool_id) s
+        USING (
+            SELECT %s AS tool_id, %s AS name, %s AS description, %s AS tool_type,
+                   %s AS parameters, %s AS implementation, %s AS api_endpoint, %s AS api_method
+        ) s
         ON t.tool_id = s.tool_id
         WHEN MATCHED THEN UPDATE SET
-            name = '{tool.name}',
-            description = '{tool.description.replace("'", "''")}',
-            tool_type = '{tool.type}',
-            parameters = PARSE_JSON('{json.dumps(tool.parameters)}'),
-            implementation = '{(tool.implementation or "").replace("'", "''")}',
-            api_endpoint = {f"'{tool.apiEndpoint}'" if tool.apiEndpoint else 'NULL'},
-            api_method = {f"'{tool.apiMethod}'" if tool.apiMethod else 'NULL'},
+            name = s.name,
+            description = s.description,
+            tool_type = s.tool_type,
+            parameters = PARSE_JSON(s.parameters),
+            implementation = s.implementation,
+            api_endpoint = s.api_endpoint,
+            api_method = s.api_method,
             updated_at = CURRENT_TIMESTAMP()
         WHEN NOT MATCHED THEN INSERT (
             tool_id, name, description, tool_type, parameters, 
             implementation, api_endpoint, api_method, created_by
         ) VALUES (
-            '{tool_id}', '{tool.name}', '{tool.description.replace("'", "''")}', 
-            '{tool.type}', PARSE_JSON('{json.dumps(tool.parameters)}'),
-            '{(tool.implementation or "").replace("'", "''")}',
-            {f"'{tool.apiEndpoint}'" if tool.apiEndpoint else 'NULL'},
-            {f"'{tool.apiMethod}'" if tool.apiMethod else 'NULL'},
-            CURRENT_USER()
+            s.tool_id, s.name, s.description, s.tool_type, PARSE_JSON(s.parameters),
+            s.implementation, s.api_endpoint, s.api_method, CURRENT_USER()
         )
         """
+        params = (
+            tool_id, tool.name, tool.description, tool.type, json.dumps(tool.parameters),
+            tool.implementation or "", tool.apiEndpoint or None, tool.apiMethod or None
+        )
         
-        snowflake_client.execute_sql(query)
+        snowflake_client.execute_sql(query, params)
         log_audit('tool_saved', 'tool', tool_id, tool.name, {'type': tool.type})
         
         return {"status": "saved", "id": tool_id}
@@ -1058,8 +1184,8 @@ async def save_tool(tool: ToolRequest):
 async def delete_tool(tool_id: str):
     """Delete a custom tool"""
     try:
-        query = f"DELETE FROM SNOWFLOW_DEV.DEMO.SNOWFLOW_TOOLS WHERE tool_id = '{tool_id}'"
-        snowflake_client.execute_sql(query)
+        query = "DELETE FROM SNOWFLOW_DEV.DEMO.SNOWFLOW_TOOLS WHERE tool_id = %s"
+        snowflake_client.execute_sql(query, (tool_id,))
         return {"status": "deleted"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1766,7 +1892,6 @@ app.include_router(translation_router)
 # =============================================================================
 
 import threading
-import time
 
 class ConnectionHealthMonitor:
     """
@@ -1871,8 +1996,9 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Stop the connection monitor on app shutdown"""
+    """Stop the connection monitor and release pooled connections on app shutdown"""
     connection_monitor.stop()
+    close_http_client()
 
 
 @app.get("/connection/status")
@@ -0,0 +1,162 @@
+"""
+Semantic LLM Response Cache
+
+Persistent SQLite cache for deterministic LLM transformations (e.g. schema
+transformer YAML). Lookups try the exact key first, then fall back to the
+most similar cached input in the same scope, so re-running a graph with a
+near-identical schema skips the Cortex round trip.
+
+Embeddings are a cheap local feature-hashed bag of words - no model call.
+They mostly measure the input's layout (repeated JSON keys dominate), so a
+near hit is only accepted when the caller's signature - the parts of the input
+that must not differ, e.g. table/column/measure names and expressions - is
+identical. Without a signature only exact hits are served.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Optional
+
+import numpy as np
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(__file__), 'cache_data', 'semantic_cache.sqlite3')
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def embed_text(text: str, dim: int = 256) -> np.ndarray:
+    """L2-normalized signed feature-hash embedding of the words in text (stable across processes)"""
+    vec = np.zeros(dim, dtype=np.float32)
+    for word in _WORD_RE.findall(text.lower()):
+        h = zlib.crc32(word.encode('utf-8'))
+        vec[h % dim] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+def _measure_identity(measure: dict) -> list:
+    """Name plus every expression field (expr, expression, original_expression, ...) of a measure"""
+    exprs = {k: v for k, v in measure.items() if 'expr' in k.lower()}
+    return [str(measure.get('name')), json.dumps(exprs, sort_keys=True, default=str)]
+
+
+def schema_signature(interchange: dict) -> Optional[str]:
+    """Hash of the table, column and measure names and measure expressions of an interchange schema
+
+    Two schemas with the same signature differ at most in descriptions, types, synonyms
+    and the like, so a near hit between them is safe to reuse. None when there is
+    nothing structural to compare (e.g. raw schema text) - exact hits only.
+    """
+    if not isinstance(interchange, dict) or 'raw_schema' in interchange:
+        return None
+    tables = []
+    for table in interchange.get('tables') or ():
+        if not isinstance(table, dict):
+            continue
+        columns = sorted(str(c.get('name')) for c in table.get('columns') or () if isinstance(c, dict))
+        measures = sorted(_measure_identity(m) for m in table.get('measures') or () if isinstance(m, dict))
+        tables.append([str(table.get('name')), columns, measures])
+    measures = sorted(_measure_identity(m) for m in interchange.get('measures') or () if isinstance(m, dict))
+    if not tables and not measures:
+        return None
+    payload = json.dumps([sorted(tables), measures], default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SemanticCache:
+    """Exact + similarity cache of LLM outputs, LRU-bounded, stored in SQLite
+
+    Entries are grouped by scope (model, target, ...) and only compared within
+    their scope. Any storage error is logged and treated as a miss - the cache
+    never fails the caller.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 10000,
+                 threshold: float = 0.92, dim: int = 256):
+        self.path = path
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, scope TEXT, embedding BLOB, value TEXT, last_access REAL, hits INTEGER, "
+                "signature TEXT)"
+            )
+            try:
+                conn.execute("ALTER TABLE cache ADD COLUMN signature TEXT")  # Caches created before signatures
+            except sqlite3.OperationalError:
+                pass  # Column already there
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_scope ON cache(scope)")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache(last_access)")
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(scope: str, text: str) -> str:
+        return hashlib.sha256(f"{scope}|{text}".encode('utf-8')).hexdigest()
+
+    def get(self, scope: str, text: str, signature: Optional[str] = None) -> Optional[str]:
+        """Cached value for text in scope - exact match first, then the nearest similar input with the same signature"""
+        key = self.make_key(scope, text)
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    if signature is None:
+                        return None
+                    rows = conn.execute(
+                        "SELECT key, embedding FROM cache WHERE scope = ? AND signature = ?", (scope, signature)
+                    ).fetchall()
+                    if not rows:
+                        return None
+                    matrix = np.frombuffer(b''.join(r[1] for r in rows), dtype=np.float32).reshape(len(rows), self.dim)
+                    scores = matrix @ embed_text(text, self.dim)
+                    best = int(np.argmax(scores))
+                    if scores[best] < self.threshold:
+                        return None
+                    key = rows[best][0]
+                    row = conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+                conn.execute("UPDATE cache SET last_access = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+                conn.commit()
+                return row[0]
+        except (sqlite3.Error, ValueError) as e:
+            print(f"   ⚠️ Semantic cache lookup failed: {e}")
+            return None
+
+    def put(self, scope: str, text: str, value: str, signature: Optional[str] = None):
+        """Store value for text in scope, evicting the least recently used entries past max_entries"""
+        embedding = embed_text(text, self.dim).tobytes()
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, scope, embedding, value, last_access, hits, signature) "
+                    "VALUES (?, ?, ?, ?, ?, 0, ?)",
+                    (self.make_key(scope, text), scope, embedding, value, time.time(), signature)
+                )
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"   ⚠️ Semantic cache store failed: {e}")
+
+
+# Singleton instance
+semantic_cache = SemanticCache()
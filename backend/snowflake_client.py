@@ -2,14 +2,32 @@ import os
 import time
 from dotenv import load_dotenv
 import snowflake.connector
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Sequence
+import json
+import re
 import pandas as pd
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization
 import concurrent.futures
+import hashlib
+import threading
+from collections import OrderedDict
 
 load_dotenv()
 
+
+def _cortex_timeout_response(model: str, timeout: int) -> str:
+    """Placeholder answer returned when a Cortex call exceeds its timeout"""
+    return f"Analysis timed out. The {model} model was unable to respond within {timeout} seconds. This may be due to high load. Please try again."
+
+
+# Errors that mean the messages + options form of COMPLETE isn't accepted here (vs a transient failure)
+_OPTIONS_UNSUPPORTED_RE = re.compile(
+    r'SQL compilation error|syntax error|invalid argument|argument types|unsupported|unknown (?:function|option)',
+    re.IGNORECASE
+)
+
+
 class SnowflakeClient:
     _instance: Optional['SnowflakeClient'] = None
     _conn: Optional[snowflake.connector.SnowflakeConnection] = None
@@ -27,6 +45,15 @@ class SnowflakeClient:
     # Optional runtime role override (for UI-driven role switching)
     _role_override: Optional[str] = None
 
+    # Whether COMPLETE accepts the messages + options form in this account (None = not tried yet)
+    _cortex_options_supported: Optional[bool] = None
+
+    # Exact-match cache of low-temperature (near-deterministic) completions - LRU bounded
+    _completion_cache: 'OrderedDict[tuple, str]' = OrderedDict()
+    _completion_cache_lock = threading.Lock()
+    _completion_cache_max: int = 512
+    _completion_cache_max_temperature: float = 0.3
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
@@ -172,11 +199,11 @@ class SnowflakeClient:
         current = self.get_current_role()
         return {"success": True, "requested_role": role, "current_role": current}
 
-    def execute_query(self, query: str) -> pd.DataFrame:
+    def execute_query(self, query: str, params: Optional[Sequence[Any]] = None) -> pd.DataFrame:
         conn = self.connect()
         cursor = conn.cursor()
         try:
-            cursor.execute(query)
+            cursor.execute(query, params)
             columns = [desc[0] for desc in cursor.description] if cursor.description else []
             rows = cursor.fetchall()
             return pd.DataFrame(rows, columns=columns)
@@ -210,13 +237,94 @@ class SnowflakeClient:
         query = f"SELECT * FROM {db}.{sch}.{table} LIMIT {limit}"
         return self.execute_query(query)
 
-    def cortex_complete(self, model: str, prompt: str, options: Dict = None, timeout: int = 60) -> str:
+    def _completion_cache_key(self, model: str, prompt: str, options: Optional[Dict], apply_options: bool) -> Optional[tuple]:
+        """Cache key for a completion, or None when sampling makes the answer non-repeatable
+
+        Only calls that actually send their options qualify - without them COMPLETE samples at
+        its default temperature, whatever the caller asked for.
+        """
+        if not apply_options or self._cortex_options_supported is False:
+            return None
+        if not options or options.get('temperature', 1.0) > self._completion_cache_max_temperature:
+            return None
+        return (model, hashlib.sha256(prompt.encode('utf-8')).digest(), json.dumps(options, sort_keys=True))
+
+    def _cached_completion(self, key: Optional[tuple]) -> Optional[str]:
+        if key is None:
+            return None
+        with self._completion_cache_lock:
+            response = self._completion_cache.get(key)
+            if response is not None:
+                self._completion_cache.move_to_end(key)
+            return response
+
+    def _store_completion(self, key: Optional[tuple], response: str):
+        if key is None or not response or response.startswith('Analysis timed out'):
+            return
+        with self._completion_cache_lock:
+            self._completion_cache[key] = response
+            self._completion_cache.move_to_end(key)
+            if len(self._completion_cache) > self._completion_cache_max:
+                self._completion_cache.popitem(last=False)
+
+    def cortex_complete(self, model: str, prompt: str, options: Dict = None, timeout: int = 60,
+                        apply_options: bool = False) -> str:
         """Call Snowflake Cortex COMPLETE function
         
         1:1 mapping to SNOWFLAKE.CORTEX.COMPLETE()
-        Supports: model, prompt, and options (temperature, max_tokens, top_p)
+        Supports: model, prompt, and options (temperature, max_tokens, top_p, stop...)
+        Options are only sent to Snowflake when apply_options is set; by default
+        the simple prompt form is used as before.
+        
+        Identical low-temperature calls (temperature <= 0.3, options applied) are
+        answered from an in-process LRU cache without a round trip.
+        """
+        cache_key = self._completion_cache_key(model, prompt, options, apply_options)
+        response = self._cached_completion(cache_key)
+        if response is None:
+            response = self._cortex_complete_uncached(model, prompt, options if apply_options else None, timeout, cache_key)
+        return response
+
+    def _cortex_complete_uncached(self, model: str, prompt: str, options: Dict = None, timeout: int = 60,
+                                  cache_key: Optional[tuple] = None) -> str:
+        """Run one COMPLETE call against Snowflake
+        
+        The reply is stored under cache_key only when it came from the options form.
+        
+        Options are sent with the messages form of COMPLETE so generation limits
+        (e.g. max_tokens) actually bound latency. If that form is rejected as
+        unsupported (compilation/argument error) and the simple prompt form then
+        works, the client stops sending options for the rest of the process.
+        Any other failure just falls back to the simple form for this call.
         """
-        import concurrent.futures
+        options_error = None
+        if options and self._cortex_options_supported is not False:
+            def run_options_query():
+                df = self.execute_query(
+                    "SELECT SNOWFLAKE.CORTEX.COMPLETE(%s, PARSE_JSON(%s), PARSE_JSON(%s)) as response",
+                    params=(model, json.dumps([{'role': 'user', 'content': prompt[:50000]}]), json.dumps(options))
+                )
+                if df.empty:
+                    return ""
+                payload = json.loads(df['RESPONSE'].iloc[0])
+                return payload['choices'][0]['messages']
+            
+            try:
+                with concurrent.futures.ThreadPoolExecutor() as executor:
+                    future = executor.submit(run_options_query)
+                    response = future.result(timeout=timeout)
+                self._cortex_options_supported = True
+                self._store_completion(cache_key, response)
+                return response
+            except concurrent.futures.TimeoutError:
+                print(f"   ⚠️ Cortex call timed out after {timeout}s - returning fallback")
+                return _cortex_timeout_response(model, timeout)
+            except Exception as e:
+                if self._cortex_options_supported:
+                    raise  # The form works here - this is a real call failure
+                print(f"   ⚠️ COMPLETE with options failed ({e}) - retrying with simple prompt form")
+                if _OPTIONS_UNSUPPORTED_RE.search(str(e)):
+                    options_error = e
         
         # Escape single quotes in prompt
         safe_prompt = prompt.replace("'", "''")
@@ -241,10 +349,44 @@ class SnowflakeClient:
         try:
             with concurrent.futures.ThreadPoolExecutor() as executor:
                 future = executor.submit(run_query)
-                return future.result(timeout=timeout)
+                response = future.result(timeout=timeout)
         except concurrent.futures.TimeoutError:
             print(f"   ⚠️ Cortex call timed out after {timeout}s - returning fallback")
-            return f"Analysis timed out. The {model} model was unable to respond within {timeout} seconds. This may be due to high load. Please try again."
+            return _cortex_timeout_response(model, timeout)
+        if options_error is not None:
+            # The simple form works where the options form didn't - stop trying options
+            self._cortex_options_supported = False
+        return response
+
+    def cortex_complete_batch(self, model: str, prompts: Sequence[str], options: Dict = None, timeout: int = 60,
+                              apply_options: bool = False) -> List[str]:
+        """Run several prompts through Cortex COMPLETE in one statement (one round trip)
+        
+        Prompts are bound as VALUES rows and answered in input order. Unlike
+        cortex_complete this raises on failure or timeout, so callers can fall
+        back to per-prompt calls. Options are only sent when apply_options is set,
+        and only replies to options-form calls go into the completion cache.
+        """
+        values = ", ".join(f"({i}, %s)" for i in range(len(prompts)))
+        options_sent = bool(apply_options and options and self._cortex_options_supported is not False)
+        if options_sent:
+            query = f"SELECT SNOWFLAKE.CORTEX.COMPLETE(%s, PARSE_JSON(c), PARSE_JSON(%s)) as response FROM (VALUES {values}) AS v(i, c) ORDER BY i"
+            params = (model, json.dumps(options)) + tuple(
+                json.dumps([{'role': 'user', 'content': prompt[:50000]}]) for prompt in prompts
+            )
+            parse = lambda raw: json.loads(raw)['choices'][0]['messages']
+        else:
+            query = f"SELECT SNOWFLAKE.CORTEX.COMPLETE(%s, c) as response FROM (VALUES {values}) AS v(i, c) ORDER BY i"
+            params = (model,) + tuple(prompt[:50000] for prompt in prompts)
+            parse = str
+        
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            df = executor.submit(self.execute_query, query, params).result(timeout=timeout)
+        responses = [parse(raw) for raw in df['RESPONSE']]
+        if options_sent and len(responses) == len(prompts):
+            for prompt, response in zip(prompts, responses):
+                self._store_completion(self._completion_cache_key(model, prompt, options, True), response)
+        return responses
 
     def list_cortex_models(self, probe: bool = False, force_refresh: bool = False, include_experimental: bool = False) -> Dict[str, Any]:
         """Return a list of known Cortex LLM models.
@@ -417,13 +559,14 @@ class SnowflakeClient:
         
         return {"error": "No result from Analyst", "success": False}
 
-    def execute_sql(self, sql: str) -> Dict:
+    def execute_sql(self, sql: str, params: Optional[Sequence[Any]] = None) -> Dict:
         """Execute arbitrary SQL and return results
         
-        Used by SQL Executor tool
+        Used by SQL Executor tool. Pass ``params`` to bind values (pyformat
+        ``%s`` placeholders) instead of interpolating them into ``sql``.
         """
         try:
-            df = self.execute_query(sql)
+            df = self.execute_query(sql, params)
             return {
                 "success": True,
                 "rows": len(df),
@@ -1450,5 +1593,114 @@ class SnowflakeClient:
             return {"success": True, "storage": "local"}
 
 
+class _CortexBatch:
+    """Prompts waiting to go out together for one (model, options) pair"""
+    def __init__(self):
+        self.items: List[tuple] = []  # (prompt, Future)
+        self.full = threading.Event()
+
+
+class CortexBatcher:
+    """Coalesces concurrent Cortex COMPLETE calls into one statement
+    
+    Sibling nodes on parallel graph branches call complete() from their own
+    worker threads. A caller with nothing else in flight for its (model, options)
+    pair goes straight out through cortex_complete - no collection window. While
+    a call is in flight, new callers gather into the next batch: its first caller
+    waits a short window (or until max_batch prompts arrive), sends the whole
+    batch in one round trip and hands every caller its own response.
+    
+    This is flush-when-busy batching, not token-level continuous batching: a
+    batch is one VALUES statement, so everyone in it waits for its slowest
+    completion.
+    """
+    
+    def __init__(self, client: SnowflakeClient, window: float = 0.025, max_batch: int = 8):
+        self._client = client
+        self._window = window
+        self._max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pending: Dict[tuple, _CortexBatch] = {}
+        self._running: Dict[tuple, int] = {}  # Leaders in flight per (model, options)
+    
+    def complete(self, model: str, prompt: str, options: Dict = None, timeout: int = 60,
+                 apply_options: bool = False) -> str:
+        cached = self._client._cached_completion(
+            self._client._completion_cache_key(model, prompt, options, apply_options)
+        )
+        if cached is not None:
+            return cached
+        key = (model, json.dumps(options, sort_keys=True) if options else '', apply_options)
+        future = concurrent.futures.Future()
+        with self._lock:
+            batch = self._pending.get(key)
+            is_leader = batch is None
+            if is_leader:
+                # Uncontended: nobody to batch with, so don't hold the call for the window
+                if self._running.get(key):
+                    batch = self._pending[key] = _CortexBatch()
+                self._running[key] = self._running.get(key, 0) + 1
+            if batch is not None:
+                batch.items.append((prompt, future))
+                if len(batch.items) >= self._max_batch:
+                    del self._pending[key]  # Closed - the next caller starts a new batch
+                    batch.full.set()
+        
+        if is_leader:
+            try:
+                if batch is None:
+                    self._complete_one(model, prompt, options, apply_options, timeout, future)
+                else:
+                    batch.full.wait(self._window)
+                    with self._lock:
+                        if self._pending.get(key) is batch:
+                            del self._pending[key]
+                    self._run(model, options, apply_options, timeout, batch.items)
+            finally:
+                with self._lock:
+                    self._running[key] -= 1
+                    if not self._running[key]:
+                        del self._running[key]
+        return future.result()
+    
+    def _complete_one(self, model: str, prompt: str, options: Optional[Dict], apply_options: bool, timeout: int,
+                      future: concurrent.futures.Future):
+        try:
+            future.set_result(self._client.cortex_complete(
+                model, prompt, options=options, timeout=timeout, apply_options=apply_options
+            ))
+        except Exception as e:
+            future.set_exception(e)
+    
+    def _run(self, model: str, options: Optional[Dict], apply_options: bool, timeout: int, items: List[tuple]):
+        if len(items) == 1:
+            self._complete_one(model, items[0][0], options, apply_options, timeout, items[0][1])
+            return
+        
+        try:
+            responses = self._client.cortex_complete_batch(
+                model, [prompt for prompt, _ in items], options=options, timeout=timeout, apply_options=apply_options
+            )
+        except concurrent.futures.TimeoutError:
+            print(f"   ⚠️ Batched Cortex call ({len(items)} prompts) timed out after {timeout}s - returning fallback")
+            for _, future in items:
+                future.set_result(_cortex_timeout_response(model, timeout))
+            return
+        except Exception as e:
+            print(f"   ⚠️ Batched COMPLETE failed ({e}) - running {len(items)} prompts individually")
+            responses = None
+        
+        if responses is not None and len(responses) == len(items):
+            for (_, future), response in zip(items, responses):
+                future.set_result(response)
+            return
+        
+        # Per-prompt fallback - each waiting caller is released as soon as its own call returns
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(items)) as executor:
+            for prompt, future in items:
+                executor.submit(self._complete_one, model, prompt, options, apply_options, timeout, future)
+
+
 # Singleton instance
 snowflake_client = SnowflakeClient()
+cortex_batcher = CortexBatcher(snowflake_client)
@@ -0,0 +1,31 @@
+"""
+Tests for the router's no-LLM keyword shortcut.
+
+Run with: python -m pytest test_router_keywords.py
+"""
+
+from graph_builder import _route_keywords, _single_route_for
+
+ROUTES = [
+    {"name": "Sales Agent", "condition": "Revenue, margins, product performance"},
+    {"name": "Inventory Agent", "condition": "Stock levels, waste, supply chain"},
+]
+
+
+def test_names_one_route():
+    assert _single_route_for("show me sales by region", _route_keywords(ROUTES)) == "Sales Agent"
+
+
+def test_diagnostic_question_goes_to_llm():
+    # The classifier prompt lists "why" questions as ALL - the shortcut must not pick one route
+    assert _single_route_for("Why did sales drop?", _route_keywords(ROUTES)) is None
+
+
+def test_shared_route_word_is_not_a_keyword():
+    keywords = _route_keywords(ROUTES)
+    assert "agent" not in keywords
+    assert _single_route_for("which agent should handle this", keywords) is None
+
+
+def test_whole_words_only():
+    assert _single_route_for("list our wholesalers", _route_keywords(ROUTES)) is None
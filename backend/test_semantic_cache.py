@@ -0,0 +1,126 @@
+"""
+Tests for the semantic LLM response cache.
+
+Run with: python -m pytest test_semantic_cache.py
+"""
+
+import copy
+import json
+
+from semantic_cache import SemanticCache, embed_text, schema_signature
+
+SCOPE = "mistral-large2|snowflake|SNOWFLOW_DEV.DEMO"
+
+
+def _schema(name: str, tables: list, measures: list) -> dict:
+    """Interchange JSON with the per-column/measure flags the extractors emit (repeated keys)"""
+    return {
+        "version": "1.0",
+        "metadata": {"name": name, "source_platform": "powerbi"},
+        "tables": [
+            {
+                "name": table_name,
+                "description": description,
+                "table_type": "fact",
+                "columns": [
+                    {"name": col, "data_type": data_type, "description": col_description,
+                     "is_nullable": False, "is_primary_key": False, "is_foreign_key": False,
+                     "is_hidden": False, "format_string": None, "sort_by_column": None}
+                    for col, data_type, col_description in columns
+                ],
+            }
+            for table_name, description, columns in tables
+        ],
+        "measures": [
+            {"name": measure, "description": description, "expression": expression,
+             "return_type": "DECIMAL", "format_string": "#,0.00", "is_hidden": False, "display_folder": None}
+            for measure, description, expression in measures
+        ],
+    }
+
+
+SALES_SCHEMA = _schema(
+    "Retail Sales",
+    [
+        ("fact_sales", "Sales transactions at the line item level", [
+            ("revenue", "DECIMAL(18,2)", "Total sale amount"),
+            ("quantity", "INTEGER", "Units sold"),
+            ("store_id", "VARCHAR", "Store identifier"),
+        ]),
+        ("dim_store", "Store attributes", [
+            ("store_id", "VARCHAR", "Store identifier"),
+            ("region", "VARCHAR", "Sales region"),
+        ]),
+    ],
+    [
+        ("Total Revenue", "Sum of revenue", "SUM(fact_sales[revenue])"),
+        ("Units", "Sum of quantity", "SUM(fact_sales[quantity])"),
+    ],
+)
+
+# Same layout, every table, column and measure renamed
+HR_SCHEMA = _schema(
+    "People Analytics",
+    [
+        ("fact_payroll", "Payroll entries at the payslip level", [
+            ("salary", "DECIMAL(18,2)", "Gross salary"),
+            ("hours", "INTEGER", "Hours worked"),
+            ("employee_id", "VARCHAR", "Employee identifier"),
+        ]),
+        ("dim_employee", "Employee attributes", [
+            ("employee_id", "VARCHAR", "Employee identifier"),
+            ("department", "VARCHAR", "Department"),
+        ]),
+    ],
+    [
+        ("Total Salary", "Sum of salary", "SUM(fact_payroll[salary])"),
+        ("Hours", "Sum of hours", "SUM(fact_payroll[hours])"),
+    ],
+)
+
+
+def _text(schema: dict) -> str:
+    return json.dumps(schema, indent=2)
+
+
+def _cache(tmp_path) -> SemanticCache:
+    return SemanticCache(path=str(tmp_path / "cache.sqlite3"))
+
+
+def test_exact_hit(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put(SCOPE, _text(SALES_SCHEMA), "sales: yaml", schema_signature(SALES_SCHEMA))
+    assert cache.get(SCOPE, _text(SALES_SCHEMA), schema_signature(SALES_SCHEMA)) == "sales: yaml"
+
+
+def test_renamed_schema_misses(tmp_path):
+    cache = _cache(tmp_path)
+    # The bag-of-words embeddings alone can't tell these apart
+    assert float(embed_text(_text(SALES_SCHEMA)) @ embed_text(_text(HR_SCHEMA))) >= cache.threshold
+    cache.put(SCOPE, _text(SALES_SCHEMA), "sales: yaml", schema_signature(SALES_SCHEMA))
+    assert cache.get(SCOPE, _text(HR_SCHEMA), schema_signature(HR_SCHEMA)) is None
+
+
+def test_changed_measure_expression_misses(tmp_path):
+    edited = copy.deepcopy(SALES_SCHEMA)
+    edited["measures"][0]["expression"] = "AVERAGE(fact_sales[revenue])"
+    cache = _cache(tmp_path)
+    cache.put(SCOPE, _text(SALES_SCHEMA), "sales: yaml", schema_signature(SALES_SCHEMA))
+    assert cache.get(SCOPE, _text(edited), schema_signature(edited)) is None
+
+
+def test_description_edit_is_a_near_hit(tmp_path):
+    edited = copy.deepcopy(SALES_SCHEMA)
+    edited["tables"][0]["description"] = "Sales transactions, one row per line item"
+    cache = _cache(tmp_path)
+    cache.put(SCOPE, _text(SALES_SCHEMA), "sales: yaml", schema_signature(SALES_SCHEMA))
+    assert cache.get(SCOPE, _text(edited), schema_signature(edited)) == "sales: yaml"
+
+
+def test_no_signature_is_exact_only(tmp_path):
+    edited = copy.deepcopy(SALES_SCHEMA)
+    edited["tables"][0]["description"] = "Sales transactions, one row per line item"
+    cache = _cache(tmp_path)
+    cache.put(SCOPE, _text(SALES_SCHEMA), "sales: yaml")
+    assert cache.get(SCOPE, _text(edited)) is None
+    assert schema_signature({"raw_schema": "CREATE TABLE t (a INT)"}) is None
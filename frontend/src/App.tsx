@@ -3137,13 +3137,17 @@ function Flow() {
                 // STEP 1: Mark this node as ACTIVE (glowing/pulsing)
                 setActiveNodes(new Set([eventData.node_id]));
                 
-                // STEP 2: Wait for visual effect (synced with backend's 500ms delay)
-                await new Promise(resolve => setTimeout(resolve, 400));
+                // STEP 2: Hold the highlight for the backend's pacing hint (backend no longer sleeps)
+                await new Promise(resolve => setTimeout(resolve, eventData.visual_min_ms ?? 400));
                 
                 // STEP 3: Move to COMPLETED state (green checkmark)
                 setActiveNodes(new Set()); // Clear active
                 setCompletedNodes(prev => new Set([...prev, eventData.node_id]));
               }
+            } else if (eventData.type === 'node_progress') {
+              // Partial result from a long-running node - surface it in the phase label
+              const node = nodes.find(n => n.id === eventData.node_id);
+              setExecutionPhase(`${node?.data?.label || eventData.node_id}: ${eventData.agent} ready`);
             } else if (eventData.type === 'complete') {
               // Update fileOutput nodes with generated content using store
               const results = eventData.results || {};